@@ -0,0 +1,238 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from CalibBoardStitcher.Detector import QrDetector
+from CalibBoardStitcher.Stitcher import calibration, stitch
+from CalibBoardStitcher.Utils import logging_config
+
+class BatchJob:
+    CALIBRATION = "calibration"
+    STITCH = "stitch"
+
+    # 各类任务允许的参数及其中需要按清单所在目录解析的路径参数
+    _PARAMS = {
+        CALIBRATION: {
+            "img_dir": True, "export_json": True, "export_img": True, "cache_dir": True,
+            "cache_max_bytes": False, "undistort": False, "remap_cache_dir": True,
+            "lattice_fallback": False, "track": False, "tiled_detection": False,
+            "detector_backend": False
+        },
+        STITCH: {
+            "img_dir": True, "json_file": True, "export_img": True, "remap_cache_dir": True, "scale": False,
+            "skip_redundant": False, "memory_budget": False, "canvas_dir": True,
+            "gain_compensation": False, "thumb_dir": True, "quality_gate": False
+        }
+    }
+
+    def __init__(self, job_id: str, job_type: str, params: dict):
+        """
+        批处理任务
+
+        :param job_id: 任务id，在同一清单内唯一
+        :param job_type: 任务类型，`BatchJob.CALIBRATION` 或 `BatchJob.STITCH`
+        :param params: 任务参数，与 `calibration()` 或 `stitch()` 的参数一致
+        """
+        if job_type not in BatchJob._PARAMS:
+            raise ValueError("unknown job type: {}".format(job_type))
+        unknown = set(params.keys()) - set(BatchJob._PARAMS[job_type].keys())
+        if len(unknown) > 0:
+            raise ValueError("unknown params {} for job: {}".format(sorted(unknown), job_id))
+
+        self.job_id = job_id
+        self.job_type = job_type
+        self.params = params
+
+    @property
+    def key(self) -> str:
+        """
+        任务内容哈希，任务参数变化后断点记录失效
+        """
+        data = json.dumps({"type": self.job_type, "params": self.params}, sort_keys=True)
+        return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+    @property
+    def outputs(self) -> list[str]:
+        return [self.params[name] for name in ("export_json", "export_img") if len(self.params.get(name, "")) > 0]
+
+    @property
+    def inputs(self) -> list[str]:
+        return [self.params[name] for name in ("json_file",) if len(self.params.get(name, "")) > 0]
+
+    def run(self) -> float:
+        """
+        执行任务
+
+        :return: 任务耗时，单位秒
+        """
+        start = time.perf_counter()
+        if self.job_type == BatchJob.CALIBRATION:
+            result = calibration(self.params["img_dir"], **{k: v for k, v in self.params.items() if k != "img_dir"})
+            if result is None:
+                raise RuntimeError("QR code not found in: {}".format(self.params["img_dir"]))
+        else:
+            stitch(**self.params)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def from_dict(data: dict, index: int, base_dir: str):
+        if not isinstance(data, dict):
+            raise ValueError("job #{} in manifest is not an object".format(index))
+        params = dict(data)
+        if "type" not in params:
+            raise ValueError("job #{} ({}) in manifest has no type".format(index, params.get("id", "no id")))
+        job_type = params.pop("type")
+        job_id = str(params.pop("id", "{}-{}".format(index, job_type)))
+        for name, is_path in BatchJob._PARAMS.get(job_type, {}).items():
+            if is_path and name in params and not isinstance(params[name], str):
+                raise ValueError("param {} of job {} must be a path string".format(name, job_id))
+            if is_path and name in params and len(params[name]) > 0:
+                params[name] = os.path.normpath(os.path.join(base_dir, params[name]))
+        return BatchJob(job_id, job_type, params)
+
+
+def load_manifest(file_path: str) -> list[BatchJob]:
+    """
+    加载任务清单
+
+    :param file_path: json格式的任务清单，相对路径按清单所在目录解析
+    :return: list[BatchJob]
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(file_path))
+    jobs = [BatchJob.from_dict(job, i, base_dir) for i, job in enumerate(data["jobs"])]
+    ids = [job.job_id for job in jobs]
+    if len(set(ids)) != len(ids):
+        raise ValueError("duplicate job id in manifest: {}".format(file_path))
+    return jobs
+
+
+def _init_worker():
+    # 每个工作进程启动时预加载模型，之后的任务复用
+    logging_config()
+    QrDetector().warm_up()
+
+
+def _run_job(job: BatchJob) -> float:
+    return job.run()
+
+
+class BatchRunner:
+    def __init__(self, jobs: list[BatchJob], progress_file: str, max_workers: int = None):
+        """
+        批处理执行器，在共享的进程池中执行任务，并支持断点续跑
+
+        :param jobs: 任务列表
+        :param progress_file: 进度记录文件，已完成的任务再次执行时将被跳过
+        :param max_workers: 进程数，为空时使用CPU核心数
+        """
+        self._jobs = jobs
+        self._progress_file = progress_file
+        self._max_workers = max_workers or os.cpu_count() or 1
+
+    def _load_finished(self) -> set[str]:
+        finished = set()
+        if not os.path.exists(self._progress_file):
+            return finished
+        with open(self._progress_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时可能残留不完整的行
+                    continue
+                if record.get("status") == "done":
+                    finished.add(record["key"])
+        return finished
+
+    def _record(self, job: BatchJob, status: str, **extra):
+        record = {"id": job.job_id, "key": job.key, "status": status, "time": time.time()}
+        record.update(extra)
+        with open(self._progress_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _dependencies(self) -> dict[str, set[str]]:
+        # 拼接任务依赖于同一清单中导出其json_file的标定任务
+        producers = {}
+        for job in self._jobs:
+            for output in job.outputs:
+                producers[output] = job.job_id
+        return {
+            job.job_id: {producers[path] for path in job.inputs if path in producers and producers[path] != job.job_id}
+            for job in self._jobs
+        }
+
+    def run(self) -> dict[str, str]:
+        """
+        执行全部任务
+
+        :return: 任务id到任务状态的映射，状态为 "done", "skipped" 或 "failed"
+        """
+        finished = self._load_finished()
+        dependencies = self._dependencies()
+        # 已完成且输出仍存在的任务可跳过；若其依赖的任务需要重新执行，则该任务也需重新执行
+        skippable = {
+            job.job_id for job in self._jobs
+            if job.key in finished and all(os.path.exists(path) for path in job.outputs)
+        }
+        changed = True
+        while changed:
+            changed = False
+            for job_id in list(skippable):
+                if not dependencies[job_id].issubset(skippable):
+                    skippable.remove(job_id)
+                    changed = True
+
+        status = {}
+        pending = []
+        for job in self._jobs:
+            if job.job_id in skippable:
+                status[job.job_id] = "skipped"
+                logging.info("job {} already finished, skipped.".format(job.job_id))
+            else:
+                pending.append(job)
+
+        running = {}
+        with ProcessPoolExecutor(max_workers=self._max_workers, initializer=_init_worker) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                # 提交依赖已满足的任务
+                for job in list(pending):
+                    deps = dependencies[job.job_id]
+                    if any(status.get(dep) == "failed" for dep in deps):
+                        pending.remove(job)
+                        status[job.job_id] = "failed"
+                        self._record(job, "failed", error="dependency failed")
+                        logging.error("job {} failed, msg: dependency failed.".format(job.job_id))
+                    elif all(status.get(dep) in ("done", "skipped") for dep in deps):
+                        pending.remove(job)
+                        running[executor.submit(_run_job, job)] = job
+
+                if len(running) == 0:
+                    # 剩余任务的依赖无法满足(如循环依赖)
+                    for job in pending:
+                        status[job.job_id] = "failed"
+                        self._record(job, "failed", error="unresolvable dependency")
+                        logging.error("job {} failed, msg: unresolvable dependency.".format(job.job_id))
+                    break
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        elapsed = future.result()
+                        status[job.job_id] = "done"
+                        self._record(job, "done", elapsed=elapsed)
+                        logging.info("job {} done, spend: {}".format(job.job_id, elapsed))
+                    except Exception as e:
+                        status[job.job_id] = "failed"
+                        self._record(job, "failed", error=str(e))
+                        logging.error("job {} failed, msg: {}".format(job.job_id, str(e)))
+
+        return status
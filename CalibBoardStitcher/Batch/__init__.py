@@ -0,0 +1 @@
+from .BatchRunner import BatchJob, BatchRunner, load_manifest
\ No newline at end of file
@@ -3,7 +3,8 @@ import math
 
 import numpy as np
 
-from CalibBoardStitcher.Elements import CalibBoardObj
+from CalibBoardStitcher.Elements import CalibBoardObj, QrPayload
+from CalibBoardStitcher.Lens import LensModel
 
 def safe_cos(img_vec, cb_vec):
     img_norm = np.linalg.norm(img_vec)
@@ -35,6 +36,8 @@ class CalibResult:
     def __init__(self, board_obj: CalibBoardObj):
         self._board_obj = board_obj
         self._matched_imgs = {}
+        self._img_sizes = {}
+        self._lens_model = None
 
     def add_matched_point(self, matched_point: MatchedPoint):
         """
@@ -46,6 +49,40 @@ class CalibResult:
             self._matched_imgs[matched_point.img_id] = []
         self._matched_imgs[matched_point.img_id].append(matched_point)
 
+    def set_img_size(self, img_id: str, img_size: tuple[int, int]):
+        """
+        记录子图尺寸
+
+        :param img_id: 图像id
+        :param img_size: 图像尺寸, (w, h)
+        """
+        self._img_sizes[img_id] = (int(img_size[0]), int(img_size[1]))
+
+    def get_img_size(self, img_id: str) -> tuple[int, int]:
+        """
+        获取子图尺寸
+
+        :param img_id: 要查询的img_id
+        :return: 图像尺寸(w, h)，未记录时为None
+        """
+        return self._img_sizes.get(img_id, None)
+
+    def set_lens_model(self, lens_model: LensModel):
+        """
+        设置相机镜头模型
+
+        :param lens_model: 镜头模型，为None时表示不考虑畸变
+        """
+        self._lens_model = lens_model
+
+    def get_lens_model(self) -> LensModel:
+        """
+        获取相机镜头模型
+
+        :return: LensModel，未标定畸变时为None
+        """
+        return self._lens_model
+
     def get_calib_board_obj(self) -> CalibBoardObj:
         """
         获取标定板配置对象
@@ -91,7 +128,8 @@ class CalibResult:
             row_count=data["row_count"],
             col_count=data["col_count"],
             qr_pixel_size=data["qr_pixel_size"],
-            qr_border=data["qr_border"]
+            qr_border=data["qr_border"],
+            payload_format=data.get("payload_format", QrPayload.JSON)
         )
 
         result = CalibResult(board_obj)
@@ -106,6 +144,12 @@ class CalibResult:
                     )
                 )
 
+        for img_id, img_size in data.get("img_sizes", {}).items():
+            result.set_img_size(img_id, img_size)
+
+        if "lens_model" in data:
+            result.set_lens_model(LensModel.from_dict(data["lens_model"]))
+
         return result
 
     def save(self, file_path: str):
@@ -119,6 +163,7 @@ class CalibResult:
             "col_count": self._board_obj.col_count,
             "qr_pixel_size": self._board_obj.qr_pixel_size,
             "qr_border": self._board_obj.qr_border,
+            "payload_format": self._board_obj.payload_format,
             "matched_images": {}
         }
 
@@ -127,6 +172,12 @@ class CalibResult:
             for matched_point in self._matched_imgs[img_id]:
                 result["matched_images"][img_id].append(matched_point.dict())
 
+        if len(self._img_sizes) > 0:
+            result["img_sizes"] = {img_id: list(img_size) for img_id, img_size in self._img_sizes.items()}
+
+        if self._lens_model is not None:
+            result["lens_model"] = self._lens_model.dict()
+
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(result, f, ensure_ascii=False, indent=4)
 
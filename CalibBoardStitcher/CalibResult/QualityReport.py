@@ -0,0 +1,118 @@
+import math
+
+import cv2
+import numpy as np
+
+from .CalibResult import CalibResult
+
+class QualityReport:
+    def __init__(self, calib_result: CalibResult, img_ids: list[str] = None, ransac_threshold: float = 3.0):
+        """
+        各子图标定质量报告，只由标定结果计算，不读取子图
+        对每张子图拟合标定板到子图的仿射变换，统计:
+        - rms: 全部匹配点的重投影误差均方根，单位为子图像素
+        - inlier_ratio: RANSAC内点比例
+        - scale / rotation: 子图相对于标定板的缩放倍数与旋转角度(度)
+        - scale_dev / rotation_dev: 缩放倍数相对于全部子图中位数的相对偏差，旋转角度相对于全部子图平均方向的偏差(度)
+
+        :param calib_result: 标定结果
+        :param img_ids: 参与统计的子图id，为空时使用标定结果中的全部子图
+        :param ransac_threshold: RANSAC内点的重投影误差阈值，单位为子图像素
+        """
+        if img_ids is None:
+            img_ids = calib_result.get_matched_img_id()
+        self._img_ids = list(img_ids)
+        n = len(self._img_ids)
+        lens_model = calib_result.get_lens_model()
+
+        # 1. 将全部子图的匹配点拼接为一个数组，按子图序号分组
+        counts = np.array([len(calib_result.get_matched_points(img_id)) for img_id in self._img_ids], dtype=np.int64)
+        index = np.repeat(np.arange(n), counts)
+        points = [point for img_id in self._img_ids for point in calib_result.get_matched_points(img_id)]
+        cb_points = np.array([point.cb_point for point in points], dtype=np.float64).reshape(-1, 2)
+        img_points = np.array([point.img_point for point in points], dtype=np.float64).reshape(-1, 2)
+        if lens_model is not None and len(img_points) > 0:
+            # 与拼接一致，在无畸变图像坐标中拟合
+            img_points = lens_model.undistort_points(img_points)
+
+        # 2. 逐子图拟合仿射变换，拟合失败(匹配点少于3个)的子图变换为nan
+        ms = np.full((n, 2, 3), np.nan)
+        inliers = np.zeros(len(points), dtype=np.float64)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        for i in range(n):
+            begin, end = offsets[i], offsets[i + 1]
+            if end - begin < 3:
+                continue
+            m, mask = cv2.estimateAffine2D(
+                cb_points[begin:end], img_points[begin:end], ransacReprojThreshold=ransac_threshold
+            )
+            if m is not None:
+                ms[i] = m
+                inliers[begin:end] = mask.ravel()
+
+        # 3. 向量化统计各子图指标
+        safe_counts = np.maximum(counts, 1)
+        projected = np.einsum("nij,nj->ni", ms[index, :, 0:2], cb_points) + ms[index, :, 2]
+        errors = np.sum((projected - img_points) ** 2, axis=1)
+        self._rms = np.sqrt(np.bincount(index, weights=errors, minlength=n) / safe_counts)
+        self._inlier_ratio = np.bincount(index, weights=inliers, minlength=n) / safe_counts
+        with np.errstate(invalid="ignore"):
+            # 无法拟合的子图变换为nan，其行列式为nan
+            self._scale = np.sqrt(np.abs(np.linalg.det(ms[:, :, 0:2])))
+        self._rotation = np.degrees(np.arctan2(ms[:, 1, 0], ms[:, 0, 0]))
+
+        valid = np.isfinite(self._scale)
+        if np.any(valid):
+            ref_scale = np.median(self._scale[valid])
+            ref_rotation = math.degrees(np.angle(np.sum(np.exp(1j * np.radians(self._rotation[valid])))))
+        else:
+            ref_scale, ref_rotation = np.nan, np.nan
+        self._scale_dev = np.abs(self._scale / ref_scale - 1)
+        self._rotation_dev = np.abs((self._rotation - ref_rotation + 180) % 360 - 180)
+
+    @property
+    def img_ids(self) -> list[str]:
+        return self._img_ids
+
+    @property
+    def rms(self) -> np.ndarray:
+        return self._rms
+
+    @property
+    def inlier_ratio(self) -> np.ndarray:
+        return self._inlier_ratio
+
+    @property
+    def scale(self) -> np.ndarray:
+        return self._scale
+
+    @property
+    def rotation(self) -> np.ndarray:
+        return self._rotation
+
+    @property
+    def scale_dev(self) -> np.ndarray:
+        return self._scale_dev
+
+    @property
+    def rotation_dev(self) -> np.ndarray:
+        return self._rotation_dev
+
+    def to_dict(self) -> dict[str, dict]:
+        """
+        :return: 子图id到各项指标的映射，无法拟合的子图指标为None
+        """
+        def value(x: float):
+            return float(x) if np.isfinite(x) else None
+
+        return {
+            img_id: {
+                "rms": value(self._rms[i]),
+                "inlier_ratio": value(self._inlier_ratio[i]),
+                "scale": value(self._scale[i]),
+                "rotation": value(self._rotation[i]),
+                "scale_dev": value(self._scale_dev[i]),
+                "rotation_dev": value(self._rotation_dev[i])
+            }
+            for i, img_id in enumerate(self._img_ids)
+        }
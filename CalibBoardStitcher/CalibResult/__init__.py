@@ -1 +1,2 @@
-from .CalibResult import MatchedPoint, CalibResult
\ No newline at end of file
+from .CalibResult import MatchedPoint, CalibResult
+from .QualityReport import QualityReport
\ No newline at end of file
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from CalibBoardStitcher.Elements import Box
+
+class DetectionCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 64 * 1024 * 1024):
+        """
+        二维码检测结果的磁盘缓存，以图像文件内容哈希和检测器签名为键
+
+        :param cache_dir: 缓存文件夹
+        :param max_bytes: 缓存内容总大小上限，超出时按最近最少使用淘汰
+        :note: 基于sqlite实现，可在多线程及多进程间共享同一缓存文件夹
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db_path = os.path.join(cache_dir, "detection_cache.sqlite3")
+        self._max_bytes = max_bytes
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite连接不可跨线程使用，每个线程持有独立连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(file_path: str, signature: str) -> str:
+        """
+        计算缓存键
+
+        :param file_path: 图像文件路径
+        :param signature: 检测器签名，见 `QrDetector.signature`
+        :return: str
+        """
+        # 分块读取，与 hashlib.file_digest 结果一致，且不依赖Python 3.11
+        digest = hashlib.blake2b()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digest.update(signature.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> list[tuple[Box, str]]:
+        """
+        查询缓存
+
+        :param key: 缓存键
+        :return: 同 `QrDetector.detect_payloads`，未命中时为None
+        """
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE entries SET atime = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            logging.warning("read detection cache failed, msg: " + str(e))
+            return None
+
+        return [
+            (Box(*item["vertex"]), item["payload"]) for item in json.loads(row[0])
+        ]
+
+    def put(self, key: str, payloads: list[tuple[Box, str]]):
+        """
+        写入缓存，并在超出容量时淘汰最久未使用的条目
+
+        :param key: 缓存键
+        :param payloads: 同 `QrDetector.detect_payloads`
+        """
+        value = json.dumps([
+            {"vertex": [box.lt, box.rt, box.rb, box.lb], "payload": payload} for box, payload in payloads
+        ])
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, atime) VALUES (?, ?, ?, ?)",
+                    (key, value, len(value), time.time())
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self._max_bytes:
+                    self._evict(conn, total)
+        except sqlite3.Error as e:
+            logging.warning("write detection cache failed, msg: " + str(e))
+
+    def _evict(self, conn: sqlite3.Connection, total: int):
+        # 淘汰至容量上限的90%，避免每次写入都触发淘汰
+        target = self._max_bytes * 0.9
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY atime ASC"):
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        logging.debug("detection cache evicted {} entries.".format(len(evicted)))
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries")
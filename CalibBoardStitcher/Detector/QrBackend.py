@@ -0,0 +1,219 @@
+import math
+import threading
+from importlib.resources import files
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher.Elements import CalibBoardObj, QrPayload
+
+class QrBackend:
+    WECHAT = "wechat"
+    WECHAT_NO_SR = "wechat-nosr"
+    CLASSIC = "classic"
+    AUTO = "auto"
+
+    # 模型在每个线程中只加载一次，并由该线程中的所有检测后端共享
+    _thread_local = threading.local()
+
+    @property
+    def name(self) -> str:
+        raise NotImplementedError
+
+    def warm_up(self):
+        """
+        在当前线程中预先加载模型
+        """
+        pass
+
+    def detect(self, img: cv2.typing.MatLike) -> list[tuple[np.ndarray, str]]:
+        """
+        检测并解码图像中的二维码
+
+        :param img: 待检图像
+        :return: 由 (顶点, 二维码内容) 构成的列表，顶点为4x2数组，顺序为二维码自身的左上、右上、右下、左下
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def create(name: str):
+        """
+        按名称创建检测后端
+
+        :param name: `WECHAT`, `WECHAT_NO_SR`, `CLASSIC` 或 `AUTO`
+        :return: QrBackend
+        """
+        if name == QrBackend.WECHAT:
+            return WeChatBackend(super_resolution=True)
+        if name == QrBackend.WECHAT_NO_SR:
+            return WeChatBackend(super_resolution=False)
+        if name == QrBackend.CLASSIC:
+            return ClassicBackend()
+        if name == QrBackend.AUTO:
+            return AutoBackend()
+        raise ValueError("unknown detector backend: {}".format(name))
+
+
+class WeChatBackend(QrBackend):
+    _WEIGHTS = ("detect.prototxt", "detect.caffemodel", "sr.prototxt", "sr.caffemodel")
+
+    def __init__(self, super_resolution: bool = True):
+        """
+        基于CNN的WeChatQRCode检测器，检出率高，CPU耗时较大
+
+        :param super_resolution: 是否对小二维码使用超分辨率模型
+        """
+        self._super_resolution = super_resolution
+
+    @property
+    def name(self) -> str:
+        return QrBackend.WECHAT if self._super_resolution else QrBackend.WECHAT_NO_SR
+
+    @property
+    def _qr_coder(self):
+        attr = "wechat_sr" if self._super_resolution else "wechat"
+        qr_coder = getattr(QrBackend._thread_local, attr, None)
+        if qr_coder is None:
+            paths = [str(files("CalibBoardStitcher.weights").joinpath(name)) for name in WeChatBackend._WEIGHTS]
+            if not self._super_resolution:
+                paths = paths[0:2] + ["", ""]
+            qr_coder = cv2.wechat_qrcode_WeChatQRCode(*paths)
+            setattr(QrBackend._thread_local, attr, qr_coder)
+        return qr_coder
+
+    def warm_up(self):
+        _ = self._qr_coder
+
+    def detect(self, img: cv2.typing.MatLike) -> list[tuple[np.ndarray, str]]:
+        content, points = self._qr_coder.detectAndDecode(img)
+        return [(np.asarray(points[i], dtype=np.float64), content[i]) for i in range(len(content)) if len(content[i]) > 0]
+
+
+class ClassicBackend(QrBackend):
+    def __init__(self):
+        """
+        基于传统图像处理的 `cv2.QRCodeDetector`，一次检测多个二维码，适用于二维码数量较少、清晰且较大的子图；二维码数量多时耗时迅速增加
+        """
+
+    @property
+    def name(self) -> str:
+        return QrBackend.CLASSIC
+
+    @property
+    def _qr_coder(self):
+        qr_coder = getattr(QrBackend._thread_local, "classic", None)
+        if qr_coder is None:
+            qr_coder = cv2.QRCodeDetector()
+            QrBackend._thread_local.classic = qr_coder
+        return qr_coder
+
+    def detect_all(self, img: cv2.typing.MatLike) -> list[tuple[np.ndarray, str]]:
+        """
+        同 `detect`，但包括检测到而未能解码的二维码，其内容为空字符串
+        """
+        try:
+            ok, content, points, _ = self._qr_coder.detectAndDecodeMulti(img)
+        except cv2.error:
+            return []
+        if not ok or points is None:
+            return []
+        return [(np.asarray(points[i], dtype=np.float64), content[i]) for i in range(len(content))]
+
+    def detect(self, img: cv2.typing.MatLike) -> list[tuple[np.ndarray, str]]:
+        return [(points, content) for points, content in self.detect_all(img) if len(content) > 0]
+
+
+class AutoBackend(QrBackend):
+    def __init__(self, fallback: QrBackend = None, max_fallback_area: float = 0.5):
+        """
+        先使用 `ClassicBackend` 检测，仅在其失败的区域使用CNN检测器:
+        - 未解码出任何二维码时，对整张图像使用CNN检测器
+        - 否则由已解码的二维码推算标定板在图像中的位置，对图像内应有而未解码的二维码区域使用CNN检测器
+
+        :param fallback: 失败区域使用的检测器，为空时使用带超分辨率的 `WeChatBackend`
+        :param max_fallback_area: 失败区域的总面积超过图像面积的该比例时，直接对整张图像使用CNN检测器
+        """
+        self._fast = ClassicBackend()
+        self._fallback = fallback or WeChatBackend(super_resolution=True)
+        self._max_fallback_area = max_fallback_area
+
+    @property
+    def name(self) -> str:
+        return "{}+{}".format(QrBackend.AUTO, self._fallback.name)
+
+    def warm_up(self):
+        self._fast.warm_up()
+        self._fallback.warm_up()
+
+    @staticmethod
+    def _missing_regions(
+        img_size: tuple[int, int], found: list[tuple[np.ndarray, dict]], undecoded: list[np.ndarray]
+    ) -> list[tuple[int, int, int, int]]:
+        # 由已解码二维码的顶点拟合标定板到图像的仿射变换，推算其余二维码的位置
+        w, h = img_size
+        board = CalibBoardObj.from_payload_data(found[0][1])
+        src = []
+        dst = []
+        for points, data in found:
+            cb_box = board.calc_qr_box(data["rid"], data["cid"])
+            src += [cb_box.lt, cb_box.rt, cb_box.rb, cb_box.lb]
+            dst += points.tolist()
+        m, _ = cv2.estimateAffine2D(np.array(src, dtype=np.float64), np.array(dst, dtype=np.float64))
+        if m is None:
+            return [(0, 0, w, h)]
+
+        # 预测位置的误差及二维码的静区均包含在外扩的区域内
+        pad = board.qr_border * board.qr_pixel_size * math.sqrt(abs(np.linalg.det(m[:, 0:2])))
+        found_ids = {(data["rid"], data["cid"]) for _, data in found}
+        quads = list(undecoded)
+        for rid in range(board.row_count):
+            for cid in range(board.col_count):
+                # 标定板为黑白格交错，二维码只位于行列号之和为偶数的格中
+                if (rid + cid) % 2 == 1 or (rid, cid) in found_ids:
+                    continue
+                cb_box = board.calc_qr_box(rid, cid)
+                quad = np.array([cb_box.lt, cb_box.rt, cb_box.rb, cb_box.lb], dtype=np.float64) @ m[:, 0:2].T + m[:, 2]
+                # 被图像边缘截去一部分的二维码仍可能被CNN检测器解码，与图像相交即需处理
+                if quad[:, 0].max() >= 0 and quad[:, 1].max() >= 0 and quad[:, 0].min() < w and quad[:, 1].min() < h:
+                    quads.append(quad)
+
+        regions = []
+        for quad in quads:
+            l = max(math.floor(quad[:, 0].min() - pad), 0)
+            t = max(math.floor(quad[:, 1].min() - pad), 0)
+            r = min(math.ceil(quad[:, 0].max() + pad), w)
+            b = min(math.ceil(quad[:, 1].max() + pad), h)
+            if r > l and b > t:
+                regions.append((l, t, r - l, b - t))
+        return regions
+
+    def detect(self, img: cv2.typing.MatLike) -> list[tuple[np.ndarray, str]]:
+        h, w = img.shape[0:2]
+        results = {}
+        found = []
+        undecoded = []
+        for points, content in self._fast.detect_all(img):
+            if len(content) == 0:
+                undecoded.append(points)
+                continue
+            try:
+                data = QrPayload.decode(content)
+            except Exception:
+                # 非标定板二维码，保留但不参与位置推算
+                results[content] = points
+                continue
+            results[content] = points
+            found.append((points, data))
+
+        if len(found) == 0:
+            regions = [(0, 0, w, h)]
+        else:
+            regions = AutoBackend._missing_regions((w, h), found, undecoded)
+            if sum(rw * rh for _, _, rw, rh in regions) > self._max_fallback_area * w * h:
+                regions = [(0, 0, w, h)]
+
+        for x, y, rw, rh in regions:
+            for points, content in self._fallback.detect(img[y:y + rh, x:x + rw]):
+                if content not in results:
+                    results[content] = points + [x, y]
+        return [(points, content) for content, points in results.items()]
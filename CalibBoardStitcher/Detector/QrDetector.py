@@ -1,17 +1,237 @@
+import hashlib
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
+import numpy as np
 
-from CalibBoardStitcher.Elements import QrTarget, Box
+from CalibBoardStitcher.Elements import QrTarget, Box, CalibBoardObj, QrPayload
 from importlib.resources import files
+from .QrBackend import QrBackend, WeChatBackend
 
 class QrDetector:
-    def __init__(self):
-        self._qr_coder = cv2.wechat_qrcode_WeChatQRCode(
-            str(files("CalibBoardStitcher.weights").joinpath("detect.prototxt")),
-            str(files("CalibBoardStitcher.weights").joinpath("detect.caffemodel")),
-            str(files("CalibBoardStitcher.weights").joinpath("sr.prototxt")),
-            str(files("CalibBoardStitcher.weights").joinpath("sr.caffemodel"))
+    # 检测算法版本，检测结果发生变化时需要递增，用于使检测缓存失效
+    VERSION = 3
+    _weights_digest = None
+    # 分块检测的线程池按(检测后端, 线程数)共享，池中线程的模型常驻
+    _tile_executors = {}
+    _tile_executors_lock = threading.Lock()
+    # 标定板参数到二维码模块数的映射，避免重复计算二维码版本
+    _module_counts = {}
+
+    def __init__(self,
+        tiled: bool = False, qr_px: int = 0, tile_cells: int = 4, max_workers: int = None,
+        backend: str | QrBackend = QrBackend.WECHAT
+    ):
+        """
+        二维码检测器，模型在首次检测时才加载
+        各检测后端的顶点均经过相同的亚像素校正，同一二维码的检测结果与所用后端无关；
+        定位角点距图像边缘不足一个校正窗口的二维码不校正，保留所用后端的原始顶点
+
+        :param tiled: 是否将图像切分为相互重叠的子块并在线程池中并行检测，适用于包含大量二维码的大图
+        :param qr_px: 分块检测时二维码(含白边)在图像中的预期边长像素数，为0时先在图像中心区域或缩小的图像上检测获得
+        :param tile_cells: 分块检测时每个子块的边长，单位为二维码(含白边)边长
+        :param max_workers: 分块检测的线程数，为空时使用CPU核心数
+        :param backend: 检测后端，`QrBackend` 或其名称，见 `QrBackend.create`；
+                        "classic"不使用CNN，"auto"先使用"classic"，仅对其失败的区域使用CNN
+        """
+        self._tiled = tiled
+        self._qr_px = qr_px
+        self._tile_cells = tile_cells
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._backend = QrBackend.create(backend) if isinstance(backend, str) else backend
+
+    @property
+    def backend(self) -> QrBackend:
+        return self._backend
+
+    def warm_up(self):
+        """
+        在当前线程中预先加载模型，避免首次检测时的加载耗时
+        """
+        self._backend.warm_up()
+
+    @property
+    def signature(self) -> str:
+        """
+        检测器签名，由检测算法版本、OpenCV版本、模型权重及检测参数共同决定
+
+        :return: str
+        """
+        if QrDetector._weights_digest is None:
+            digest = hashlib.blake2b(digest_size=16)
+            for name in WeChatBackend._WEIGHTS:
+                digest.update(files("CalibBoardStitcher.weights").joinpath(name).read_bytes())
+            QrDetector._weights_digest = digest.hexdigest()
+        # 分块检测的子块划分由二维码预期边长和子块边长决定，二者均影响检测结果
+        tiling = ":tiled:qr{}:cells{}".format(self._qr_px, self._tile_cells) if self._tiled else ""
+        return "{}:v{}:cv{}:{}:{}{}".format(
+            type(self).__name__, QrDetector.VERSION, cv2.__version__, QrDetector._weights_digest,
+            self._backend.name, tiling
         )
 
+    def detect_payloads(self, img:cv2.typing.MatLike) -> list[tuple[Box, str]]:
+        """
+        从图像中检测二维码，返回未解析的二维码内容
+
+        :param img: 待检图像，不考虑摄像头畸变
+        :return: 由 (二维码Box, 二维码内容) 构成的列表
+        """
+        if self._tiled:
+            payloads = self.detect_payloads_tiled(img, self._qr_px)
+        else:
+            payloads = self._detect_region(img)
+        return self.refine_payloads(img, payloads)
+
+    def _detect_region(self, img: cv2.typing.MatLike, x: int = 0, y: int = 0) -> list[tuple[Box, str]]:
+        # 检测图像(或子块)中的二维码，坐标加上子块在原图中的偏移
+        results = []
+
+        for points, content in self._backend.detect(img):
+            vertex = (points + [x, y]).tolist()
+            box = Box(vertex[0], vertex[1], vertex[2], vertex[3])
+            results.append((box, content))
+
+        return results
+
+    @staticmethod
+    def _module_count(data: dict) -> int:
+        key = (data["rc"], data["cc"], data["px_size"], data["qr_border"], data["format"])
+        count = QrDetector._module_counts.get(key)
+        if count is None:
+            board = CalibBoardObj.from_payload_data(data)
+            count = board.qr_size // board.qr_pixel_size
+            QrDetector._module_counts[key] = count
+        return count
+
+    @staticmethod
+    def refine_payloads(img: cv2.typing.MatLike, payloads: list[tuple[Box, str]]) -> list[tuple[Box, str]]:
+        """
+        校正二维码顶点，使不同检测后端的结果一致
+        左上、右上、左下顶点为定位图案的外角点，以亚像素角点精确定位；二维码较小，局部视为仿射，右下顶点由其余三点推算
+
+        :param img: 待检图像
+        :param payloads: `detect_payloads` 的返回值
+        :return: 校正后的 (二维码Box, 二维码内容) 列表；非标定板二维码及角点距图像边缘不足一个搜索窗口的二维码保持不变
+        """
+        if len(payloads) == 0:
+            return payloads
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        h, w = gray.shape[0:2]
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 40, 0.01)
+        results = []
+        for box, content in payloads:
+            try:
+                modules = QrDetector._module_count(QrPayload.decode(content))
+            except Exception:
+                results.append((box, content))
+                continue
+            lt, rt, lb, rb = [np.array(point, dtype=np.float64) for point in box.vertex]
+            side = (math.dist(lt, rt) + math.dist(rt, rb) + math.dist(rb, lb) + math.dist(lb, lt)) / 4
+            # 搜索窗口不超出定位图案最外层的一个模块
+            win = max(2, round(side / modules * 0.8))
+            # 窗口超出图像时cornerSubPix按边缘像素填充，角点会偏向图像边缘，此时保留检测器的原始顶点
+            corners = np.array([lt, rt, lb], dtype=np.float32)
+            if corners.min() < win or (corners[:, 0] > w - 1 - win).any() or (corners[:, 1] > h - 1 - win).any():
+                results.append((box, content))
+                continue
+            corners = cv2.cornerSubPix(gray, corners.reshape(-1, 1, 2), (win, win), (-1, -1), criteria).reshape(-1, 2)
+            lt, rt, lb = corners.astype(np.float64)
+            rb = rt + lb - lt
+            results.append((Box(lt.tolist(), rt.tolist(), rb.tolist(), lb.tolist()), content))
+        return results
+
+    def _tile_executor(self) -> ThreadPoolExecutor:
+        key = (self._backend.name, self._max_workers)
+        with QrDetector._tile_executors_lock:
+            executor = QrDetector._tile_executors.get(key)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=self._max_workers, initializer=self._backend.warm_up)
+                QrDetector._tile_executors[key] = executor
+            return executor
+
+    def _estimate_qr_px(self, img: cv2.typing.MatLike) -> float:
+        # 依次在原分辨率的中心区域(适合小二维码)和缩小一半的整图(适合大二维码)上检测，
+        # 由二维码本体边长和标定板参数推算含白边的边长
+        h, w = img.shape[0:2]
+        crop = img[h // 4:h - h // 4, w // 4:w - w // 4]
+        small = cv2.resize(img, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        for probe, ratio in ((crop, 1.0), (small, 0.5)):
+            for box, content in self._detect_region(probe):
+                try:
+                    board = CalibBoardObj.from_payload_data(QrPayload.decode(content))
+                except Exception:
+                    continue
+                vertex = box.vertex
+                side = sum(math.dist(vertex[i], vertex[j]) for i, j in ((0, 1), (1, 3), (3, 2), (2, 0))) / 4 / ratio
+                return side * board.grid_size / board.qr_size
+        return 0.0
+
+    def detect_payloads_tiled(self, img: cv2.typing.MatLike, qr_px: float = 0) -> list[tuple[Box, str]]:
+        """
+        将图像切分为相互重叠的子块，在线程池中并行检测，结果按二维码位置去重
+
+        :param img: 待检图像
+        :param qr_px: 二维码(含白边)在图像中的预期边长像素数，为0时先在图像中心区域或缩小的图像上检测获得
+        :return: 由 (二维码Box, 二维码内容) 构成的列表，坐标为原图坐标
+        """
+        h, w = img.shape[0:2]
+        if qr_px <= 0:
+            qr_px = self._estimate_qr_px(img)
+            if qr_px <= 0:
+                # 未检测到二维码，无法确定分块大小
+                return self._detect_region(img)
+
+        # 重叠宽度需容纳任意旋转角度下的整个二维码
+        overlap = math.ceil(qr_px * math.sqrt(2))
+        tile = max(math.ceil(qr_px * self._tile_cells), 2 * overlap)
+        step = tile - overlap
+        if w <= tile and h <= tile:
+            return self._detect_region(img)
+
+        tiles = []
+        for y in range(0, max(h - overlap, 1), step):
+            for x in range(0, max(w - overlap, 1), step):
+                tiles.append((x, y, min(tile, w - x), min(tile, h - y)))
+
+        executor = self._tile_executor()
+        futures = [
+            (rect, executor.submit(self._detect_region, img[rect[1]:rect[1] + rect[3], rect[0]:rect[0] + rect[2]], rect[0], rect[1]))
+            for rect in tiles
+        ]
+
+        # 同一二维码可能在多个子块中被检测到，保留距离子块边缘最远的结果
+        results = {}
+        for (x, y, tw, th), future in futures:
+            for box, content in future.result():
+                try:
+                    data = QrPayload.decode(content)
+                except Exception:
+                    continue
+                key = (data["rid"], data["cid"])
+                margin = min(
+                    min(px - x, x + tw - px, py - y, y + th - py) for px, py in box.vertex
+                )
+                if key not in results or margin > results[key][0]:
+                    results[key] = (margin, box, content)
+        return [(box, content) for margin, box, content in results.values()]
+
+    @staticmethod
+    def parse_payloads(payloads: list[tuple[Box, str]]) -> list[QrTarget]:
+        """
+        将二维码内容解析为 `QrTarget`
+
+        :param payloads: `detect_payloads` 的返回值
+        :return: 由 `QrTarget` 构成的列表
+        """
+        results = []
+        for box, content in payloads:
+            target = QrTarget.from_json(box, content)
+            if target is not None:
+                results.append(target)
+        return results
 
     def detect(self, img:cv2.typing.MatLike) -> list[QrTarget]:
         """
@@ -20,16 +240,36 @@ class QrDetector:
         :param img: 待检图像，不考虑摄像头畸变
         :return: 由 `QrTarget` 构成的列表
         """
-        results = []
+        return QrDetector.parse_payloads(self.detect_payloads(img))
 
-        content, points = self._qr_coder.detectAndDecode(img)
-        for i in range(len(content)):
-            box = Box(points[i][0].tolist(), points[i][1].tolist(), points[i][2].tolist(), points[i][3].tolist())
-            results.append(
-                QrTarget.from_json(box, content[i])
-            )
+    def detect_file(self,
+        file_path: str, cache=None, img: cv2.typing.MatLike = None, image_cache=None
+    ) -> list[QrTarget]:
+        """
+        从图像文件中检测二维码，命中缓存时不读取和检测图像
 
-        return results
+        :param file_path: 图像文件路径
+        :param cache: `DetectionCache`，为空时不使用缓存
+        :param img: 已读取的图像，为空时按需从file_path读取
+        :param image_cache: `ImageCache`，按需读取图像时使用，为空时直接解码
+        :return: 由 `QrTarget` 构成的列表
+        """
+        key = None
+        if cache is not None:
+            key = cache.make_key(file_path, self.signature)
+            payloads = cache.get(key)
+            if payloads is not None:
+                return QrDetector.parse_payloads(payloads)
+
+        if img is None:
+            img = image_cache.read(file_path) if image_cache is not None else cv2.imread(file_path)
+        if img is None:
+            return []
+        payloads = self.detect_payloads(img)
+
+        if cache is not None:
+            cache.put(key, payloads)
+        return QrDetector.parse_payloads(payloads)
 
 def main():
     detector = QrDetector()
@@ -40,4 +280,4 @@ def main():
     detector.detect(img)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1 +1,3 @@
-from .QrDetector import QrDetector
\ No newline at end of file
+from .QrDetector import QrDetector
+from .DetectionCache import DetectionCache
+from .QrBackend import QrBackend, WeChatBackend, ClassicBackend, AutoBackend
\ No newline at end of file
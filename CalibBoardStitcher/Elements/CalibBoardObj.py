@@ -1,14 +1,13 @@
-import json
 import logging
 
-import qrcode
-
 from .Box import Box
+from .QrPayload import QrPayload
 
 class CalibBoardObj:
     def __init__(self,
         row_count: int, col_count: int,
-        qr_pixel_size : int = 10, qr_border : int = 3
+        qr_pixel_size : int = 10, qr_border : int = 3,
+        payload_format: str = QrPayload.JSON
     ):
         """
         标定板对象信息
@@ -17,37 +16,47 @@ class CalibBoardObj:
         :param col_count: 标定板黑白色块列数
         :param qr_pixel_size: 二维码的像素块宽度，默认为10
         :param qr_border: 二维码白色外边界宽度，单位为qr_pixel_size的倍数，默认为3
+        :param payload_format: 二维码内容格式，`QrPayload.JSON` 或 `QrPayload.COMPACT`，紧凑格式的二维码version更低
         """
+        if payload_format not in (QrPayload.JSON, QrPayload.COMPACT):
+            raise ValueError("unknown payload format: {}".format(payload_format))
         self._row_count     = row_count
         self._col_count     = col_count
         self._qr_pixel_size = qr_pixel_size
         self._qr_border     = qr_border
+        self._payload_format = payload_format
         self._qr_version = -1
 
 
     @staticmethod
     def from_json(json_data:str):
         """
-        @brief: 从二维码中获取的json字符串获取校准板配置
+        @brief: 从二维码内容获取校准板配置，支持json格式与紧凑格式
         @return: CalibrationBoardConfig
         """
         result = None
         try:
-            data = json.loads(json_data)
-            row_count = data["rc"]
-            col_count = data["cc"]
-            qr_pixel_size = data.get("px_size", 10)
-            qr_border = data.get("qr_border", 3)
-            result = CalibBoardObj(
-                row_count=row_count,
-                col_count=col_count,
-                qr_pixel_size=qr_pixel_size,
-                qr_border=qr_border
-            )
+            result = CalibBoardObj.from_payload_data(QrPayload.decode(json_data))
         except Exception as e:
             logging.error("generate CalibBoardObj from json failed, msg: " + str(e))
         return result
 
+    @staticmethod
+    def from_payload_data(data: dict):
+        """
+        由 `QrPayload.decode` 的解析结果生成标定板对象
+
+        :param data: 二维码内容解析结果
+        :return: CalibBoardObj
+        """
+        return CalibBoardObj(
+            row_count=data["rc"],
+            col_count=data["cc"],
+            qr_pixel_size=data["px_size"],
+            qr_border=data["qr_border"],
+            payload_format=data["format"]
+        )
+
     def calc_qr_version(self) -> int:
         """
         计算当前标定板所需qr version
@@ -55,6 +64,8 @@ class CalibBoardObj:
         :return: qr version
         """
         if self._qr_version < 0:
+            import qrcode
+
             qr = qrcode.QRCode(
                 version=1,
                 error_correction=qrcode.constants.ERROR_CORRECT_H,
@@ -62,18 +73,8 @@ class CalibBoardObj:
                 border=self.qr_border
             )
 
-            data = {
-                "cid"       : self.col_count - 1,
-                "rid"       : self.row_count - 1,
-                "rc"        : self.row_count,
-                "cc"        : self.col_count,
-                "px_size"   : self.qr_pixel_size,
-                "qr_border" : self.qr_border
-            }
-            sorted_data = {}
-            for key in sorted(data.keys()):
-                sorted_data[key] = data[key]
-            qr.add_data(json.dumps(sorted_data))
+            # 同一标定板中行列号最大的二维码内容最长
+            qr.add_data(QrPayload.encode(self.row_count - 1, self.col_count - 1, self))
             qr.make(fit=True)
             self._qr_version = qr.version
         return self._qr_version
@@ -114,6 +115,10 @@ class CalibBoardObj:
     def qr_border(self):
         return self._qr_border
 
+    @property
+    def payload_format(self) -> str:
+        return self._payload_format
+
     @property
     def grid_size(self) -> int:
         """
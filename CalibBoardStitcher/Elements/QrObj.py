@@ -3,6 +3,7 @@ import logging
 
 from .Box import Box
 from .CalibBoardObj import CalibBoardObj
+from .QrPayload import QrPayload
 
 class QrObj(Box):
     def __init__(self, row_id: int, col_id: int, board_obj: CalibBoardObj):
@@ -20,7 +21,15 @@ class QrObj(Box):
         self._board = board_obj
 
     def __str__(self) -> str:
-        return self.gen_json_str()
+        return self.gen_payload()
+
+    def gen_payload(self) -> str:
+        """
+        生成二维码内容，格式由标定板对象的 `payload_format` 决定
+
+        :return: str
+        """
+        return QrPayload.encode(self._row_id, self._col_id, self._board)
 
     def gen_json_str(self) -> str:
         """
@@ -45,13 +54,13 @@ class QrObj(Box):
     @staticmethod
     def from_json(json_data:str):
         """
-        @brief: 从二维码中获取的json字符串生成二维码对象
+        @brief: 从二维码内容生成二维码对象，支持json格式与紧凑格式
         @return: QrObj
         """
         result = None
         try:
-            data = json.loads(json_data)
-            board = CalibBoardObj.from_json(json_data)
+            data = QrPayload.decode(json_data)
+            board = CalibBoardObj.from_payload_data(data)
             result = QrObj(
                 row_id=data["rid"],
                 col_id=data["cid"],
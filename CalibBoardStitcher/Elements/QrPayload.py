@@ -0,0 +1,107 @@
+import json
+
+class QrPayload:
+    # 旧版json格式，键值按ASCII码排序
+    JSON = "json"
+    # 紧凑格式，将各字段按位打包为一个整数，以十进制数字串存储，二维码使用数字模式编码
+    COMPACT = "compact"
+
+    COMPACT_VERSION = 1
+    # 紧凑格式的字段及位宽，高位在前
+    _COMPACT_FIELDS = (
+        ("version", 4),
+        ("rc", 12),
+        ("cc", 12),
+        ("rid", 12),
+        ("cid", 12),
+        ("px_size", 8),
+        ("qr_border", 4)
+    )
+    _COMPACT_CRC_BITS = 8
+    _COMPACT_BITS = sum(bits for _, bits in _COMPACT_FIELDS) + _COMPACT_CRC_BITS
+    # 定长数字串，保证同一标定板中所有二维码的version相同
+    _COMPACT_DIGITS = len(str((1 << _COMPACT_BITS) - 1))
+
+    @staticmethod
+    def _crc8(value: int, bits: int) -> int:
+        # CRC-8，多项式0x07
+        crc = 0
+        for byte in value.to_bytes((bits + 7) // 8, "big"):
+            crc ^= byte
+            for _ in range(8):
+                crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        return crc
+
+    @staticmethod
+    def encode(row_id: int, col_id: int, board_obj) -> str:
+        """
+        生成二维码内容，格式由 `board_obj.payload_format` 决定
+
+        :param row_id: 二维码所在行号
+        :param col_id: 二维码所在列号
+        :param board_obj: 标定板对象
+        :return: str
+        """
+        data = {
+            "cid"       : col_id,
+            "rid"       : row_id,
+            "rc"        : board_obj.row_count,
+            "cc"        : board_obj.col_count,
+            "px_size"   : board_obj.qr_pixel_size,
+            "qr_border" : board_obj.qr_border
+        }
+        if board_obj.payload_format == QrPayload.JSON:
+            return json.dumps(data, sort_keys=True)
+
+        data["version"] = QrPayload.COMPACT_VERSION
+        value = 0
+        for name, bits in QrPayload._COMPACT_FIELDS:
+            if not 0 <= data[name] < (1 << bits):
+                raise ValueError("{} out of range for compact payload: {}".format(name, data[name]))
+            value = (value << bits) | data[name]
+        data_bits = QrPayload._COMPACT_BITS - QrPayload._COMPACT_CRC_BITS
+        value = (value << QrPayload._COMPACT_CRC_BITS) | QrPayload._crc8(value, data_bits)
+        return str(value).zfill(QrPayload._COMPACT_DIGITS)
+
+    @staticmethod
+    def decode(payload: str) -> dict:
+        """
+        解析二维码内容，自动识别json格式与紧凑格式
+
+        :param payload: 二维码内容
+        :return: 包含 `rid`, `cid`, `rc`, `cc`, `px_size`, `qr_border`, `format` 的字典
+        :raise ValueError: 内容不是有效的标定板二维码
+        """
+        if len(payload) == QrPayload._COMPACT_DIGITS and payload.isdigit():
+            value = int(payload)
+            crc = value & ((1 << QrPayload._COMPACT_CRC_BITS) - 1)
+            value >>= QrPayload._COMPACT_CRC_BITS
+            data_bits = QrPayload._COMPACT_BITS - QrPayload._COMPACT_CRC_BITS
+            if value >> data_bits != 0 or QrPayload._crc8(value, data_bits) != crc:
+                raise ValueError("compact payload checksum mismatch: {}".format(payload))
+
+            data = {}
+            for name, bits in reversed(QrPayload._COMPACT_FIELDS):
+                data[name] = value & ((1 << bits) - 1)
+                value >>= bits
+            if data.pop("version") != QrPayload.COMPACT_VERSION:
+                raise ValueError("unsupported compact payload version: {}".format(payload))
+            data["format"] = QrPayload.COMPACT
+        else:
+            # 视野中可能存在其他二维码，任何不符合格式的内容均视为无效
+            raw = json.loads(payload)
+            if not isinstance(raw, dict):
+                raise ValueError("payload is not a json object: {}".format(payload))
+            data = {"px_size": 10, "qr_border": 3}
+            for name in ("rid", "cid", "rc", "cc", "px_size", "qr_border"):
+                if name in raw:
+                    data[name] = raw[name]
+                if name not in data:
+                    raise ValueError("payload missing {}: {}".format(name, payload))
+                if type(data[name]) is not int:
+                    raise ValueError("payload field {} is not an integer: {}".format(name, payload))
+            data["format"] = QrPayload.JSON
+
+        if not (0 <= data["rid"] < data["rc"] and 0 <= data["cid"] < data["cc"]):
+            raise ValueError("qr position out of board: {}".format(payload))
+        return data
@@ -1,8 +1,8 @@
-import json
 import logging
 
 from .Box import Box
 from .CalibBoardObj import CalibBoardObj
+from .QrPayload import QrPayload
 
 class QrTarget(Box):
     def __init__(self, row_id: int, col_id: int, box: Box, board: CalibBoardObj):
@@ -33,13 +33,13 @@ class QrTarget(Box):
     @staticmethod
     def from_json(box: Box, json_data:str):
         """
-        @brief: 从二维码中获取的json字符串获取校准板配置
-        @return: CalibrationBoardConfig
+        @brief: 从二维码内容获取二维码位置及校准板配置，支持json格式与紧凑格式
+        @return: QrTarget
         """
         result = None
         try:
-            data = json.loads(json_data)
-            board = CalibBoardObj.from_json(json_data)
+            data = QrPayload.decode(json_data)
+            board = CalibBoardObj.from_payload_data(data)
             result = QrTarget(
                 row_id=data["rid"],
                 col_id=data["cid"],
@@ -1,4 +1,5 @@
 from .Box import Box
 from .CalibBoardObj import CalibBoardObj
+from .QrPayload import QrPayload
 from .QrObj import QrObj
 from .QrTarget import QrTarget
@@ -5,7 +5,7 @@ import cv2
 import numpy as np
 
 from CalibBoardStitcher.Elements import CalibBoardObj
-from CalibBoardStitcher.Elements import QrObj
+from CalibBoardStitcher.Elements import QrObj, QrPayload
 from .QrGenerator import QrGenerator
 
 class BoardGenerator:
@@ -70,7 +70,8 @@ def main():
     )
     board_cfg = CalibBoardObj(
         row_count=32,
-        col_count=43
+        col_count=43,
+        payload_format=QrPayload.COMPACT
     )
     generator = BoardGenerator()
     img = generator.gen_img(board_cfg)
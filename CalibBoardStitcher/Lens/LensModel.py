@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+class LensModel:
+    def __init__(self, camera_matrix, dist_coeffs, img_size: tuple[int, int]):
+        """
+        相机镜头模型，包含内参矩阵和畸变系数
+
+        :param camera_matrix: 3x3内参矩阵
+        :param dist_coeffs: 畸变系数，格式同OpenCV
+        :param img_size: 标定时的图像尺寸, (w, h)
+        """
+        self._camera_matrix = np.array(camera_matrix, dtype=np.float64).reshape(3, 3)
+        self._dist_coeffs = np.array(dist_coeffs, dtype=np.float64).reshape(-1)
+        self._img_size = (int(img_size[0]), int(img_size[1]))
+
+    @staticmethod
+    def estimate(calib_result, img_sizes: dict[str, tuple[int, int]] = None,
+        flags: int = cv2.CALIB_USE_INTRINSIC_GUESS | cv2.CALIB_FIX_FOCAL_LENGTH | cv2.CALIB_FIX_PRINCIPAL_POINT |
+            cv2.CALIB_FIX_K3 | cv2.CALIB_ZERO_TANGENT_DIST
+    ):
+        """
+        由已累积的匹配点对估计相机内参和畸变系数
+
+        :param calib_result: `CalibResult`，其中的标定板坐标视为z=0平面上的点
+        :param img_sizes: img_id到图像尺寸(w, h)的映射，为空时使用 `CalibResult.get_img_size`
+        :param flags: `cv2.calibrateCamera` 标志位
+        :note: 扫描拍摄时子图基本正对标定板，焦距不可观测，因此默认以图像长边作为焦距、图像中心作为主点，仅估计k1、k2
+        :return: LensModel，有效视图不足时为None
+        """
+        object_points = []
+        img_points = []
+        img_size = None
+        for img_id in calib_result.get_matched_img_id():
+            size = img_sizes[img_id] if img_sizes else calib_result.get_img_size(img_id)
+            if size is None:
+                continue
+            if img_size is None:
+                img_size = tuple(size)
+            elif tuple(size) != img_size:
+                # 同一相机模型要求图像尺寸一致
+                continue
+
+            matched_points = calib_result.get_matched_points(img_id)
+            if len(matched_points) < 4:
+                continue
+            cb_points = np.array([point.cb_point for point in matched_points], dtype=np.float32)
+            object_points.append(np.hstack([cb_points, np.zeros((len(cb_points), 1), dtype=np.float32)]))
+            img_points.append(np.array([point.img_point for point in matched_points], dtype=np.float32))
+
+        if len(object_points) < 2:
+            logging.error("estimate lens model failed, at least 2 views are required.")
+            return None
+
+        camera_matrix = np.array([
+            [max(img_size), 0, (img_size[0] - 1) / 2],
+            [0, max(img_size), (img_size[1] - 1) / 2],
+            [0, 0, 1]
+        ], dtype=np.float64)
+        rms, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(
+            object_points, img_points, img_size, camera_matrix, None, flags=flags
+        )
+        logging.info("lens model estimated, rms: {}".format(rms))
+        return LensModel(camera_matrix, dist_coeffs, img_size)
+
+    @property
+    def camera_matrix(self) -> np.ndarray:
+        return self._camera_matrix
+
+    @property
+    def dist_coeffs(self) -> np.ndarray:
+        return self._dist_coeffs
+
+    @property
+    def img_size(self) -> tuple[int, int]:
+        return self._img_size
+
+    @property
+    def key(self) -> str:
+        """
+        镜头模型唯一标识，用于缓存remap网格
+        """
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(np.round(self._camera_matrix, 6).tobytes())
+        digest.update(np.round(self._dist_coeffs, 9).tobytes())
+        digest.update(np.array(self._img_size, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def undistort_points(self, points) -> np.ndarray:
+        """
+        将原始图像中的点坐标转换为无畸变图像中的点坐标
+
+        :param points: 点坐标，shape为(N, 2)
+        :return: np.ndarray, shape为(N, 2)
+        """
+        points = np.array(points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.undistortPoints(
+            points, self._camera_matrix, self._dist_coeffs, P=self._camera_matrix
+        ).reshape(-1, 2)
+
+    def undistort_outline(self, img_size: tuple[int, int], samples: int = 16) -> np.ndarray:
+        """
+        计算图像边缘在无畸变图像中的轮廓点
+
+        :param img_size: 图像尺寸, (w, h)
+        :param samples: 每条边的采样点数
+        :return: np.ndarray, shape为(4 * samples, 2)
+        """
+        w, h = img_size
+        t = np.linspace(0, 1, samples, endpoint=False)
+        outline = np.vstack([
+            np.stack([t * (w - 1), np.zeros_like(t)], axis=1),
+            np.stack([np.full_like(t, w - 1), t * (h - 1)], axis=1),
+            np.stack([(1 - t) * (w - 1), np.full_like(t, h - 1)], axis=1),
+            np.stack([np.zeros_like(t), (1 - t) * (h - 1)], axis=1)
+        ])
+        return self.undistort_points(outline)
+
+    def build_warp_maps(self, m: np.ndarray, dst_size: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        生成融合了去畸变和仿射变换的定点remap网格
+
+        :param m: 2x3仿射矩阵，从无畸变图像坐标映射到目标图像坐标
+        :param dst_size: 目标图像尺寸, (w, h)
+        :return: tuple[map1, map2]，可直接用于 `cv2.remap`
+        """
+        # 目标像素 -> 无畸变像素 -> 归一化坐标 -> 加畸变 -> 原始像素，由initUndistortRectifyMap一次完成
+        new_camera_matrix = np.vstack([m, [0, 0, 1]]) @ self._camera_matrix
+        return cv2.initUndistortRectifyMap(
+            self._camera_matrix, self._dist_coeffs, None, new_camera_matrix, dst_size, cv2.CV_16SC2
+        )
+
+    def dict(self) -> dict:
+        return {
+            "camera_matrix": self._camera_matrix.tolist(),
+            "dist_coeffs": self._dist_coeffs.tolist(),
+            "img_size": list(self._img_size)
+        }
+
+    @staticmethod
+    def from_dict(data: dict):
+        return LensModel(data["camera_matrix"], data["dist_coeffs"], data["img_size"])
+
+
+class RemapCache:
+    def __init__(self, cache_dir: str = "", max_bytes: int = 512 * 1024 * 1024):
+        """
+        融合remap网格缓存，键为 (镜头模型, 变换矩阵, 目标尺寸)
+
+        :param cache_dir: 磁盘缓存文件夹，为空时仅缓存于内存
+        :param max_bytes: 内存缓存与磁盘缓存各自的容量上限，超出时按最近最少使用淘汰
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+        if len(cache_dir) > 0:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(lens_model: LensModel, m: np.ndarray, dst_size: tuple[int, int]) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(lens_model.key.encode("utf-8"))
+        digest.update(np.round(np.asarray(m, dtype=np.float64), 6).tobytes())
+        digest.update(np.array(dst_size, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def get_maps(self, lens_model: LensModel, m: np.ndarray, dst_size: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        获取remap网格，未命中时生成并缓存
+
+        :param lens_model: 镜头模型
+        :param m: 2x3仿射矩阵，从无畸变图像坐标映射到目标图像坐标
+        :param dst_size: 目标图像尺寸, (w, h)
+        :return: tuple[map1, map2]
+        """
+        key = RemapCache.make_key(lens_model, m, dst_size)
+        with self._lock:
+            if key in self._maps:
+                self._maps.move_to_end(key)
+                return self._maps[key]
+
+        maps = None
+        file_path = os.path.join(self._cache_dir, key + ".npz") if len(self._cache_dir) > 0 else ""
+        if len(file_path) > 0 and os.path.exists(file_path):
+            try:
+                with np.load(file_path) as data:
+                    maps = (data["map1"], data["map2"])
+                # 以修改时间记录最近使用时间，atime在多数文件系统上不更新
+                os.utime(file_path)
+            except Exception as e:
+                logging.warning("load remap cache failed, msg: " + str(e))
+
+        if maps is None:
+            maps = lens_model.build_warp_maps(m, dst_size)
+            if len(file_path) > 0:
+                # 先写入临时文件再重命名，避免并发读取到不完整的文件
+                tmp_path = "{}.{}.{}.tmp.npz".format(file_path[:-4], os.getpid(), threading.get_ident())
+                np.savez(tmp_path, map1=maps[0], map2=maps[1])
+                os.replace(tmp_path, file_path)
+                self._evict_disk()
+
+        with self._lock:
+            if key not in self._maps:
+                self._maps[key] = maps
+                self._bytes += maps[0].nbytes + maps[1].nbytes
+            while self._bytes > self._max_bytes and len(self._maps) > 1:
+                _, evicted = self._maps.popitem(last=False)
+                self._bytes -= evicted[0].nbytes + evicted[1].nbytes
+        return maps
+
+    def _evict_disk(self):
+        # 磁盘缓存超出容量时按修改时间淘汰至容量上限的90%，避免每次写入都触发淘汰；可能与其他进程同时淘汰
+        entries = []
+        total = 0
+        for name in os.listdir(self._cache_dir):
+            if not name.endswith(".npz") or name.endswith(".tmp.npz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self._cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+        if total <= self._max_bytes:
+            return
+
+        target = self._max_bytes * 0.9
+        evicted = 0
+        for _, size, name in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(os.path.join(self._cache_dir, name))
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        logging.debug("remap cache evicted {} files.".format(evicted))
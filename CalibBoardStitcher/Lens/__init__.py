@@ -0,0 +1 @@
+from .LensModel import LensModel, RemapCache
\ No newline at end of file
@@ -0,0 +1,87 @@
+import http.client
+import json
+from collections.abc import Iterator
+
+class ServiceClient:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, timeout: float = None):
+        """
+        `StitchService` 的客户端
+
+        :param host: 服务地址
+        :param port: 服务端口
+        :param timeout: 连接与读取超时，单位秒，为空时不超时
+        """
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+
+    def _request(self, method: str, path: str, data: dict = None) -> http.client.HTTPResponse:
+        conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+        body = None
+        headers = {}
+        if method == "POST":
+            # 服务只接受json格式的POST请求
+            body = json.dumps(data or {}, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        if response.status >= 300:
+            message = response.read().decode("utf-8")
+            conn.close()
+            raise RuntimeError("{} {} failed, status: {}, msg: {}".format(method, path, response.status, message))
+        return response
+
+    def _request_json(self, method: str, path: str, data: dict = None):
+        response = self._request(method, path, data)
+        try:
+            return json.loads(response.read())
+        finally:
+            response.close()
+
+    def health(self) -> dict:
+        return self._request_json("GET", "/health")
+
+    def submit(self, job_type: str, **params) -> str:
+        """
+        提交任务
+
+        :param job_type: 任务类型，"calibration"、"stitch" 或 "render"
+        :param params: 任务参数，路径参数应为服务端可访问的路径
+        :return: 任务id
+        """
+        return self._request_json("POST", "/jobs", dict(params, type=job_type))["id"]
+
+    def status(self, job_id: str) -> dict:
+        return self._request_json("GET", "/jobs/{}".format(job_id))
+
+    def jobs(self) -> list[dict]:
+        return self._request_json("GET", "/jobs")
+
+    def events(self, job_id: str) -> Iterator[dict]:
+        """
+        读取任务事件流，包含任务提交以来的全部事件，任务结束后停止
+
+        :param job_id: 任务id
+        :return: 事件迭代器
+        """
+        response = self._request("GET", "/jobs/{}/events".format(job_id))
+        try:
+            for line in response:
+                if len(line.strip()) > 0:
+                    yield json.loads(line)
+        finally:
+            response.close()
+
+    def wait(self, job_id: str) -> dict:
+        """
+        等待任务结束
+
+        :param job_id: 任务id
+        :return: 任务最终状态
+        """
+        for _ in self.events(job_id):
+            pass
+        return self.status(job_id)
+
+    def shutdown(self):
+        self._request_json("POST", "/shutdown")
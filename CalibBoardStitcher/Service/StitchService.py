@@ -0,0 +1,406 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import cv2
+
+from CalibBoardStitcher.Detector import QrDetector
+from CalibBoardStitcher.CalibResult import CalibResult
+from CalibBoardStitcher.Lens import RemapCache
+from CalibBoardStitcher.Stitcher import (
+    Stitcher, TilePlanner, ProgressivePreview, QualityGate, calibration, stitch_calib_result
+)
+from CalibBoardStitcher.Batch import BatchJob
+from CalibBoardStitcher.Utils import logging_config, ImageCache
+
+class ServiceJob:
+    RENDER = "render"
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    # 渲染任务的参数，其余任务的参数与 `BatchJob` 一致
+    _RENDER_PARAMS = ("img_dir", "json_file", "export_img", "preview_size")
+
+    def __init__(self, job_id: str, job_type: str, params: dict):
+        """
+        服务中的任务
+
+        :param job_id: 任务id
+        :param job_type: 任务类型，`BatchJob.CALIBRATION`、`BatchJob.STITCH` 或 `ServiceJob.RENDER`
+        :param params: 任务参数
+        """
+        if job_type == ServiceJob.RENDER:
+            unknown = set(params.keys()) - set(ServiceJob._RENDER_PARAMS)
+            if len(unknown) > 0:
+                raise ValueError("unknown params {} for job: {}".format(sorted(unknown), job_id))
+        else:
+            # 校验任务类型与参数
+            BatchJob(job_id, job_type, params)
+        if len(params.get("img_dir", "")) == 0:
+            raise ValueError("img_dir is required for job: {}".format(job_id))
+
+        self.job_id = job_id
+        self.job_type = job_type
+        self.params = params
+        self.status = ServiceJob.QUEUED
+        self.progress = 0.0
+        self.result = None
+        self.error = ""
+        self.events = []
+        self._changed = asyncio.Event()
+
+    def publish(self, event: dict):
+        """
+        记录任务事件并唤醒等待中的事件流，只能在事件循环线程中调用
+        """
+        event = dict(event, id=self.job_id, time=time.time())
+        if "progress" in event:
+            self.progress = event["progress"]
+        self.events.append(event)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_event(self, index: int):
+        """
+        等待第index个事件
+        """
+        changed = self._changed
+        if index >= len(self.events) and not self.finished:
+            await changed.wait()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (ServiceJob.DONE, ServiceJob.FAILED)
+
+    def dict(self) -> dict:
+        return {
+            "id": self.job_id,
+            "type": self.job_type,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class StitchService:
+    # 始终允许的Host，其余须由 allowed_hosts 显式指定
+    _LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, max_workers: int = None, max_cached: int = 8,
+        allowed_hosts: list[str] = None
+    ):
+        """
+        本地标定拼接服务，常驻进程中保持已加载模型的工作线程，通过本机HTTP接口排队执行任务
+
+        :param host: 监听地址，默认仅本机可访问
+        :param port: 监听端口，为0时由系统分配
+        :param max_workers: 工作线程数，即同时执行的任务数，为空时使用CPU核心数
+        :param max_cached: 缓存的标定结果数量，同一json文件在内容未变化时复用已加载的标定结果与remap网格
+        :param allowed_hosts: 除本机地址外允许的Host名，监听非本机地址时用于指定本服务的域名或IP
+        :note: 为防止网页通过浏览器跨站请求(包括DNS重绑定)访问服务，请求的Host须为本机地址或 allowed_hosts 之一，
+               带有Origin的请求其Origin须同样满足该条件，POST请求的Content-Type须为 application/json
+        :note: 接口:
+               GET  /health                 服务状态
+               POST /jobs                   提交任务，请求体为 {"type": 任务类型, 参数...}，返回 {"id": 任务id}
+               GET  /jobs                   全部任务状态
+               GET  /jobs/{id}              任务状态
+               GET  /jobs/{id}/events       任务事件流，ndjson格式，任务结束后关闭
+               POST /shutdown               停止服务
+        """
+        self._host = host
+        self._port = port
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._max_cached = max_cached
+        self._allowed_hosts = set(StitchService._LOCAL_HOSTS) | {host.lower() for host in allowed_hosts or []}
+        if host not in ("", "0.0.0.0", "::"):
+            self._allowed_hosts.add(host.lower())
+
+        self._loop = None
+        self._server = None
+        self._executor = None
+        self._queue = None
+        self._workers = []
+        self._stopped = None
+        self._jobs = {}
+        self._job_ids = itertools.count(1)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _init_worker():
+        # 每个工作线程预先加载一份检测模型，之后的任务复用
+        QrDetector().warm_up()
+
+    def _load_calib(self, json_file: str) -> tuple[CalibResult, Stitcher]:
+        # 按文件路径、修改时间与大小缓存标定结果和对应的Stitcher(包含remap网格缓存)
+        stat = os.stat(json_file)
+        key = (os.path.abspath(json_file), stat.st_mtime_ns, stat.st_size)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        calib_result = CalibResult.load_from_file(json_file)
+        stitcher = Stitcher(calib_result.get_calib_board_obj(), calib_result.get_lens_model(), RemapCache())
+        with self._cache_lock:
+            self._cache[key] = (calib_result, stitcher)
+            while len(self._cache) > self._max_cached:
+                self._cache.popitem(last=False)
+        return calib_result, stitcher
+
+    def _publish(self, job: ServiceJob, event: dict):
+        # 工作线程中发布事件
+        self._loop.call_soon_threadsafe(job.publish, event)
+
+    def _progress_preview(self, job: ServiceJob, preview_size: int, images: list = None) -> ProgressivePreview:
+        def callback(img, progress):
+            if images is not None:
+                images[:] = [img]
+            self._publish(job, {"event": "progress", "progress": progress})
+        return ProgressivePreview(callback, preview_size=preview_size, every_tiles=1, interval=0)
+
+    def _run_job(self, job: ServiceJob) -> dict:
+        params = dict(job.params)
+        if job.job_type == BatchJob.CALIBRATION:
+            calib_result = calibration(params.pop("img_dir"), **params)
+            if calib_result is None:
+                raise RuntimeError("QR code not found in: {}".format(job.params["img_dir"]))
+            return {"matched_images": len(calib_result.get_matched_img_id())}
+
+        calib_result, stitcher = self._load_calib(params["json_file"])
+        if job.job_type == BatchJob.STITCH:
+            remap_cache_dir = params.get("remap_cache_dir", "")
+            thumb_dir = params.get("thumb_dir", "")
+            if len(remap_cache_dir) > 0 or len(thumb_dir) > 0:
+                stitcher = Stitcher(
+                    calib_result.get_calib_board_obj(), calib_result.get_lens_model(), RemapCache(remap_cache_dir),
+                    image_cache=ImageCache(thumb_dir=thumb_dir) if len(thumb_dir) > 0 else None
+                )
+            base_img = stitch_calib_result(
+                stitcher, calib_result, params["img_dir"],
+                scale=params.get("scale", 1.0),
+                skip_redundant=params.get("skip_redundant", True),
+                preview=self._progress_preview(job, 64),
+                memory_budget=params.get("memory_budget", 0),
+                canvas_dir=params.get("canvas_dir", ""),
+                gain_compensation=params.get("gain_compensation", False),
+                quality_gate=QualityGate.create(params.get("quality_gate", QualityGate.DEMOTE))
+            )
+            if len(params.get("export_img", "")) > 0:
+                cv2.imwrite(params["export_img"], base_img)
+            return {"shape": list(base_img.shape)}
+
+        # 渲染低分辨率预览图，不生成全分辨率大图
+        images = []
+        preview = self._progress_preview(job, params.get("preview_size", 1024), images)
+        preview.begin(stitcher, calib_result.get_calib_board_obj().img_shape)
+        img_ids = TilePlanner(stitcher).plan(calib_result, params["img_dir"]).img_ids
+        for i, img_id in enumerate(img_ids):
+            # 按预览图分辨率缩小解码
+            img, matched_points = stitcher.read_partial(
+                os.path.join(params["img_dir"], img_id), calib_result.get_matched_points(img_id), preview.preview_scale
+            )
+            if img is not None:
+                preview.update(img, matched_points, (i + 1) * 100 / len(img_ids))
+        preview.end()
+        if len(params.get("export_img", "")) > 0:
+            cv2.imwrite(params["export_img"], images[0])
+        return {"shape": list(images[0].shape)}
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = ServiceJob.RUNNING
+            job.publish({"event": "started", "status": job.status})
+            start = time.perf_counter()
+            try:
+                job.result = await self._loop.run_in_executor(self._executor, self._run_job, job)
+                job.status = ServiceJob.DONE
+                job.progress = 100.0
+                logging.info("job {} done, spend: {}".format(job.job_id, time.perf_counter() - start))
+            except Exception as e:
+                job.status = ServiceJob.FAILED
+                job.error = str(e)
+                logging.error("job {} failed, msg: {}".format(job.job_id, str(e)))
+            job.publish({"event": job.status, "status": job.status, "result": job.result, "error": job.error})
+            self._queue.task_done()
+
+    def submit(self, job_type: str, params: dict) -> ServiceJob:
+        """
+        提交任务，只能在事件循环线程中调用
+
+        :param job_type: 任务类型
+        :param params: 任务参数
+        :return: ServiceJob
+        """
+        job = ServiceJob(str(next(self._job_ids)), job_type, params)
+        self._jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        job.publish({"event": "queued", "status": job.status})
+        return job
+
+    @staticmethod
+    async def _send_json(writer: asyncio.StreamWriter, code: int, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        reason = {
+            200: "OK", 201: "Created", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 415: "Unsupported Media Type"
+        }
+        writer.write(
+            "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(
+                code, reason.get(code, ""), len(body)
+            ).encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def _send_events(self, writer: asyncio.StreamWriter, job: ServiceJob):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+        )
+        index = 0
+        while True:
+            while index < len(job.events):
+                line = (json.dumps(job.events[index], ensure_ascii=False) + "\n").encode("utf-8")
+                writer.write("{:x}\r\n".format(len(line)).encode("latin-1") + line + b"\r\n")
+                index += 1
+            await writer.drain()
+            if job.finished and index >= len(job.events):
+                break
+            await job.wait_event(index)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def _check_request(self, method: str, headers: dict) -> tuple[int, str]:
+        # 校验请求来源，返回 (状态码, 错误信息)，通过时状态码为0
+        host = urlsplit("//" + headers.get("host", "")).hostname
+        if host is None or host not in self._allowed_hosts:
+            return 403, "host not allowed: {}".format(headers.get("host", ""))
+        if "origin" in headers and urlsplit(headers["origin"]).hostname not in self._allowed_hosts:
+            return 403, "origin not allowed: {}".format(headers["origin"])
+        if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+            return 415, "content type must be application/json"
+        return 0, ""
+
+    async def _route(self, method: str, path: list[str], body: bytes, writer: asyncio.StreamWriter):
+        if path == ["health"] and method == "GET":
+            await self._send_json(writer, 200, {
+                "status": "ok", "workers": self._max_workers, "queued": self._queue.qsize(), "jobs": len(self._jobs)
+            })
+        elif path == ["jobs"] and method == "POST":
+            try:
+                data = json.loads(body or b"{}")
+                job = self.submit(data.pop("type", ""), data)
+            except (ValueError, AttributeError) as e:
+                await self._send_json(writer, 400, {"error": str(e)})
+                return
+            await self._send_json(writer, 201, {"id": job.job_id})
+        elif path == ["jobs"] and method == "GET":
+            await self._send_json(writer, 200, [job.dict() for job in self._jobs.values()])
+        elif len(path) in (2, 3) and path[0] == "jobs" and method == "GET":
+            job = self._jobs.get(path[1])
+            if job is None:
+                await self._send_json(writer, 404, {"error": "job not found: {}".format(path[1])})
+            elif len(path) == 2:
+                await self._send_json(writer, 200, job.dict())
+            elif path[2] == "events":
+                await self._send_events(writer, job)
+            else:
+                await self._send_json(writer, 404, {"error": "not found"})
+        elif path == ["shutdown"] and method == "POST":
+            await self._send_json(writer, 200, {"status": "stopping"})
+            self._stopped.set()
+        else:
+            await self._send_json(writer, 404, {"error": "not found"})
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            if len(request_line) == 0:
+                return
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, value = line.decode("latin-1").split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            path = [part for part in urlsplit(target).path.split("/") if len(part) > 0]
+            code, error = self._check_request(method.upper(), headers)
+            if code != 0:
+                logging.warning("rejected {} {}, msg: {}".format(method, target, error))
+                await self._send_json(writer, code, {"error": error})
+                return
+            await self._route(method.upper(), path, body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logging.error("handle request failed, msg: {}".format(str(e)))
+            try:
+                await self._send_json(writer, 400, {"error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def start(self) -> int:
+        """
+        启动服务
+
+        :return: 实际监听的端口
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, initializer=StitchService._init_worker)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._max_workers)]
+        self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        self._port = self._server.sockets[0].getsockname()[1]
+        logging.info("stitch service listening on {}:{}".format(self._host, self._port))
+        return self._port
+
+    async def stop(self):
+        """
+        停止服务，正在执行的任务完成后退出，未开始的任务被丢弃
+        """
+        self._server.close()
+        await self._server.wait_closed()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    async def serve(self):
+        """
+        启动服务并运行，直到收到停止请求
+        """
+        await self.start()
+        try:
+            await self._stopped.wait()
+        finally:
+            await self.stop()
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+
+def main():
+    logging_config()
+    asyncio.run(StitchService().serve())
+
+if __name__ == "__main__":
+    main()
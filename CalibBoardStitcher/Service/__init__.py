@@ -0,0 +1,2 @@
+from .StitchService import StitchService, ServiceJob
+from .ServiceClient import ServiceClient
\ No newline at end of file
@@ -0,0 +1,143 @@
+import logging
+import math
+import os
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher.CalibResult import CalibResult
+
+class GainCompensator:
+    def __init__(self,
+        stitcher,
+        thumb_size: int = 1024,
+        sigma_n: float = 10.0,
+        sigma_g: float = 0.1,
+        min_overlap: int = 64
+    ):
+        """
+        基于缩略图的曝光补偿，由子图重叠区域的平均亮度全局求解各子图各通道的增益(Brown & Lowe)
+        结果以查找表形式在拼接时应用于仿射后的子图，不对原分辨率子图进行额外处理
+
+        :param stitcher: Stitcher
+        :param thumb_size: 估计时使用的低分辨率大图长边的像素数
+        :param sigma_n: 重叠区域亮度误差的标准差，单位为灰度值
+        :param sigma_g: 增益的先验标准差，增益越偏离1代价越大
+        :param min_overlap: 重叠像素数(估计分辨率下)小于该值的子图对不参与求解
+        """
+        self._stitcher = stitcher
+        self._thumb_size = thumb_size
+        self._sigma_n = sigma_n
+        self._sigma_g = sigma_g
+        self._min_overlap = min_overlap
+
+    def estimate(self, calib_result: CalibResult, img_dir: str, img_ids: list[str] = None) -> dict[str, np.ndarray]:
+        """
+        估计各子图的曝光补偿查找表
+
+        :param calib_result: 标定结果
+        :param img_dir: 子图文件夹
+        :param img_ids: 参与拼接的子图id，为空时使用标定结果中的全部子图
+        :return: 子图id到查找表的映射，查找表shape为(1, 256, 3)，可直接用于 `cv2.LUT`
+        """
+        if img_ids is None:
+            img_ids = calib_result.get_matched_img_id()
+
+        board_h, board_w = calib_result.get_calib_board_obj().img_size
+        scale = self._thumb_size / max(board_h, board_w)
+        canvas_h, canvas_w = max(1, round(board_h * scale)), max(1, round(board_w * scale))
+
+        # 1. 将各子图的缩略图仿射到低分辨率大图，只保留ROI
+        tiles = []
+        for img_id in img_ids:
+            file_path = os.path.join(img_dir, img_id)
+            matched_points = calib_result.get_matched_points(img_id)
+            if not os.path.exists(file_path) or len(matched_points) == 0:
+                continue
+            # 按缩略图分辨率解码子图，子图坐标随解码缩放系数同步缩放
+            thumb, thumb_points = self._stitcher.read_partial(file_path, matched_points, scale)
+            if thumb is None:
+                continue
+            polygon = self._stitcher.stitch_full_calc_wrapped_partial_polygon(
+                (thumb.shape[1], thumb.shape[0]), thumb_points, scale
+            )
+            if polygon is None:
+                continue
+            roi_l = max(math.floor(polygon[:, 0].min()), 0)
+            roi_r = min(math.ceil(polygon[:, 0].max()), canvas_w - 1)
+            roi_t = max(math.floor(polygon[:, 1].min()), 0)
+            roi_b = min(math.ceil(polygon[:, 1].max()), canvas_h - 1)
+            if roi_r < roi_l or roi_b < roi_t:
+                continue
+
+            canvas = np.zeros((canvas_h, canvas_w, 3), dtype=np.uint8)
+            self._stitcher.stitch_preview(canvas, thumb, thumb_points, scale)
+            mask = np.zeros((canvas_h, canvas_w), dtype=np.uint8)
+            cv2.fillConvexPoly(mask, np.round(polygon).astype(np.int32), 255)
+            mask = cv2.erode(mask, np.ones((3, 3), dtype=np.uint8))
+            tiles.append((
+                img_id, (roi_l, roi_t, roi_r, roi_b),
+                canvas[roi_t:roi_b + 1, roi_l:roi_r + 1].astype(np.float64),
+                mask[roi_t:roi_b + 1, roi_l:roi_r + 1] > 0
+            ))
+
+        n = len(tiles)
+        if n == 0:
+            return {}
+
+        # 2. 统计子图两两重叠区域的像素数与各自的平均亮度
+        overlap_n = np.zeros((n, n))
+        overlap_i = np.zeros((n, n, 3))
+        for i in range(n):
+            _, (il, it, ir, ib), img_i, mask_i = tiles[i]
+            overlap_n[i, i] = np.count_nonzero(mask_i)
+            if overlap_n[i, i] > 0:
+                overlap_i[i, i] = img_i[mask_i].mean(axis=0)
+            for j in range(i + 1, n):
+                _, (jl, jt, jr, jb), img_j, mask_j = tiles[j]
+                l, t, r, b = max(il, jl), max(it, jt), min(ir, jr), min(ib, jb)
+                if r < l or b < t:
+                    continue
+                both = (
+                    mask_i[t - it:b - it + 1, l - il:r - il + 1] &
+                    mask_j[t - jt:b - jt + 1, l - jl:r - jl + 1]
+                )
+                count = np.count_nonzero(both)
+                if count < self._min_overlap:
+                    continue
+                overlap_n[i, j] = overlap_n[j, i] = count
+                overlap_i[i, j] = img_i[t - it:b - it + 1, l - il:r - il + 1][both].mean(axis=0)
+                overlap_i[j, i] = img_j[t - jt:b - jt + 1, l - jl:r - jl + 1][both].mean(axis=0)
+
+        # 3. 按通道求解最小化 sum N_ij * ((g_i*I_ij - g_j*I_ji)^2 / sigma_n^2 + (1 - g_i)^2 / sigma_g^2) 的增益
+        alpha = 1.0 / self._sigma_n ** 2
+        beta = 1.0 / self._sigma_g ** 2
+        gains = np.ones((n, 3))
+        for c in range(3):
+            a = np.zeros((n, n))
+            b = np.zeros(n)
+            for i in range(n):
+                for j in range(n):
+                    if overlap_n[i, j] == 0:
+                        continue
+                    b[i] += beta * overlap_n[i, j]
+                    a[i, i] += beta * overlap_n[i, j]
+                    if i == j:
+                        continue
+                    a[i, i] += 2 * alpha * overlap_i[i, j, c] ** 2 * overlap_n[i, j]
+                    a[i, j] -= 2 * alpha * overlap_i[i, j, c] * overlap_i[j, i, c] * overlap_n[i, j]
+            # 缩略图中没有有效像素的子图(如很小的子图)不参与求解，增益为1
+            empty = overlap_n.diagonal() == 0
+            a[empty, empty] = 1.0
+            b[empty] = 1.0
+            gains[:, c] = np.linalg.solve(a, b)
+
+        logging.info("gain compensation: {} tiles, gain range [{:.3f}, {:.3f}]".format(n, gains.min(), gains.max()))
+
+        # 4. 生成查找表
+        values = np.arange(256, dtype=np.float64)
+        luts = {}
+        for (img_id, _, _, _), gain in zip(tiles, gains):
+            lut = np.clip(np.round(values[:, None] * gain[None, :]), 0, 255).astype(np.uint8)
+            luts[img_id] = lut.reshape(1, 256, 3)
+        return luts
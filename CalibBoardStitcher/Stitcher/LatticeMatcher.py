@@ -0,0 +1,169 @@
+import logging
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher.Elements import CalibBoardObj
+from CalibBoardStitcher.CalibResult import MatchedPoint
+
+class LatticeMatcher:
+    def __init__(self,
+        board: CalibBoardObj,
+        search_ratio: float = 0.2,
+        min_points: int = 3,
+        min_contrast: float = 40.0,
+        iterations: int = 2
+    ):
+        """
+        基于标定板黑白格点阵的匹配器，用于无法解码二维码的子图
+        根据预测的变换，只在黑白格交点附近的小窗口内搜索角点，不进行二维码解码
+
+        :param board: 标定板对象
+        :param search_ratio: 搜索窗口半径，单位为黑白格边长，预测误差需小于该值
+        :param min_points: 匹配成功所需的最少角点数
+        :param min_contrast: 角点处黑白格的最小灰度差
+        :param iterations: 预测-搜索-重新拟合的迭代次数
+        """
+        self._board = board
+        self._search_ratio = search_ratio
+        self._min_points = min_points
+        self._min_contrast = min_contrast
+        self._iterations = iterations
+
+        # 标定板内部的黑白格交点，四周的交点不构成棋盘格角点
+        rows, cols = np.mgrid[1:board.row_count, 1:board.col_count]
+        self._lattice_ids = np.stack([rows.ravel(), cols.ravel()], axis=1)
+        self._lattice_points = self._lattice_ids[:, ::-1].astype(np.float64) * board.grid_size
+        # 交点左上方格子为白色时，左上-右下对角为白色
+        self._lattice_parity = np.where(self._lattice_ids.sum(axis=1) % 2 == 0, 1.0, -1.0)
+
+    @staticmethod
+    def fit_board_to_img(matched_points: list[MatchedPoint]) -> np.ndarray:
+        """
+        由匹配点对拟合标定板坐标到子图坐标的仿射矩阵
+
+        :param matched_points: 匹配点对
+        :return: 2x3仿射矩阵，拟合失败时为None
+        """
+        if len(matched_points) < 3:
+            return None
+        cb_points = np.array([point.cb_point for point in matched_points], dtype=np.float64)
+        img_points = np.array([point.img_point for point in matched_points], dtype=np.float64)
+        m, inliers = cv2.estimateAffine2D(cb_points, img_points)
+        return m
+
+    @staticmethod
+    def predict_from_sequence(calib_result, img_ids: list[str], img_id: str, fits: dict = None) -> np.ndarray:
+        """
+        按拍摄顺序，由前后最近的已匹配子图预测指定子图的变换
+        插值假设子图按拍摄顺序排列且匀速拍摄，不满足时预测可能偏离整数个格子，且无法由黑白格交点发现
+
+        :param calib_result: `CalibResult`
+        :param img_ids: 按拍摄顺序排列的全部子图id
+        :param img_id: 待预测的子图id
+        :param fits: 各子图拟合结果的缓存, {img_id: 2x3仿射矩阵或None}，未命中时拟合并写入；
+            连续预测多张子图时应复用同一缓存，子图新增匹配点后需更新或删除对应项
+        :return: 预测的标定板坐标到子图坐标的2x3仿射矩阵，无可用相邻子图时为None
+        """
+        if fits is None:
+            fits = {}
+        index = img_ids.index(img_id)
+        neighbors = []
+        for candidates in (range(index - 1, -1, -1), range(index + 1, len(img_ids))):
+            for i in candidates:
+                if img_ids[i] not in fits:
+                    fits[img_ids[i]] = LatticeMatcher.fit_board_to_img(calib_result.get_matched_points(img_ids[i]))
+                m = fits[img_ids[i]]
+                if m is not None:
+                    neighbors.append((i, m))
+                    break
+        if len(neighbors) == 0:
+            return None
+        if len(neighbors) == 1:
+            return neighbors[0][1]
+        # 匀速拍摄时，按拍摄序号对前后两帧的变换进行线性插值
+        (prev_index, prev_m), (next_index, next_m) = neighbors
+        t = (index - prev_index) / (next_index - prev_index)
+        return prev_m * (1 - t) + next_m * t
+
+    def _sample(self, gray: np.ndarray, points: np.ndarray) -> np.ndarray:
+        h, w = gray.shape[0:2]
+        x = np.clip(np.round(points[:, 0]).astype(np.int64), 0, w - 1)
+        y = np.clip(np.round(points[:, 1]).astype(np.int64), 0, h - 1)
+        return gray[y, x].astype(np.float64)
+
+    def _search(self, gray: np.ndarray, m: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        h, w = gray.shape[0:2]
+        linear = m[:, 0:2]
+        # 黑白格边长在子图中的像素数
+        grid_px = self._board.grid_size * np.sqrt(abs(np.linalg.det(linear)))
+        radius = max(2, int(round(grid_px * self._search_ratio)))
+
+        # 1. 预测交点在子图中的位置，只保留搜索窗口完整位于子图内的交点
+        predicted = self._lattice_points @ linear.T + m[:, 2]
+        inside = (
+            (predicted[:, 0] >= radius) & (predicted[:, 0] < w - radius) &
+            (predicted[:, 1] >= radius) & (predicted[:, 1] < h - radius)
+        )
+        if np.count_nonzero(inside) == 0:
+            return np.empty((0, 2)), np.empty((0, 2))
+        ids = np.nonzero(inside)[0]
+
+        # 2. 在窗口内亚像素搜索棋盘格角点
+        corners = predicted[ids].astype(np.float32).reshape(-1, 1, 2)
+        corners = cv2.cornerSubPix(
+            gray, corners, (radius, radius), (-1, -1),
+            (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+        ).reshape(-1, 2).astype(np.float64)
+
+        # 3. 校验角点：在二维码白边宽度内采样四个对角方向，对角颜色应一致且与预期的黑白方向相符
+        offset = 0.5 * self._board.qr_border * self._board.qr_pixel_size
+        diag_a = np.array([offset, offset]) @ linear.T
+        diag_b = np.array([offset, -offset]) @ linear.T
+        score = (
+            self._sample(gray, corners - diag_a) + self._sample(gray, corners + diag_a) -
+            self._sample(gray, corners - diag_b) - self._sample(gray, corners + diag_b)
+        ) / 2
+        valid = (
+            (score * self._lattice_parity[ids] > self._min_contrast) &
+            (np.linalg.norm(corners - predicted[ids], axis=1) <= radius)
+        )
+        return self._lattice_points[ids[valid]], corners[valid]
+
+    def match(self, img: cv2.typing.MatLike, img_id: str, predicted_m: np.ndarray) -> list[MatchedPoint]:
+        """
+        在预测位置附近匹配黑白格交点
+
+        :param img: 子图
+        :param img_id: 图像id
+        :param predicted_m: 预测的标定板坐标到子图坐标的2x3仿射矩阵
+        :return: list[MatchedPoint]，匹配失败时为空列表
+        """
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+        m = np.asarray(predicted_m, dtype=np.float64)
+
+        cb_points, img_points = np.empty((0, 2)), np.empty((0, 2))
+        for i in range(self._iterations):
+            cb_points, img_points = self._search(gray, m)
+            if len(cb_points) < self._min_points:
+                logging.debug("lattice match {} failed, {} corners found.".format(img_id, len(cb_points)))
+                return []
+
+            # 以找到的角点重新拟合，缩小下一轮的预测误差
+            grid_px = self._board.grid_size * np.sqrt(abs(np.linalg.det(m[:, 0:2])))
+            refined, inliers = cv2.estimateAffine2D(
+                cb_points, img_points, ransacReprojThreshold=max(1.0, 0.02 * grid_px)
+            )
+            if refined is None:
+                return []
+            inliers = inliers.ravel().astype(bool)
+            cb_points, img_points = cb_points[inliers], img_points[inliers]
+            m = refined
+
+        if len(cb_points) < self._min_points:
+            return []
+
+        return [
+            MatchedPoint(img_id, cb_point, img_point)
+            for cb_point, img_point in zip(cb_points.tolist(), img_points.tolist())
+        ]
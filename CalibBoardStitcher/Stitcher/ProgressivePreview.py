@@ -0,0 +1,102 @@
+import logging
+import time
+from collections.abc import Callable
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher.CalibResult import MatchedPoint
+
+class ProgressivePreview:
+    def __init__(self,
+        callback: Callable[[cv2.typing.MatLike, float], None],
+        preview_size: int = 1024,
+        every_tiles: int = 0,
+        interval: float = 1.0
+    ):
+        """
+        拼接过程中的低分辨率预览，在全分辨率拼接的同时维护一张预览图并定期发布
+
+        :param callback: 预览回调函数，参数为 (预览图像, 进度)，进度值域[0, 100]
+        :param preview_size: 预览图长边的像素数
+        :param every_tiles: 每拼接该数量的子图发布一次预览，为0时不按数量发布
+        :param interval: 距离上次发布超过该秒数时发布预览，小于等于0时不按时间发布
+        :note: 回调函数接收到的预览图为副本，可在其他线程中使用
+        """
+        self._callback = callback
+        self._preview_size = preview_size
+        self._every_tiles = every_tiles
+        self._interval = interval
+
+        self._stitcher = None
+        self._preview_img = None
+        self._preview_scale = 1.0
+        self._tiles = 0
+        self._last_publish = 0.0
+        self._spend = 0.0
+
+    def begin(self, stitcher, board_shape: tuple[int, int, int]):
+        """
+        开始新的拼接
+
+        :param stitcher: Stitcher
+        :param board_shape: 标定板图像尺寸，同 `CalibBoardObj.img_shape`
+        """
+        board_h, board_w = board_shape[0:2]
+        self._stitcher = stitcher
+        self._preview_scale = min(1.0, self._preview_size / max(board_h, board_w))
+        self._preview_img = np.zeros(
+            (max(1, round(board_h * self._preview_scale)), max(1, round(board_w * self._preview_scale)), board_shape[2]),
+            dtype=np.uint8
+        )
+        self._tiles = 0
+        self._last_publish = time.perf_counter()
+        self._spend = 0.0
+
+    def update(self,
+        partial_img: cv2.typing.MatLike, matched_points: list[MatchedPoint], progress: float,
+        lut: np.ndarray = None
+    ):
+        """
+        将子图拼接到预览图，并在满足发布条件时发布
+
+        :param partial_img: 已拼接到全分辨率大图的子图
+        :param matched_points: 匹配点对
+        :param progress: 当前进度，值域[0, 100]
+        :param lut: 曝光补偿查找表，为空时不补偿
+        """
+        start = time.perf_counter()
+        self._stitcher.stitch_preview(self._preview_img, partial_img, matched_points, self._preview_scale, lut)
+        self._spend += time.perf_counter() - start
+        self._tiles += 1
+
+        now = time.perf_counter()
+        if (
+            (self._every_tiles > 0 and self._tiles % self._every_tiles == 0) or
+            (self._interval > 0 and now - self._last_publish >= self._interval)
+        ):
+            self.publish(progress)
+
+    def publish(self, progress: float):
+        """
+        立即发布当前预览图
+
+        :param progress: 当前进度，值域[0, 100]
+        """
+        self._last_publish = time.perf_counter()
+        self._callback(self._preview_img.copy(), progress)
+
+    def end(self):
+        """
+        结束拼接，发布最终预览图
+        """
+        self.publish(100.0)
+        logging.debug("preview spend: {}".format(self._spend))
+
+    @property
+    def preview_img(self) -> cv2.typing.MatLike:
+        return self._preview_img
+
+    @property
+    def preview_scale(self) -> float:
+        return self._preview_scale
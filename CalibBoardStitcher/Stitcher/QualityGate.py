@@ -0,0 +1,87 @@
+import logging
+
+import numpy as np
+
+from CalibBoardStitcher.CalibResult import CalibResult, QualityReport
+
+class QualityGate:
+    OFF = "off"
+    SKIP = "skip"
+    DEMOTE = "demote"
+
+    def __init__(self,
+        mode: str = DEMOTE,
+        max_rms: float = 3.0,
+        min_inlier_ratio: float = 0.75,
+        max_scale_dev: float = 0.1,
+        max_rotation_dev: float = 5.0
+    ):
+        """
+        拼接前按 `QualityReport` 筛除标定质量差的子图，在解码和仿射之前完成
+
+        :param mode: SKIP 不拼接不合格的子图；DEMOTE 将不合格的子图移至覆盖优先级最低，
+                     被合格子图完全覆盖时不解码、不仿射，否则只填补合格子图未覆盖的区域
+        :param max_rms: 重投影误差均方根上限，单位为子图像素
+        :param min_inlier_ratio: 内点比例下限
+        :param max_scale_dev: 缩放倍数相对偏差上限
+        :param max_rotation_dev: 旋转角度偏差上限，单位为度
+        """
+        if mode not in (QualityGate.SKIP, QualityGate.DEMOTE):
+            raise ValueError("unknown quality gate mode: {}".format(mode))
+        self._mode = mode
+        self._max_rms = max_rms
+        self._min_inlier_ratio = min_inlier_ratio
+        self._max_scale_dev = max_scale_dev
+        self._max_rotation_dev = max_rotation_dev
+
+    @staticmethod
+    def create(mode: str):
+        """
+        按模式名创建默认阈值的质量门限
+
+        :param mode: OFF, SKIP 或 DEMOTE
+        :return: QualityGate，OFF 时为None
+        """
+        return None if mode == QualityGate.OFF else QualityGate(mode)
+
+    def check(self, report: QualityReport) -> dict[str, list[str]]:
+        """
+        检查各子图是否合格
+
+        :param report: 质量报告
+        :return: 不合格子图id到不合格原因的映射
+        """
+        # nan(无法拟合)在比较中均为False，取反后视为不合格
+        checks = (
+            ("rms", ~(report.rms <= self._max_rms)),
+            ("inlier_ratio", ~(report.inlier_ratio >= self._min_inlier_ratio)),
+            ("scale_dev", ~(report.scale_dev <= self._max_scale_dev)),
+            ("rotation_dev", ~(report.rotation_dev <= self._max_rotation_dev))
+        )
+        failed = np.any([mask for _, mask in checks], axis=0) if len(report.img_ids) > 0 else []
+        return {
+            img_id: [name for name, mask in checks if mask[i]]
+            for i, img_id in enumerate(report.img_ids) if failed[i]
+        }
+
+    def apply(self, calib_result: CalibResult, img_ids: list[str]) -> list[str]:
+        """
+        按质量调整参与拼接的子图
+
+        :param calib_result: 标定结果
+        :param img_ids: 参与拼接的子图id，按覆盖优先级升序排列
+        :return: 调整后的子图id
+        """
+        report = QualityReport(calib_result, img_ids)
+        failed = self.check(report)
+        values = report.to_dict()
+        for img_id, reasons in failed.items():
+            logging.warning("tile {} failed quality check, {}: {}".format(
+                img_id, "skipped" if self._mode == QualityGate.SKIP else "demoted",
+                {name: values[img_id][name] for name in reasons}
+            ))
+
+        passed = [img_id for img_id in img_ids if img_id not in failed]
+        if self._mode == QualityGate.SKIP:
+            return passed
+        return [img_id for img_id in img_ids if img_id in failed] + passed
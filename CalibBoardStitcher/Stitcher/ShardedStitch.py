@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import socket
+import time
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher.CalibResult import CalibResult
+from CalibBoardStitcher.Lens import RemapCache
+from CalibBoardStitcher.Utils import read_img_size
+from .Stitcher import Stitcher
+from .TilePlanner import TilePlanner
+from .TileScheduler import TileScheduler
+from .GainCompensator import GainCompensator
+from .QualityGate import QualityGate
+
+class ShardedStitch:
+    PLAN_FILE = "plan.json"
+    INDEX_FILE = "index.json"
+
+    def __init__(self, shard_dir: str):
+        """
+        分片拼接，将大图划分为矩形区域(分片)，各分片由独立的进程或节点拼接，最后汇总为分块输出
+        进程间只通过 shard_dir 中的文件协调，shard_dir 应位于各节点均可访问的共享文件系统中
+
+        文件约定:
+        - plan.json: 拼接计划，包括分片区域及与各分片相交的子图，由 `plan` 写入
+        - {shard}.claim: 分片认领文件，以独占方式创建，拼接过程中定期刷新修改时间作为心跳
+        - {shard}.png: 分片图像
+        - {shard}.done: 分片完成标记，在分片图像写入后创建
+        - index.json: 分块输出索引，由 `assemble` 写入
+
+        :param shard_dir: 分片文件夹
+        """
+        self._shard_dir = shard_dir
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._shard_dir, name)
+
+    def _write_json(self, name: str, data: dict):
+        # 先写临时文件再替换，其他节点不会读到不完整的文件
+        tmp_path = self._path("{}.{}.tmp".format(name, os.getpid()))
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(name))
+
+    def load_plan(self) -> dict:
+        with open(self._path(self.PLAN_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def plan(self, img_dir: str, json_file: str, scale: float = 1.0, shard_size: int = 8192,
+        skip_redundant: bool = True, gain_compensation: bool = False, remap_cache_dir: str = "",
+        quality_gate: str = QualityGate.DEMOTE
+    ) -> dict:
+        """
+        生成拼接计划，已有的分片结果会被清除
+
+        :param img_dir: 子图文件夹，应为各节点均可访问的路径
+        :param json_file: 标定结果json文件，应为各节点均可访问的路径
+        :param scale: 放大系数
+        :param shard_size: 分片边长，单位为拼接后大图的像素
+        :param skip_redundant: 是否跳过被后续子图完全覆盖的子图
+        :param gain_compensation: 是否估计曝光补偿，补偿查找表写入计划，各分片使用同一组增益
+        :param remap_cache_dir: 去畸变remap网格的磁盘缓存文件夹，为空时仅缓存于内存
+        :param quality_gate: 标定质量不合格子图的处理方式，同 `stitch`
+        :return: 拼接计划
+        """
+        os.makedirs(self._shard_dir, exist_ok=True)
+        for name in os.listdir(self._shard_dir):
+            if name.startswith("shard-") or name in (self.PLAN_FILE, self.INDEX_FILE):
+                os.remove(self._path(name))
+
+        calib_result = CalibResult.load_from_file(json_file)
+        stitcher = Stitcher(calib_result.get_calib_board_obj(), calib_result.get_lens_model(), RemapCache(remap_cache_dir))
+        board_h, board_w = calib_result.get_calib_board_obj().img_size
+        height, width = round(board_h * scale), round(board_w * scale)
+
+        # 1. 全局的拼接顺序，各分片按该顺序的子序列拼接，重叠区域的覆盖关系与整体拼接一致
+        img_ids = calib_result.get_matched_img_id()
+        gate = QualityGate.create(quality_gate)
+        if gate is not None:
+            img_ids = gate.apply(calib_result, img_ids)
+        if skip_redundant:
+            img_ids = TilePlanner(stitcher).plan(calib_result, img_dir, img_ids).img_ids
+        img_ids = TileScheduler(stitcher).schedule(calib_result, img_ids, img_dir, scale)
+
+        # 2. 各子图在大图中写入的区域(外扩2像素以包含取整误差)
+        boxes = {}
+        for img_id in img_ids:
+            img_size = calib_result.get_img_size(img_id)
+            file_path = os.path.join(img_dir, img_id)
+            if img_size is None and os.path.exists(file_path):
+                img_size = read_img_size(file_path)
+            if img_size is None:
+                continue
+            box = stitcher.stitch_full_calc_wrapped_partial_box(img_size, calib_result.get_matched_points(img_id), scale)
+            boxes[img_id] = (box.left - 2, box.top - 2, box.right + 2, box.bottom + 2)
+
+        # 3. 划分分片，记录与其相交的子图
+        shards = []
+        for row, y in enumerate(range(0, height, shard_size)):
+            for col, x in enumerate(range(0, width, shard_size)):
+                w, h = min(shard_size, width - x), min(shard_size, height - y)
+                shard_ids = [
+                    img_id for img_id in img_ids if img_id in boxes and
+                    boxes[img_id][0] <= x + w - 1 and boxes[img_id][2] >= x and
+                    boxes[img_id][1] <= y + h - 1 and boxes[img_id][3] >= y
+                ]
+                shards.append({"name": "shard-{}-{}".format(row, col), "rect": [x, y, w, h], "img_ids": shard_ids})
+
+        luts = {}
+        if gain_compensation:
+            luts = {
+                img_id: lut.reshape(256, 3).tolist()
+                for img_id, lut in GainCompensator(stitcher).estimate(calib_result, img_dir, img_ids).items()
+            }
+
+        plan = {
+            "img_dir": os.path.abspath(img_dir),
+            "json_file": os.path.abspath(json_file),
+            "remap_cache_dir": os.path.abspath(remap_cache_dir) if len(remap_cache_dir) > 0 else "",
+            "scale": scale,
+            "size": [width, height],
+            "shards": shards,
+            "luts": luts
+        }
+        self._write_json(self.PLAN_FILE, plan)
+        logging.info("shard plan: {} shards of {} px, {} tiles.".format(len(shards), shard_size, len(img_ids)))
+        return plan
+
+    def _claim(self, name: str, worker_id: str, claim_timeout: float) -> bool:
+        # 以独占方式创建认领文件；认领超时(节点失联)的分片由其他节点接管
+        claim_path = self._path(name + ".claim")
+        for _ in range(2):
+            try:
+                fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(claim_path) < claim_timeout:
+                        return False
+                    # 重命名是原子操作，同时接管的节点中只有一个成功
+                    os.rename(claim_path, self._path("{}.stale.{}".format(name, worker_id)))
+                    logging.warning("shard {} claim expired, taken over by {}.".format(name, worker_id))
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(worker_id)
+            return True
+        return False
+
+    def _render(self,
+        stitcher, calib_result: CalibResult, plan: dict, shard: dict, claim_path: str, band_bytes: int
+    ):
+        x, y, w, h = shard["rect"]
+        scale = plan["scale"]
+        channels = calib_result.get_calib_board_obj().img_shape[2]
+        base_img = np.zeros((h, w, channels), dtype=np.uint8)
+        base_mask = np.zeros((h, w), dtype=np.uint8)
+        for img_id in shard["img_ids"]:
+            # 跨越多个分片的子图在同一节点上只解码一次，大图缩小时按大图分辨率缩小解码
+            img, matched_points = stitcher.read_partial(
+                os.path.join(plan["img_dir"], img_id), calib_result.get_matched_points(img_id), scale
+            )
+            if img is None:
+                continue
+            lut = plan["luts"].get(img_id)
+            if lut is not None:
+                lut = np.array(lut, dtype=np.uint8).reshape(1, 256, 3)
+            # 仿射后子图超出band_bytes时按行分段仿射，分段拼接只仿射位于当前分片内的行
+            base_img, base_mask = stitcher.stitch_full_cover(
+                base_img, base_mask, img, matched_points, scale, band_bytes, lut, (x, y)
+            )
+            try:
+                os.utime(claim_path)
+            except FileNotFoundError:
+                # 认领已被接管，继续拼接，两个节点写入的分片图像相同
+                pass
+        return base_img
+
+    def work(self,
+        worker_id: str = "", claim_timeout: float = 600.0, max_shards: int = 0, band_bytes: int = 64 * 1024 * 1024
+    ) -> int:
+        """
+        认领并拼接未完成的分片，直到没有可认领的分片；可在多个进程或节点上同时执行
+
+        :param worker_id: 节点标识，为空时使用 主机名-进程id
+        :param claim_timeout: 认领超时秒数，认领文件超过该时间未刷新时视为节点失联，分片可被其他节点接管；
+                              应大于拼接单张子图的耗时
+        :param max_shards: 最多拼接的分片数，为0时不限制
+        :param band_bytes: 单张仿射后子图(RGBA及mask)的内存上限，超出时按行分段仿射，见 `Stitcher.stitch_full_cover`；
+                           分段时只仿射位于分片内的行，跨越多个分片的大子图不会在每个分片中完整仿射一次；
+                           为0时不分段
+        :return: 本节点完成的分片数
+        """
+        worker_id = worker_id or "{}-{}".format(socket.gethostname(), os.getpid())
+        plan = self.load_plan()
+        calib_result = CalibResult.load_from_file(plan["json_file"])
+        stitcher = Stitcher(
+            calib_result.get_calib_board_obj(), calib_result.get_lens_model(), RemapCache(plan["remap_cache_dir"])
+        )
+
+        finished = 0
+        for shard in plan["shards"]:
+            if 0 < max_shards <= finished:
+                break
+            name = shard["name"]
+            if os.path.exists(self._path(name + ".done")) or not self._claim(name, worker_id, claim_timeout):
+                continue
+
+            start = time.perf_counter()
+            base_img = self._render(stitcher, calib_result, plan, shard, self._path(name + ".claim"), band_bytes)
+            tmp_path = self._path("{}.{}.tmp.png".format(name, worker_id))
+            if not cv2.imwrite(tmp_path, base_img):
+                raise RuntimeError("failed to write shard {}".format(tmp_path))
+            os.replace(tmp_path, self._path(name + ".png"))
+            with open(self._path(name + ".done"), "w", encoding="utf-8") as f:
+                f.write(worker_id)
+            finished += 1
+            logging.info("shard {} done by {}, {} tiles, spend: {}".format(
+                name, worker_id, len(shard["img_ids"]), time.perf_counter() - start
+            ))
+        return finished
+
+    def pending(self) -> list[str]:
+        """
+        :return: 尚未完成的分片名
+        """
+        return [
+            shard["name"] for shard in self.load_plan()["shards"]
+            if not os.path.exists(self._path(shard["name"] + ".done"))
+        ]
+
+    def assemble(self, export_img: str = "") -> dict:
+        """
+        汇总分片，写入分块输出索引 index.json，所有分片均需已完成
+
+        :param export_img: 额外将分片合并为一张完整大图，值为路径，为空时不合并
+        :return: 索引，包括大图尺寸 size=[w, h] 和分块列表 tiles=[{"file", "rect": [x, y, w, h]}]
+        """
+        pending = self.pending()
+        if len(pending) > 0:
+            raise RuntimeError("{} shards not finished: {}".format(len(pending), ", ".join(pending[:8])))
+
+        plan = self.load_plan()
+        index = {
+            "size": plan["size"],
+            "tiles": [{"file": shard["name"] + ".png", "rect": shard["rect"]} for shard in plan["shards"]]
+        }
+        self._write_json(self.INDEX_FILE, index)
+
+        if len(export_img) > 0:
+            width, height = plan["size"]
+            base_img = None
+            for tile in index["tiles"]:
+                x, y, w, h = tile["rect"]
+                img = cv2.imread(self._path(tile["file"]), cv2.IMREAD_UNCHANGED)
+                if img is None or img.shape[0] != h or img.shape[1] != w:
+                    raise RuntimeError("invalid shard image {}".format(tile["file"]))
+                if base_img is None:
+                    base_img = np.zeros((height, width) + img.shape[2:], dtype=img.dtype)
+                base_img[y:y + h, x:x + w] = img
+            if base_img is not None:
+                cv2.imwrite(export_img, base_img)
+        return index
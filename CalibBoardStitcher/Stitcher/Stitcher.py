@@ -1,35 +1,147 @@
 import enum
 import logging
 import math
+import mmap
 import os
+import queue
+import tempfile
+import threading
 import time
 import json
+from collections.abc import Callable
 
 import cv2.typing
 import numpy as np
 
-from CalibBoardStitcher.Elements import Box, CalibBoardObj
-from CalibBoardStitcher.Detector import QrDetector
+from CalibBoardStitcher.Elements import Box, CalibBoardObj, QrTarget, QrPayload
+from CalibBoardStitcher.Detector import QrDetector, DetectionCache
 from CalibBoardStitcher.CalibResult import MatchedPoint, CalibResult
-from CalibBoardStitcher.Utils import logging_config
+from CalibBoardStitcher.Lens import LensModel, RemapCache
+from CalibBoardStitcher.Utils import logging_config, read_img_size, MemoryBudget, ImageCache
+from .TilePlanner import TilePlanner
+from .ProgressivePreview import ProgressivePreview
+from .LatticeMatcher import LatticeMatcher
+from .TemporalTracker import TemporalTracker
+from .TileScheduler import TileScheduler
+from .GainCompensator import GainCompensator
+from .QualityGate import QualityGate
 
 class Stitcher:
-    def __init__(self, board:CalibBoardObj):
+    def __init__(self,
+        board:CalibBoardObj, lens_model: LensModel = None, remap_cache: RemapCache = None,
+        qr_detector: QrDetector = None, image_cache: ImageCache = None
+    ):
+        """
+        :param board: 标定板对象
+        :param lens_model: 镜头模型，为空时不考虑摄像头畸变
+        :param remap_cache: 去畸变与仿射融合的remap网格缓存，为空时使用内存缓存
+        :param qr_detector: 二维码检测器，为空时使用默认配置的 `QrDetector`
+        :param image_cache: 子图解码缓存，为空时使用进程内共享的缓存
+        """
         self._board = board
-        self._qr_detector = QrDetector()
+        self._qr_detector = qr_detector or QrDetector()
+        self._image_cache = image_cache or ImageCache.default()
+        self._lattice_matcher = LatticeMatcher(board)
+        self._lens_model = None
+        self._remap_cache = None
+        self.set_lens_model(lens_model, remap_cache)
 
     @property
     def board_obj(self) -> CalibBoardObj:
         return self._board
 
+    @property
+    def lens_model(self) -> LensModel:
+        return self._lens_model
+
+    @property
+    def image_cache(self) -> ImageCache:
+        return self._image_cache
+
+    def set_lens_model(self, lens_model: LensModel, remap_cache: RemapCache = None):
+        """
+        设置镜头模型，设置后子图将在同一次remap中完成去畸变和仿射变换
+
+        :param lens_model: 镜头模型，为None时不考虑摄像头畸变
+        :param remap_cache: remap网格缓存，为空时使用内存缓存
+        """
+        self._lens_model = lens_model
+        if lens_model is not None:
+            self._remap_cache = remap_cache or self._remap_cache or RemapCache()
+
+    def _src_points(self, matched_points: list[MatchedPoint]) -> np.ndarray:
+        # 设置镜头模型时，仿射变换作用于无畸变图像坐标
+        src_points = np.array([point.img_point for point in matched_points])
+        if self._lens_model is not None:
+            src_points = self._lens_model.undistort_points(src_points)
+        return src_points
+
+    def _src_outline(self, img_size: tuple[int, int]) -> np.ndarray:
+        # 子图边缘轮廓，存在畸变时边缘不再为直线，需要采样
+        partial_w, partial_h = img_size
+        if self._lens_model is not None:
+            return self._lens_model.undistort_outline(img_size)
+        return np.array(
+            [[0, 0], [partial_w - 1, 0], [partial_w - 1, partial_h - 1], [0, partial_h - 1]],
+            dtype=np.float64
+        )
+
     def detect_calib_board_cells(self):
 
         pass
 
-    def match(self, img:cv2.typing.MatLike, img_id: str) -> list[MatchedPoint]:
-        matched_points = []
+    def match(self, img:cv2.typing.MatLike, img_id: str, predicted_m: np.ndarray = None) -> list[MatchedPoint]:
+        """
+        匹配子图与标定板
+
+        :param img: 子图
+        :param img_id: 图像id
+        :param predicted_m: 预测的标定板坐标到子图坐标的2x3仿射矩阵，未找到二维码时据此匹配黑白格交点
+        :return: list[MatchedPoint]
+        """
         # 1. Try to find Qr Code.
         qr_targets = self._qr_detector.detect(img)
+        matched_points = self.match_qr_targets(qr_targets, img_id)
+        if len(matched_points) == 0 and predicted_m is not None:
+            # 2. 未找到二维码，在预测位置附近匹配黑白格交点
+            matched_points = self._lattice_matcher.match(img, img_id, predicted_m)
+        return matched_points
+
+    def match_file(self, file_path: str, img_id: str,
+        cache: DetectionCache = None, img: cv2.typing.MatLike = None
+    ) -> list[MatchedPoint]:
+        """
+        对图像文件进行匹配，命中检测缓存时不读取图像
+
+        :param file_path: 图像文件路径
+        :param img_id: 图像id
+        :param cache: 检测结果缓存，为空时不使用缓存
+        :param img: 已读取的图像，为空时按需读取
+        :return: list[MatchedPoint]
+        """
+        qr_targets = self._qr_detector.detect_file(file_path, cache, img, self._image_cache)
+        return self.match_qr_targets(qr_targets, img_id)
+
+    def match_lattice(self, img: cv2.typing.MatLike, img_id: str, predicted_m: np.ndarray) -> list[MatchedPoint]:
+        """
+        不解码二维码，仅在预测位置附近匹配黑白格交点
+
+        :param img: 子图
+        :param img_id: 图像id
+        :param predicted_m: 预测的标定板坐标到子图坐标的2x3仿射矩阵
+        :return: list[MatchedPoint]
+        """
+        return self._lattice_matcher.match(img, img_id, predicted_m)
+
+    def match_qr_targets(self, qr_targets: list[QrTarget], img_id: str) -> list[MatchedPoint]:
+        """
+        将已检测到的二维码转换为匹配点对
+
+        :param qr_targets: `QrDetector.detect` 的检测结果
+        :param img_id: 图像id
+        :return: list[MatchedPoint]
+        """
+        matched_points = []
         if len(qr_targets) > 0:
             for target in qr_targets:
                 # 1.1 获取该二维码在标准标定板中的位置
@@ -41,12 +153,69 @@ class Stitcher:
                     matched_points.append(
                         MatchedPoint(img_id, cb_point, qr_point)
                     )
-        else:
-            # TODO
-            pass
 
         return matched_points
 
+    def calc_reduce(self, matched_points: list[MatchedPoint], scale: float = 1.0) -> int:
+        """
+        计算子图可缩小解码的最大倍数，缩小后子图的一个像素在大图中仍不超过一个像素，
+        即缩小后的子图分辨率不低于大图，仿射时不会放大子图而损失细节
+
+        :param matched_points: 匹配点对
+        :param scale: 放大系数
+        :return: 1、2、4或8；存在镜头畸变模型时为1，畸变模型只适用于原分辨率坐标
+        """
+        if self._lens_model is None and len(matched_points) >= 3:
+            m = cv2.estimateAffine2D(
+                np.array([point.img_point for point in matched_points], dtype=np.float64),
+                np.array([point.cb_point for point in matched_points], dtype=np.float64)
+            )[0]
+            if m is not None:
+                # 子图的一个像素在大图中的尺寸，缩小factor倍后为 ratio * factor
+                ratio = scale * math.sqrt(abs(np.linalg.det(m[:, 0:2])))
+                for factor in (8, 4, 2):
+                    if ratio * factor <= 1.0:
+                        return factor
+        return 1
+
+    @staticmethod
+    def reduce_points(matched_points: list[MatchedPoint], reduce: int) -> list[MatchedPoint]:
+        """
+        将匹配点对的子图坐标换算到缩小解码的子图中，缩小后的像素中心位于原图对应像素块的中心
+
+        :param matched_points: 匹配点对
+        :param reduce: 缩小倍数
+        :return: 换算后的匹配点对，缩小倍数为1时为原匹配点对
+        """
+        if reduce == 1:
+            return matched_points
+        return [
+            MatchedPoint(
+                point.img_id, point.cb_point,
+                [(point.img_point[0] + 0.5) / reduce - 0.5, (point.img_point[1] + 0.5) / reduce - 0.5]
+            )
+            for point in matched_points
+        ]
+
+    def read_partial(self,
+        file_path: str, matched_points: list[MatchedPoint], scale: float = 1.0, store: bool = True
+    ) -> tuple[cv2.typing.MatLike, list[MatchedPoint]]:
+        """
+        按大图分辨率读取子图：大图缩小时以 `cv2.IMREAD_REDUCED_COLOR_*` 缩小解码，缩小倍数计入返回的匹配点对，
+        之后的仿射只处理缩小后的子图，且缩小解码对原图的像素块取平均，避免直接仿射缩小产生的混叠
+
+        :param file_path: 子图路径
+        :param matched_points: 匹配点对
+        :param scale: 放大系数
+        :param store: 是否放入解码缓存，见 `ImageCache.read`
+        :return: tuple[子图, 匹配点对]，读取失败时子图为None
+        """
+        reduce = self.calc_reduce(matched_points, scale)
+        img = self._image_cache.read(file_path, reduce, store)
+        if img is None:
+            return None, matched_points
+        return img, Stitcher.reduce_points(matched_points, reduce)
+
     class StitchMethod(enum.Enum):
         FULL_COVER = "full_cover"  # 直接将整张子图覆盖拼接，覆盖优先级为列表靠后图像覆盖靠前的图像
         GRID_COVER = "grid_cover"  # 将MatchedPoints插分为网格，然后将子图按照网格切割后覆盖拼接
@@ -54,7 +223,9 @@ class Stitcher:
     def stitch_full_gen_wrapped_partial(self,
             partial_img: cv2.typing.MatLike,
             matched_points: list[MatchedPoint],
-            scale: float = 1.0
+            scale: float = 1.0,
+            row_range: tuple[int, int] = None,
+            lut: np.ndarray = None
         ) -> tuple[cv2.typing.MatLike, Box]:
         """
         生成完整仿射变换后的子图
@@ -62,6 +233,8 @@ class Stitcher:
         :param partial_img: 待拼接的子图
         :param matched_points: 匹配点对
         :param scale: 放大系数
+        :param row_range: 只生成仿射后子图的 [起始行, 结束行) 部分，行号相对于返回的Box顶部，为空时生成完整子图
+        :param lut: 曝光补偿查找表，shape为(1, 256, 3)，仅应用于仿射后的ROI(及row_range部分)，为空时不补偿
         :return: RGBA四通道图像
         """
         # 0. 预处理数据
@@ -75,15 +248,12 @@ class Stitcher:
             partial_img = cv2.merge((b, g, r, alpha))
 
         # 1. 计算变换矩阵均值
-        src_points = np.array([point.img_point for point in matched_points])
+        src_points = self._src_points(matched_points)
         dst_points = np.array([point.cb_point for point in matched_points]) * scale
         m, inliers = cv2.estimateAffine2D(src_points, dst_points) #0.0001s
 
         # 2. 计算仿射后的图像区域，并划定ROI加速运算
-        transformed_box = Box(
-            lt=(0, 0), rt=(partial_w - 1, 0),
-            rb=(partial_w - 1, partial_h - 1), lb=(0, partial_h - 1)
-        ).warp_affine(m)
+        transformed_box = self._outline_box(self._src_outline((partial_w, partial_h)), m)
         ## 仿射后子图在大图中的ROI顶点
         pos_x1 = math.floor(min([point[0] for point in transformed_box.vertex]))
         pos_x2 = math.ceil(max([point[0] for point in transformed_box.vertex]))
@@ -99,17 +269,31 @@ class Stitcher:
 
         ## 4.2 执行仿射变换
         start = time.perf_counter()
-        partial_img = cv2.warpAffine(partial_img, m, (pos_x2 - pos_x1 + 1, pos_y2 - pos_y1 + 1))   # 0.0018s
+        dst_size = (pos_x2 - pos_x1 + 1, pos_y2 - pos_y1 + 1)
+        if row_range is not None:
+            m[1, 2] -= row_range[0]
+            dst_size = (dst_size[0], row_range[1] - row_range[0])
+        if self._lens_model is None:
+            partial_img = cv2.warpAffine(partial_img, m, dst_size)   # 0.0018s
+        else:
+            # 去畸变与仿射变换融合为一次remap
+            map1, map2 = self._remap_cache.get_maps(self._lens_model, m, dst_size)
+            partial_img = cv2.remap(partial_img, map1, map2, cv2.INTER_LINEAR)
         end = time.perf_counter()
         logging.debug("cv2.warpAffine() spend: {}".format(end - start))
 
+        ## 4.3 曝光补偿只作用于仿射后的像素，透明通道保持不变；补偿为逐通道的线性增益，与双线性插值可交换
+        if lut is not None:
+            lut = np.concatenate((lut, np.arange(256, dtype=np.uint8).reshape(1, 256, 1)), axis=2)
+            cv2.LUT(partial_img, lut, dst=partial_img)
+
         return partial_img, transformed_box
 
 
     def stitch_full_cover(self,
         base_img: cv2.typing.MatLike, base_img_mask: cv2.typing.MatLike,
         partial_img: cv2.typing.MatLike, matched_points: list[MatchedPoint],
-        scale: float = 1.0
+        scale: float = 1.0, max_patch_bytes: int = 0, lut: np.ndarray = None, offset: tuple[int, int] = (0, 0)
     ) -> tuple[cv2.typing.MatLike, cv2.typing.MatLike]:
         """
         直接将整张子图覆盖拼接到大图中
@@ -119,19 +303,34 @@ class Stitcher:
         :param partial_img: 待拼接的子图
         :param matched_points: 匹配点对
         :param scale: 放大系数
+        :param max_patch_bytes: 仿射后子图的内存上限，超出时按行分段仿射并拼接，为0时不限制
+        :param lut: 曝光补偿查找表，见 `GainCompensator`，为空时不补偿
+        :param offset: 大图左上角在完整拼接图中的坐标(x, y)，用于只拼接完整拼接图的一个区域，结果与完整拼接图对应区域一致
         :return: tuple[base, mask], 分别为拼接好的图像和mask
         """
         # 0. 获取必要参数
         base_h, base_w = base_img.shape[0:2]
+        partial_h, partial_w = partial_img.shape[0:2]
+
+        if max_patch_bytes > 0:
+            pos = self.stitch_full_calc_wrapped_partial_box((partial_w, partial_h), matched_points, scale)
+            patch_w = math.ceil(pos.right) - math.floor(pos.left) + 1
+            patch_h = math.ceil(pos.bottom) - math.floor(pos.top) + 1
+            # RGBA子图及其mask
+            band_rows = max(1, max_patch_bytes // (patch_w * 5))
+            if band_rows < patch_h:
+                return self._stitch_full_cover_bands(
+                    base_img, base_img_mask, partial_img, matched_points, scale, band_rows, lut, offset
+                )
 
         # 1. 对子图进行仿射变换
-        wrapped_partial, pos = self.stitch_full_gen_wrapped_partial(partial_img, matched_points, scale)
+        wrapped_partial, pos = self.stitch_full_gen_wrapped_partial(partial_img, matched_points, scale, lut=lut)
 
-        ## 1.1 将位置转换为整数
-        pos_l = math.floor(pos.left)
-        pos_r = math.ceil(pos.right)
-        pos_t = math.floor(pos.top)
-        pos_b = math.ceil(pos.bottom)
+        ## 1.1 将位置转换为整数，并转换到大图坐标
+        pos_l = math.floor(pos.left) - offset[0]
+        pos_r = math.ceil(pos.right) - offset[0]
+        pos_t = math.floor(pos.top) - offset[1]
+        pos_b = math.ceil(pos.bottom) - offset[1]
         ## 1.2 计算主图像ROI区域
         roi_l = max(pos_l, 0)
         roi_r = min(pos_r, base_w - 1)
@@ -144,9 +343,128 @@ class Stitcher:
         wrapped_mask_roi = wrapped_partial[roi_t - pos_t:roi_b - pos_t + 1, roi_l - pos_l:roi_r - pos_l + 1, 3]
         wrapped_mask_roi_bool = wrapped_mask_roi == 255
         base_img_roi[wrapped_mask_roi_bool] = wrapped_partial_roi[wrapped_mask_roi_bool] #0.03
+        ## 2.1 更新大图mask
+        if base_img_mask is not None:
+            base_img_mask[roi_t:roi_b + 1, roi_l:roi_r + 1][wrapped_mask_roi_bool] = 255
+
+        return base_img, base_img_mask
+
+    def _stitch_full_cover_bands(self,
+        base_img: cv2.typing.MatLike, base_img_mask: cv2.typing.MatLike,
+        partial_img: cv2.typing.MatLike, matched_points: list[MatchedPoint],
+        scale: float, band_rows: int, lut: np.ndarray = None, offset: tuple[int, int] = (0, 0)
+    ) -> tuple[cv2.typing.MatLike, cv2.typing.MatLike]:
+        # 按行分段仿射并覆盖拼接，只处理位于大图内的行
+        base_h, base_w = base_img.shape[0:2]
+        partial_h, partial_w = partial_img.shape[0:2]
+        if partial_img.shape[2] == 3:
+            # 预先添加透明通道，避免每段重复添加
+            alpha = np.full((partial_h, partial_w), 255, dtype=np.uint8)
+            partial_img = cv2.merge((*cv2.split(partial_img), alpha))
+
+        pos = self.stitch_full_calc_wrapped_partial_box((partial_w, partial_h), matched_points, scale)
+        pos_l = math.floor(pos.left) - offset[0]
+        pos_r = math.ceil(pos.right) - offset[0]
+        pos_t = math.floor(pos.top) - offset[1]
+        pos_b = math.ceil(pos.bottom) - offset[1]
+        roi_l = max(pos_l, 0)
+        roi_r = min(pos_r, base_w - 1)
+        roi_t = max(pos_t, 0)
+        roi_b = min(pos_b, base_h - 1)
+
+        for band_t in range(roi_t, roi_b + 1, band_rows):
+            band_b = min(band_t + band_rows - 1, roi_b)
+            wrapped_partial, _ = self.stitch_full_gen_wrapped_partial(
+                partial_img, matched_points, scale, (band_t - pos_t, band_b - pos_t + 1), lut
+            )
+            wrapped_mask_roi_bool = wrapped_partial[:, roi_l - pos_l:roi_r - pos_l + 1, 3] == 255
+            base_img[band_t:band_b + 1, roi_l:roi_r + 1][wrapped_mask_roi_bool] = \
+                wrapped_partial[:, roi_l - pos_l:roi_r - pos_l + 1, 0:3][wrapped_mask_roi_bool]
+            if base_img_mask is not None:
+                base_img_mask[band_t:band_b + 1, roi_l:roi_r + 1][wrapped_mask_roi_bool] = 255
 
         return base_img, base_img_mask
 
+    def stitch_preview(self,
+        preview_img: cv2.typing.MatLike,
+        partial_img: cv2.typing.MatLike, matched_points: list[MatchedPoint],
+        scale: float, lut: np.ndarray = None
+    ) -> cv2.typing.MatLike:
+        """
+        `stitch_full_cover` 的低开销版本，用于低分辨率预览
+        不生成Alpha通道，只对预览图中的ROI区域进行仿射，耗时与预览图中子图面积成正比
+
+        :param preview_img: 预览大图
+        :param partial_img: 待拼接的子图
+        :param matched_points: 匹配点对
+        :param scale: 预览图相对于标定板图像的缩放系数
+        :param lut: 曝光补偿查找表，应用于预览图中的ROI，为空时不补偿
+        :return: 拼接后的预览大图
+        """
+        preview_h, preview_w = preview_img.shape[0:2]
+        partial_h, partial_w = partial_img.shape[0:2]
+        polygon = self.stitch_full_calc_wrapped_partial_polygon((partial_w, partial_h), matched_points, scale)
+        if polygon is None:
+            return preview_img
+
+        # 1. 计算预览图中的ROI
+        roi_l = max(math.floor(polygon[:, 0].min()), 0)
+        roi_r = min(math.ceil(polygon[:, 0].max()), preview_w - 1)
+        roi_t = max(math.floor(polygon[:, 1].min()), 0)
+        roi_b = min(math.ceil(polygon[:, 1].max()), preview_h - 1)
+        if roi_r < roi_l or roi_b < roi_t:
+            return preview_img
+        roi_size = (roi_r - roi_l + 1, roi_b - roi_t + 1)
+
+        # 2. 仿射到ROI
+        src_points = self._src_points(matched_points)
+        dst_points = np.array(
+            [[point.cb_point[0] * scale - roi_l, point.cb_point[1] * scale - roi_t] for point in matched_points]
+        )
+        m, inliers = cv2.estimateAffine2D(src_points, dst_points)
+        if self._lens_model is None:
+            wrapped = cv2.warpAffine(partial_img, m, roi_size)
+        else:
+            map1, map2 = self._remap_cache.get_maps(self._lens_model, m, roi_size)
+            wrapped = cv2.remap(partial_img, map1, map2, cv2.INTER_LINEAR)
+        if lut is not None:
+            wrapped = cv2.LUT(wrapped, lut)
+
+        # 3. 以内缩的四边形作为mask进行覆盖，避免边缘黑边
+        mask = np.zeros((roi_size[1], roi_size[0]), dtype=np.uint8)
+        cv2.fillConvexPoly(mask, np.round(polygon - [roi_l, roi_t]).astype(np.int32), 255)
+        mask = cv2.erode(mask, np.ones((3, 3), dtype=np.uint8))
+        cv2.copyTo(wrapped, mask, preview_img[roi_t:roi_b + 1, roi_l:roi_r + 1])
+        return preview_img
+
+    def stitch_full_calc_wrapped_partial_polygon(self,
+            img_size: tuple[int, int],
+            matched_points: list[MatchedPoint],
+            scale: float = 1.0
+        ) -> np.ndarray:
+        """
+        计算完整仿射变换后的子图四边形顶点，与 `stitch_full_calc_wrapped_partial_box` 不同，不取外接矩形
+
+        :param img_size: 子图像尺寸, (w, h)
+        :param matched_points: 匹配点对
+        :param scale: 放大系数
+        :return: np.ndarray, shape为(4, 2)，顺序为lt, rt, rb, lb
+        """
+        partial_w, partial_h = img_size
+        src_points = self._src_points(matched_points)
+        dst_points = np.array([point.cb_point for point in matched_points]) * scale
+        m, inliers = cv2.estimateAffine2D(src_points, dst_points)
+        if m is None:
+            return None
+
+        corners = np.array(
+            [[0, 0], [partial_w - 1, 0], [partial_w - 1, partial_h - 1], [0, partial_h - 1]],
+            dtype=np.float64
+        )
+        if self._lens_model is not None:
+            corners = self._lens_model.undistort_points(corners)
+        return corners @ m[:, 0:2].T + m[:, 2]
+
     def stitch_full_calc_wrapped_partial_box(self,
             img_size: tuple[int, int],
             matched_points: list[MatchedPoint],
@@ -159,17 +477,26 @@ class Stitcher:
         :param scale: 放大系数
         :return: Box
         """
-        partial_w, partial_h = img_size
         # 1. 计算变换矩阵均值
-        src_points = np.array([point.img_point for point in matched_points])
+        src_points = self._src_points(matched_points)
         dst_points = np.array([point.cb_point for point in matched_points]) * scale
         m, inliers = cv2.estimateAffine2D(src_points, dst_points) #0.0001s
 
         # 2. 计算仿射后的图像区域，并划定ROI加速运算
+        return self._outline_box(self._src_outline(img_size), m)
+
+    @staticmethod
+    def _outline_box(outline: np.ndarray, m: np.ndarray) -> Box:
+        # 计算轮廓点仿射后的外接矩形
+        transformed = outline @ m[:, 0:2].T + m[:, 2]
+        left, top = transformed.min(axis=0).tolist()
+        right, bottom = transformed.max(axis=0).tolist()
         return Box(
-            lt=[0, 0], rt=[partial_w - 1, 0],
-            rb=[partial_w - 1, partial_h - 1], lb=[0, partial_h - 1]
-        ).warp_affine(m)
+            (left, top),
+            (right, top),
+            (right, bottom),
+            (left, bottom)
+        )
 
 
     @staticmethod
@@ -199,44 +526,80 @@ class Stitcher:
             row_count=data["row_count"],
             col_count=data["col_count"],
             qr_pixel_size=data["qr_pixel_size"],
-            qr_border=data["qr_border"]
+            qr_border=data["qr_border"],
+            payload_format=data.get("payload_format", QrPayload.JSON)
         )
         return Stitcher(board_obj)
 
-def calibration(calib_img_dir: str, export_json: str="", export_img: str=""):
+def calibration(calib_img_dir: str, export_json: str="", export_img: str="",
+    cache_dir: str="", cache_max_bytes: int=64 * 1024 * 1024,
+    undistort: bool=False, remap_cache_dir: str="", lattice_fallback: bool=False, track: bool=False,
+    tiled_detection: bool=False, detector_backend: str="wechat"
+):
     """
     执行校准
 
     :param calib_img_dir: 标定板图像文件夹
     :param export_json: 导出Json格式的校准结果，值为路径，为空不导出
     :param export_img: 导出拼接后的图像，值为路径，为空不导出
-    :return:
+    :param cache_dir: 检测结果缓存文件夹，为空不使用缓存；内容未变化的图像将跳过二维码检测
+    :param cache_max_bytes: 检测结果缓存容量上限
+    :param undistort: 是否由匹配点对估计镜头畸变，并在拼接时去畸变
+    :param remap_cache_dir: 去畸变remap网格的磁盘缓存文件夹，为空时仅缓存于内存
+    :param lattice_fallback: 对未找到二维码的子图，是否按文件名顺序由相邻子图预测位置后匹配黑白格交点；
+        文件名顺序须为拍摄顺序且匀速拍摄，否则子图可能被放置到相差整数个格子的错误位置
+    :param track: 子图为按文件名顺序连续拍摄的序列时，是否由上一帧跟踪黑白格交点，仅在跟踪失败时检测二维码
+    :param tiled_detection: 是否将每张子图切分为子块并行检测二维码，适用于包含大量二维码的高分辨率子图
+    :param detector_backend: 二维码检测后端，"wechat", "wechat-nosr", "classic" 或 "auto"，见 `QrBackend`
+    :return: CalibResult，未找到二维码时为None
     """
     stitcher = None
     base_img = None
     base_mask = None
     calib_result = None
+    cache = DetectionCache(cache_dir, cache_max_bytes) if len(cache_dir) > 0 else None
+    # 自举、标定与补充匹配多轮遍历子图，解码结果在各轮之间复用
+    image_cache = ImageCache.default()
+    # 估计畸变时需要全部匹配点对，拼接延后到标定完成后进行
+    stitch_inline = len(export_img) > 0 and not undistort
+
+    files = os.listdir(calib_img_dir)
+    # 尝试寻找图像中的二维码，并获取配置信息
+    detector = QrDetector(tiled=tiled_detection, backend=detector_backend)
+    for file in files:
+        qr_targets = detector.detect_file(os.path.join(calib_img_dir, file), cache, image_cache=image_cache)
+        if len(qr_targets) > 0:
+            stitcher = Stitcher(board=qr_targets[0].get_board_obj(), qr_detector=detector, image_cache=image_cache)
+            calib_result = CalibResult(board_obj=stitcher.board_obj)
+            break
 
-    for file in os.listdir(calib_img_dir):
-        file_path = os.path.join(calib_img_dir, file)
-        img = cv2.imread(file_path)
+    if stitcher is None:
+        logging.error("QR code not found.")
+        return
 
-        # 尝试寻找图像中的二维码，并获取配置信息
-        if stitcher is None:
-            stitcher = Stitcher.from_qr_img(img)
-            if stitcher:
-                calib_result = CalibResult(board_obj=stitcher.board_obj)
+    tracker = None
+    if track:
+        files = sorted(files)
+        tracker = TemporalTracker(stitcher)
 
     # 执行标定算法
-    for file in os.listdir(calib_img_dir):
+    for file in files:
         file_path = os.path.join(calib_img_dir, file)
-        img = cv2.imread(file_path)
-        if base_img is None:
-            base_img = np.zeros(stitcher.board_obj.img_shape, dtype=np.uint8)
-            base_mask = np.zeros(base_img.shape[0:2], dtype=np.uint8)
+        img = None
+        if stitch_inline or tracker is not None:
+            img = image_cache.read(file_path)
+        if stitch_inline:
+            if base_img is None:
+                base_img = np.zeros(stitcher.board_obj.img_shape, dtype=np.uint8)
+                base_mask = np.zeros(base_img.shape[0:2], dtype=np.uint8)
 
         start = time.perf_counter()
-        matched_points = stitcher.match(img, file) #0.1655s
+        if tracker is not None and img is not None:
+            matched_points = tracker.track(
+                img, file, detect=lambda: stitcher.match_file(file_path, file, cache, img)
+            )
+        else:
+            matched_points = stitcher.match_file(file_path, file, cache, img) #0.1655s
         end = time.perf_counter()
         logging.info("stitcher.match() spend: {}".format(end - start))
 
@@ -244,40 +607,269 @@ def calibration(calib_img_dir: str, export_json: str="", export_img: str=""):
             logging.info(matched_point)
             calib_result.add_matched_point(matched_point)
 
-        if len(export_img) > 0 and len(matched_points) > 0:
+        if len(matched_points) > 0:
+            img_size = (img.shape[1], img.shape[0]) if img is not None else read_img_size(file_path)
+            if img_size is not None:
+                calib_result.set_img_size(file, img_size)
+
+        if stitch_inline and len(matched_points) > 0:
             # 找到匹配点对，进行拼接
             start = time.perf_counter()
             base_img, base_mask = stitcher.stitch_full_cover(base_img, base_mask, img, matched_points)
             end = time.perf_counter()
             logging.info("stitcher.stitch_full_cover() spend: {}".format(end - start))
 
+    if tracker is not None:
+        logging.info("tracking stats: {}".format(tracker.stats))
+
+    # 未找到二维码的子图，按拍摄顺序由相邻子图预测位置，匹配黑白格交点
+    if lattice_fallback:
+        ordered_files = sorted(files)
+        unmatched = [file for file in ordered_files if len(calib_result.get_matched_points(file)) == 0]
+        # 每张子图只拟合一次，补充匹配成功后更新
+        fits = {}
+        for file in unmatched:
+            predicted_m = LatticeMatcher.predict_from_sequence(calib_result, ordered_files, file, fits)
+            if predicted_m is None:
+                continue
+            file_path = os.path.join(calib_img_dir, file)
+            img = image_cache.read(file_path)
+            if img is None:
+                continue
+
+            start = time.perf_counter()
+            matched_points = stitcher.match_lattice(img, file, predicted_m)
+            end = time.perf_counter()
+            logging.info("stitcher.match_lattice() spend: {}, {} points matched".format(end - start, len(matched_points)))
+
+            for matched_point in matched_points:
+                calib_result.add_matched_point(matched_point)
+            if len(matched_points) > 0:
+                fits[file] = LatticeMatcher.fit_board_to_img(matched_points)
+                calib_result.set_img_size(file, (img.shape[1], img.shape[0]))
+                if stitch_inline:
+                    base_img, base_mask = stitcher.stitch_full_cover(base_img, base_mask, img, matched_points)
+
+    if undistort:
+        lens_model = LensModel.estimate(calib_result)
+        calib_result.set_lens_model(lens_model)
+        stitcher.set_lens_model(lens_model, RemapCache(remap_cache_dir))
+        if len(export_img) > 0:
+            base_img = stitch_calib_result(stitcher, calib_result, calib_img_dir)
+
     if len(export_img) > 0:
         cv2.imwrite(export_img, base_img)
 
     if len(export_json) > 0:
         calib_result.save(export_json)
 
+    return calib_result
+
+
+def _prefetch_tiles(img_dir: str, img_ids: list[str], tile_bytes: Callable[[str, str], int],
+    budget: MemoryBudget, depth: int = 2, read: Callable[[str], cv2.typing.MatLike] = cv2.imread
+):
+    # 在后台线程中按顺序预读子图，读取前向内存预算申请该子图的工作内存，超出预算时阻塞预读
+    # 子图处理完毕(迭代至下一张)后释放其内存
+    tiles = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+
+    def load():
+        try:
+            for img_id in img_ids:
+                if stop.is_set():
+                    break
+                file_path = os.path.join(img_dir, img_id)
+                if not os.path.exists(file_path):
+                    continue
+                nbytes = tile_bytes(img_id, file_path)
+                budget.acquire(nbytes)
+                tiles.put((img_id, read(file_path), nbytes))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            tiles.put(None)
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    item = None
+    try:
+        while True:
+            item = tiles.get()
+            if item is None:
+                break
+            try:
+                yield item[0], item[1]
+            finally:
+                budget.release(item[2])
+    finally:
+        stop.set()
+        while item is not None:
+            item = tiles.get()
+            if item is not None:
+                budget.release(item[2])
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0]
+
+
+def stitch_calib_result(stitcher: Stitcher, calib_result: CalibResult, img_dir: str,
+    scale: float = 1.0, skip_redundant: bool = True, preview: ProgressivePreview = None,
+    memory_budget: int = 0, canvas_dir: str = "", gain_compensation: bool = False,
+    quality_gate: QualityGate = None
+) -> cv2.typing.MatLike:
+    """
+    按照标定结果将文件夹中的子图拼接为大图
+    子图按其在标定板上位置的Hilbert曲线顺序拼接，区域重叠的子图保持原覆盖顺序，拼接结果不变
+
+    :param stitcher: Stitcher
+    :param calib_result: 标定结果
+    :param img_dir: 子图文件夹
+    :param scale: 放大系数，小于子图分辨率时子图按大图分辨率缩小解码后再仿射，见 `Stitcher.read_partial`
+    :param skip_redundant: 是否跳过被后续子图完全覆盖的子图(不解码、不仿射)，拼接结果不变
+    :param preview: 渐进式预览，为空时不生成预览
+    :param memory_budget: 内存预算，单位字节，包括解码的子图、仿射后的子图和常驻内存的大图，为0时不限制；
+                          大图超过预算的一半时存放于canvas_dir中的临时文件，仅最近拼接的区域常驻内存
+    :param canvas_dir: 大图临时文件所在文件夹，为空时使用系统临时文件夹
+    :param gain_compensation: 是否由子图缩略图估计曝光补偿，并在拼接时以查找表应用
+    :param quality_gate: 拼接前按标定质量跳过或降低不合格子图的覆盖优先级，为空时不检查
+    :return: 拼接后的大图，大图存放于磁盘时为映射临时文件的数组
+    """
+    budget = MemoryBudget(memory_budget)
+    board_obj = calib_result.get_calib_board_obj()
+    board_h, board_w, channels = board_obj.img_shape
+    shape = (round(board_h * scale), round(board_w * scale), channels)
+    canvas_bytes = shape[0] * shape[1] * (channels + 1)
+    on_disk = memory_budget > 0 and canvas_bytes > memory_budget // 2
+    canvas_map = None
+    if on_disk:
+        # 匿名临时文件，关闭后自动删除，映射在大图释放前保持有效
+        with tempfile.TemporaryFile(dir=canvas_dir or None) as canvas_file:
+            canvas_file.truncate(canvas_bytes)
+            canvas_map = mmap.mmap(canvas_file.fileno(), canvas_bytes)
+        base_img = np.ndarray(shape, dtype=np.uint8, buffer=canvas_map)
+        base_mask = np.ndarray(shape[0:2], dtype=np.uint8, buffer=canvas_map, offset=base_img.nbytes)
+        logging.info("canvas of {} bytes mapped to disk.".format(canvas_bytes))
+    else:
+        # 大图在整个拼接过程中常驻内存
+        budget.acquire(canvas_bytes, long_lived=True)
+        base_img = np.zeros(shape, dtype=np.uint8)
+        base_mask = np.zeros(shape[0:2], dtype=np.uint8)
+
+    img_ids = calib_result.get_matched_img_id()
+    if quality_gate is not None:
+        img_ids = quality_gate.apply(calib_result, img_ids)
+    if skip_redundant:
+        plan = TilePlanner(stitcher).plan(calib_result, img_dir, img_ids)
+        img_ids = plan.img_ids
+        for box in plan.uncovered_boxes:
+            logging.warning("uncovered region: {} to {}".format(box.lt, box.rb))
+    img_ids = TileScheduler(stitcher).schedule(calib_result, img_ids, img_dir, scale)
+    luts = GainCompensator(stitcher).estimate(calib_result, img_dir, img_ids) if gain_compensation else {}
+    # 大图缩小时子图按大图分辨率缩小解码，之后的仿射、预览等均在缩小后的子图上进行
+    reduces = {img_id: stitcher.calc_reduce(calib_result.get_matched_points(img_id), scale) for img_id in img_ids}
+    file_reduces = {os.path.join(img_dir, img_id): reduce for img_id, reduce in reduces.items()}
+    # 放大拼接时单张仿射后的子图可能远大于原图，限制其大小使单张子图的工作内存不超出预算
+    max_patch_bytes = memory_budget // 8
+
+    def tile_bytes(img_id: str, file_path: str) -> int:
+        # 解码后的子图及其Alpha版本，加上仿射后的RGBA子图与mask
+        img_size = calib_result.get_img_size(img_id) or read_img_size(file_path)
+        if img_size is None:
+            return 0
+        box = stitcher.stitch_full_calc_wrapped_partial_box(img_size, calib_result.get_matched_points(img_id), scale)
+        patch_bytes = math.ceil((box.right - box.left + 1) * (box.bottom - box.top + 1)) * (channels + 2)
+        if max_patch_bytes > 0:
+            patch_bytes = min(patch_bytes, max_patch_bytes)
+        reduce = reduces[img_id]
+        return math.ceil(img_size[0] / reduce) * math.ceil(img_size[1] / reduce) * (channels * 2 + 1) + patch_bytes
+
+    if preview is not None:
+        preview.begin(stitcher, board_obj.img_shape)
+
+    # 大图存放于磁盘时，定期将写入的区域落盘并释放其常驻内存
+    flush_bytes = max(1, memory_budget // 4)
+    dirty_bytes = 0
+    def read(file_path: str) -> cv2.typing.MatLike:
+        # 受内存预算约束时，解码的子图不放入缓存，避免缓存占用超出预算
+        return stitcher.image_cache.read(file_path, file_reduces[file_path], store=memory_budget == 0)
+
+    for i, (img_id, img) in enumerate(_prefetch_tiles(img_dir, img_ids, tile_bytes, budget, read=read)):
+        if img is None:
+            continue
+        matched_points = Stitcher.reduce_points(calib_result.get_matched_points(img_id), reduces[img_id])
+        start = time.perf_counter()
+        base_img, base_mask = stitcher.stitch_full_cover(
+            base_img, base_mask, img, matched_points, scale, max_patch_bytes, luts.get(img_id)
+        )
+        end = time.perf_counter()
+        logging.info("stitcher.stitch_full_cover() spend: {}".format(end - start))
+
+        if on_disk:
+            box = stitcher.stitch_full_calc_wrapped_partial_box((img.shape[1], img.shape[0]), matched_points, scale)
+            dirty_bytes += math.ceil((box.right - box.left + 1) * (box.bottom - box.top + 1)) * (channels + 1)
+            if dirty_bytes >= flush_bytes:
+                canvas_map.flush()
+                if hasattr(mmap, "MADV_DONTNEED"):
+                    canvas_map.madvise(mmap.MADV_DONTNEED)
+                dirty_bytes = 0
+
+        if preview is not None:
+            preview.update(img, matched_points, (i + 1) * 100 / len(img_ids), luts.get(img_id))
+
+    if preview is not None:
+        preview.end()
 
-def stitch(img_dir: str, json_file: str, export_img: str=""):
+    if on_disk:
+        canvas_map.flush()
+    else:
+        budget.release(canvas_bytes, long_lived=True)
+    logging.debug("stitch memory peak: {}".format(budget.peak))
+
+    return base_img
+
+
+def stitch(img_dir: str, json_file: str, export_img: str="", remap_cache_dir: str="", scale: float=1.0,
+    skip_redundant: bool=True, preview_callback: Callable[[cv2.typing.MatLike, float], None]=None,
+    preview_size: int=1024, preview_interval: float=1.0, preview_every_tiles: int=0,
+    memory_budget: int=0, canvas_dir: str="", gain_compensation: bool=False, thumb_dir: str="",
+    quality_gate: str="demote"
+):
+    """
+    按照标定结果执行拼接
+
+    :param img_dir: 子图文件夹
+    :param json_file: 标定结果json文件
+    :param export_img: 导出拼接后的图像，值为路径，为空不导出
+    :param remap_cache_dir: 去畸变remap网格的磁盘缓存文件夹，为空时仅缓存于内存
+    :param scale: 放大系数
+    :param skip_redundant: 是否跳过被后续子图完全覆盖的子图
+    :param preview_callback: 预览回调函数，参数为 (预览图像, 进度)，进度值域[0, 100]，为空时不生成预览
+    :param preview_size: 预览图长边的像素数
+    :param preview_interval: 按时间发布预览的间隔秒数，小于等于0时不按时间发布
+    :param preview_every_tiles: 每拼接该数量的子图发布一次预览，为0时不按数量发布
+    :param memory_budget: 拼接过程的内存预算，单位字节，为0时不限制，见 `stitch_calib_result`
+    :param canvas_dir: 大图超出内存预算时存放临时文件的文件夹，为空时使用系统临时文件夹
+    :param gain_compensation: 是否对子图进行曝光补偿，消除子图间的亮度与色彩差异
+    :param thumb_dir: 子图缩略图的磁盘缓存文件夹，曝光补偿等低分辨率处理在多次拼接之间复用缩略图，为空时仅缓存于内存
+    :param quality_gate: 标定质量不合格(重投影误差大、内点少或缩放旋转与其余子图差异大)子图的处理方式，
+                         "skip" 不拼接，"demote" 降为最低覆盖优先级，"off" 不检查，见 `QualityGate`
+    """
     calib_result = CalibResult.load_from_file(json_file)
 
     board_obj = calib_result.get_calib_board_obj()
-    stitcher = Stitcher(board_obj)
-
-    base_img = np.zeros(board_obj.img_shape, dtype=np.uint8)
-    base_mask = np.zeros(base_img.shape[0:2], dtype=np.uint8)
+    image_cache = ImageCache(thumb_dir=thumb_dir) if len(thumb_dir) > 0 else None
+    stitcher = Stitcher(board_obj, calib_result.get_lens_model(), RemapCache(remap_cache_dir), image_cache=image_cache)
 
-    for img_id in calib_result.get_matched_img_id():
-        file_path = os.path.join(img_dir, img_id)
-        if not os.path.exists(file_path):
-            continue
-        img = cv2.imread(file_path)
+    preview = None
+    if preview_callback is not None:
+        preview = ProgressivePreview(preview_callback, preview_size, preview_every_tiles, preview_interval)
 
-        matched_points = calib_result.get_matched_points(img_id)
-        start = time.perf_counter()
-        base_img, base_mask = stitcher.stitch_full_cover(base_img, base_mask, img, matched_points)
-        end = time.perf_counter()
-        logging.info("stitcher.stitch_full_cover() spend: {}".format(end - start))
+    base_img = stitch_calib_result(
+        stitcher, calib_result, img_dir, scale, skip_redundant, preview, memory_budget, canvas_dir,
+        gain_compensation, QualityGate.create(quality_gate)
+    )
 
     if len(export_img) > 0:
         cv2.imwrite(export_img, base_img)
@@ -0,0 +1,135 @@
+import logging
+from collections.abc import Callable
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher.CalibResult import MatchedPoint
+from .LatticeMatcher import LatticeMatcher
+
+class TemporalTracker:
+    def __init__(self,
+        stitcher,
+        min_confidence: float = 0.6,
+        min_points: int = 3,
+        keyframe_interval: int = 0,
+        max_fb_error: float = 1.0
+    ):
+        """
+        有序拍摄序列的帧间跟踪器
+        由上一帧的标定板变换和帧间光流预测当前帧中黑白格交点的位置，在预测位置附近验证并精修，
+        仅在跟踪置信度不足时执行完整的二维码检测
+
+        :param stitcher: Stitcher
+        :param min_confidence: 最低跟踪置信度，即验证通过的交点数占预测在帧内交点数的比例
+        :param min_points: 跟踪成功所需的最少交点数
+        :param keyframe_interval: 每隔该帧数强制执行一次完整检测，为0时不强制
+        :param max_fb_error: 光流前向-后向校验允许的最大误差，单位像素
+        """
+        self._stitcher = stitcher
+        self._min_confidence = min_confidence
+        self._min_points = min_points
+        self._keyframe_interval = keyframe_interval
+        self._max_fb_error = max_fb_error
+
+        board = stitcher.board_obj
+        rows, cols = np.mgrid[1:board.row_count, 1:board.col_count]
+        self._lattice_points = np.stack([cols.ravel(), rows.ravel()], axis=1).astype(np.float64) * board.grid_size
+
+        self._prev_gray = None
+        self._prev_m = None
+        self._since_keyframe = 0
+        self._tracked = 0
+        self._detected = 0
+
+    def reset(self):
+        """
+        清除跟踪状态，下一帧将执行完整检测
+        """
+        self._prev_gray = None
+        self._prev_m = None
+
+    def _project(self, m: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+        # 标定板内部黑白格交点在子图中的位置，只保留位于子图内的交点
+        h, w = shape[0:2]
+        points = self._lattice_points @ m[:, 0:2].T + m[:, 2]
+        inside = (points[:, 0] >= 0) & (points[:, 0] < w) & (points[:, 1] >= 0) & (points[:, 1] < h)
+        return points[inside]
+
+    def _predict(self, gray: np.ndarray) -> np.ndarray:
+        # 1. 以上一帧中的黑白格交点作为光流跟踪点
+        prev_points = self._project(self._prev_m, gray.shape)
+        prev_points = prev_points.astype(np.float32).reshape(-1, 1, 2)
+        if len(prev_points) < 2:
+            return None
+
+        # 2. 前向-后向光流，剔除不可靠的跟踪点
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, prev_points, None)
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, next_points, None)
+        fb_error = np.linalg.norm((prev_points - back_points).reshape(-1, 2), axis=1)
+        valid = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < self._max_fb_error)
+        if np.count_nonzero(valid) < 2:
+            return None
+
+        # 3. 帧间运动近似为相似变换，与上一帧的变换复合得到当前帧的预测变换
+        motion, _ = cv2.estimateAffinePartial2D(prev_points[valid], next_points[valid])
+        if motion is None:
+            return None
+        return motion[:, 0:2] @ self._prev_m + np.hstack([np.zeros((2, 2)), motion[:, 2:3]])
+
+    def _confidence(self, gray: np.ndarray, m: np.ndarray, matched_points: list[MatchedPoint]) -> float:
+        expected = len(self._project(m, gray.shape))
+        return len(matched_points) / expected if expected > 0 else 0.0
+
+    def track(self,
+        img: cv2.typing.MatLike, img_id: str,
+        detect: Callable[[], list[MatchedPoint]] = None
+    ) -> list[MatchedPoint]:
+        """
+        匹配序列中的下一帧
+
+        :param img: 当前帧
+        :param img_id: 图像id
+        :param detect: 完整检测函数，返回当前帧的匹配点对，为空时使用 `Stitcher.match`
+        :return: list[MatchedPoint]
+        """
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+        matched_points = []
+        predicted_m = None
+
+        keyframe = self._keyframe_interval > 0 and self._since_keyframe >= self._keyframe_interval
+        if self._prev_m is not None and not keyframe:
+            predicted_m = self._predict(gray)
+            if predicted_m is not None:
+                matched_points = self._stitcher.match_lattice(gray, img_id, predicted_m)
+                confidence = self._confidence(gray, predicted_m, matched_points)
+                if len(matched_points) < self._min_points or confidence < self._min_confidence:
+                    logging.debug("tracking {} lost, confidence: {}".format(img_id, confidence))
+                    matched_points = []
+
+        if len(matched_points) > 0:
+            self._tracked += 1
+            self._since_keyframe += 1
+        else:
+            # 跟踪失败，执行完整检测
+            if detect is not None:
+                matched_points = detect()
+            else:
+                matched_points = self._stitcher.match(img, img_id, predicted_m)
+            self._detected += 1
+            self._since_keyframe = 0
+
+        m = LatticeMatcher.fit_board_to_img(matched_points)
+        if m is not None:
+            self._prev_gray = gray
+            self._prev_m = m
+        else:
+            self.reset()
+        return matched_points
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "tracked": self._tracked,
+            "detected": self._detected
+        }
@@ -0,0 +1,155 @@
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher.Elements import Box
+from CalibBoardStitcher.CalibResult import CalibResult
+from CalibBoardStitcher.Utils import read_img_size
+
+class TilePlan:
+    def __init__(self,
+        img_ids: list[str], skipped_img_ids: list[str],
+        uncovered_mask: cv2.typing.MatLike, plan_scale: float
+    ):
+        """
+        拼接计划
+
+        :param img_ids: 需要拼接的子图id，按覆盖优先级升序排列(靠后的覆盖靠前的)
+        :param skipped_img_ids: 被完全覆盖而无需解码和仿射的子图id
+        :param uncovered_mask: 低分辨率的未覆盖区域mask，非0表示未覆盖
+        :param plan_scale: uncovered_mask相对于标定板图像的缩放系数
+        """
+        self.img_ids = img_ids
+        self.skipped_img_ids = skipped_img_ids
+        self.uncovered_mask = uncovered_mask
+        self.plan_scale = plan_scale
+
+    @property
+    def coverage(self) -> float:
+        """
+        标定板被计划中子图覆盖的比例，值域[0, 1]
+        """
+        return 1.0 - cv2.countNonZero(self.uncovered_mask) / self.uncovered_mask.size
+
+    @property
+    def uncovered_boxes(self) -> list[Box]:
+        """
+        未覆盖区域的外接矩形，坐标为标定板图像坐标
+        """
+        boxes = []
+        nums, labels, stats, centroids = cv2.connectedComponentsWithStats(self.uncovered_mask, connectivity=8)
+        for i in range(1, nums):
+            x, y, w, h = stats[i][0:4].tolist()
+            left, top = x / self.plan_scale, y / self.plan_scale
+            right, bottom = (x + w) / self.plan_scale, (y + h) / self.plan_scale
+            boxes.append(Box((left, top), (right, top), (right, bottom), (left, bottom)))
+        return boxes
+
+
+class TilePlanner:
+    # 保持与全部子图依次覆盖拼接完全一致的结果，仅跳过被后续子图完全覆盖的子图
+    PRIORITY = "priority"
+    # 经典贪心集合覆盖，每次选择新增覆盖面积最大的子图，结果按原覆盖优先级排列
+    GREEDY = "greedy"
+
+    def __init__(self, stitcher, plan_size: int = 1024, strategy: str = PRIORITY, min_gain: int = 0):
+        """
+        拼接前的子图选择器，由各子图仿射后的区域选择覆盖整个标定板所需的最少子图
+
+        :param stitcher: Stitcher
+        :param plan_size: 规划用低分辨率mask长边的像素数
+        :param strategy: 选择策略，`TilePlanner.PRIORITY` 或 `TilePlanner.GREEDY`
+        :param min_gain: 子图新增覆盖像素数(规划分辨率下)不大于该值时跳过
+        """
+        if strategy not in (TilePlanner.PRIORITY, TilePlanner.GREEDY):
+            raise ValueError("unknown strategy: {}".format(strategy))
+        self._stitcher = stitcher
+        self._plan_size = plan_size
+        self._strategy = strategy
+        self._min_gain = min_gain
+
+    def _rasterize(self, polygon: np.ndarray, shape: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+        # 返回 (外扩mask, 内缩mask)：判断子图贡献时使用外扩mask，判断被覆盖时使用内缩mask，避免误跳过边缘细缝
+        mask = np.zeros(shape, dtype=np.uint8)
+        points = np.round(polygon).astype(np.int32)
+        cv2.fillConvexPoly(mask, points, 255)
+        inner = cv2.erode(mask, np.ones((3, 3), dtype=np.uint8))
+        cv2.polylines(mask, [points], True, 255, thickness=1)
+        return mask, inner
+
+    def plan(self, calib_result: CalibResult, img_dir: str = "", img_ids: list[str] = None) -> TilePlan:
+        """
+        生成拼接计划
+
+        :param calib_result: 标定结果
+        :param img_dir: 子图文件夹，标定结果中未记录子图尺寸时从文件头读取，且跳过不存在的文件
+        :param img_ids: 参与拼接的子图id，按覆盖优先级升序排列，为空时使用标定结果中的全部子图
+        :return: TilePlan
+        """
+        if img_ids is None:
+            img_ids = calib_result.get_matched_img_id()
+
+        board_h, board_w = calib_result.get_calib_board_obj().img_size
+        plan_scale = self._plan_size / max(board_h, board_w)
+        shape = (max(1, round(board_h * plan_scale)), max(1, round(board_w * plan_scale)))
+
+        # 1. 计算各子图在规划分辨率下的覆盖区域
+        footprints = {}
+        for img_id in img_ids:
+            file_path = os.path.join(img_dir, img_id) if len(img_dir) > 0 else ""
+            if len(file_path) > 0 and not os.path.exists(file_path):
+                continue
+            img_size = calib_result.get_img_size(img_id)
+            if img_size is None and len(file_path) > 0:
+                img_size = read_img_size(file_path)
+            matched_points = calib_result.get_matched_points(img_id)
+            if img_size is None or len(matched_points) == 0:
+                logging.warning("footprint of {} unknown, skipped.".format(img_id))
+                continue
+            polygon = self._stitcher.stitch_full_calc_wrapped_partial_polygon(img_size, matched_points, plan_scale)
+            if polygon is None:
+                continue
+            footprints[img_id] = self._rasterize(polygon, shape)
+
+        candidates = [img_id for img_id in img_ids if img_id in footprints]
+
+        # 2. 选择子图
+        covered = np.zeros(shape, dtype=np.uint8)
+        selected = set()
+        if self._strategy == TilePlanner.PRIORITY:
+            # 从覆盖优先级最高的子图开始，仍有可见区域的子图才需要拼接
+            for img_id in reversed(candidates):
+                outer, inner = footprints[img_id]
+                gain = cv2.countNonZero(cv2.bitwise_and(outer, cv2.bitwise_not(covered)))
+                if gain > self._min_gain:
+                    selected.add(img_id)
+                cv2.bitwise_or(covered, inner, dst=covered)
+        else:
+            remaining = list(candidates)
+            while len(remaining) > 0:
+                uncovered = cv2.bitwise_not(covered)
+                gains = [cv2.countNonZero(cv2.bitwise_and(footprints[img_id][0], uncovered)) for img_id in remaining]
+                best = int(np.argmax(gains))
+                if gains[best] <= self._min_gain:
+                    break
+                img_id = remaining.pop(best)
+                selected.add(img_id)
+                cv2.bitwise_or(covered, footprints[img_id][1], dst=covered)
+
+        # 3. 统计未覆盖区域
+        covered = np.zeros(shape, dtype=np.uint8)
+        for img_id in selected:
+            cv2.bitwise_or(covered, footprints[img_id][0], dst=covered)
+
+        plan = TilePlan(
+            img_ids=[img_id for img_id in candidates if img_id in selected],
+            skipped_img_ids=[img_id for img_id in img_ids if img_id not in selected],
+            uncovered_mask=cv2.bitwise_not(covered),
+            plan_scale=plan_scale
+        )
+        logging.info("tile plan: {} selected, {} skipped, coverage: {:.2%}".format(
+            len(plan.img_ids), len(plan.skipped_img_ids), plan.coverage
+        ))
+        return plan
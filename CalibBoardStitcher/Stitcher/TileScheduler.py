@@ -0,0 +1,118 @@
+import bisect
+import logging
+import os
+
+import numpy as np
+
+from CalibBoardStitcher.CalibResult import CalibResult
+from CalibBoardStitcher.Utils import read_img_size
+
+class TileScheduler:
+    def __init__(self, stitcher, curve_order: int = 16):
+        """
+        拼接顺序调度器，按子图在标定板上位置的Hilbert曲线顺序拼接，提高大图的缓存与分页局部性
+        区域有重叠的子图保持原覆盖优先级的先后顺序，拼接结果与按原顺序拼接完全一致
+
+        :param stitcher: Stitcher
+        :param curve_order: Hilbert曲线阶数，标定板被划分为 2^order x 2^order 个单元
+        """
+        self._stitcher = stitcher
+        self._curve_order = curve_order
+
+    @staticmethod
+    def hilbert_index(x: int, y: int, order: int) -> int:
+        """
+        计算单元坐标在Hilbert曲线上的序号
+
+        :param x: 单元列坐标，值域[0, 2^order)
+        :param y: 单元行坐标，值域[0, 2^order)
+        :param order: 曲线阶数
+        :return: 曲线序号
+        """
+        d = 0
+        s = 1 << (order - 1)
+        while s > 0:
+            rx = 1 if x & s else 0
+            ry = 1 if y & s else 0
+            d += s * s * ((3 * rx) ^ ry)
+            # 旋转象限
+            if ry == 0:
+                if rx == 1:
+                    x = s - 1 - x
+                    y = s - 1 - y
+                x, y = y, x
+            s >>= 1
+        return d
+
+    def schedule(self,
+        calib_result: CalibResult, img_ids: list[str], img_dir: str = "", scale: float = 1.0
+    ) -> list[str]:
+        """
+        生成拼接顺序
+
+        :param calib_result: 标定结果
+        :param img_ids: 参与拼接的子图id，按覆盖优先级升序排列(靠后的覆盖靠前的)
+        :param img_dir: 子图文件夹，标定结果中未记录子图尺寸时从文件头读取
+        :param scale: 拼接时的放大系数
+        :return: 调整顺序后的子图id；无法计算拼接区域的子图保持在原有位置之前拼接
+        """
+        board_h, board_w = calib_result.get_calib_board_obj().img_size
+
+        # 1. 计算各子图在大图中写入的区域(外接矩形，外扩2像素以包含取整误差)
+        boxes = []
+        located = []
+        unlocated = []
+        for img_id in img_ids:
+            img_size = calib_result.get_img_size(img_id)
+            if img_size is None and len(img_dir) > 0 and os.path.exists(os.path.join(img_dir, img_id)):
+                img_size = read_img_size(os.path.join(img_dir, img_id))
+            matched_points = calib_result.get_matched_points(img_id)
+            if img_size is None or len(matched_points) == 0:
+                unlocated.append(img_id)
+                continue
+            box = self._stitcher.stitch_full_calc_wrapped_partial_box(img_size, matched_points, scale)
+            boxes.append([box.left - 2, box.top - 2, box.right + 2, box.bottom + 2])
+            located.append(img_id)
+
+        if len(located) == 0:
+            return list(img_ids)
+        boxes = np.array(boxes, dtype=np.float64)
+
+        # 2. 区域中心在Hilbert曲线上的序号
+        cells = 1 << self._curve_order
+        centers = (boxes[:, 0:2] + boxes[:, 2:4]) / 2
+        cx = np.clip((centers[:, 0] / (board_w * scale) * cells).astype(np.int64), 0, cells - 1)
+        cy = np.clip((centers[:, 1] / (board_h * scale) * cells).astype(np.int64), 0, cells - 1)
+        keys = [self.hilbert_index(int(x), int(y), self._curve_order) for x, y in zip(cx, cy)]
+
+        # 3. 区域重叠的子图之间，覆盖优先级低的必须先拼接
+        successors = [[] for _ in located]
+        in_degree = np.zeros(len(located), dtype=np.int64)
+        for i in range(len(located)):
+            later = np.arange(i + 1, len(located))
+            overlap = (
+                (boxes[later, 0] <= boxes[i, 2]) & (boxes[later, 2] >= boxes[i, 0]) &
+                (boxes[later, 1] <= boxes[i, 3]) & (boxes[later, 3] >= boxes[i, 1])
+            )
+            successors[i] = later[overlap].tolist()
+            in_degree[later[overlap]] += 1
+
+        # 4. 拓扑排序，每次从可拼接的子图中选择曲线上紧随上一张的子图
+        ready = sorted((keys[i], i) for i in range(len(located)) if in_degree[i] == 0)
+        order = []
+        last_key = -1
+        while len(ready) > 0:
+            pos = bisect.bisect_left(ready, (last_key, -1))
+            if pos >= len(ready):
+                pos = 0
+            key, i = ready.pop(pos)
+            order.append(i)
+            last_key = key
+            for j in successors[i]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    bisect.insort(ready, (keys[j], j))
+
+        jumps = sum(1 for a, b in zip(order, order[1:]) if keys[b] < keys[a])
+        logging.info("tile schedule: {} tiles, {} curve restarts".format(len(order), jumps))
+        return unlocated + [located[i] for i in order]
@@ -1 +1,8 @@
-from .Stitcher import Stitcher
\ No newline at end of file
+from .Stitcher import Stitcher, calibration, stitch, stitch_calib_result
+from .TilePlanner import TilePlanner, TilePlan
+from .ProgressivePreview import ProgressivePreview
+from .TemporalTracker import TemporalTracker
+from .TileScheduler import TileScheduler
+from .GainCompensator import GainCompensator
+from .ShardedStitch import ShardedStitch
+from .QualityGate import QualityGate
\ No newline at end of file
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import os
+import time
+from collections.abc import AsyncIterable, Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher.Elements import CalibBoardObj
+from CalibBoardStitcher.Detector import QrDetector
+from CalibBoardStitcher.CalibResult import CalibResult
+from CalibBoardStitcher.Stitcher import Stitcher
+from CalibBoardStitcher.Utils import logging_config
+
+class FileReplaySource:
+    def __init__(self, img_dir: str, fps: float = 0.0, loop: bool = False):
+        """
+        从文件夹回放图像帧，用于在没有摄像头时模拟帧流
+
+        :param img_dir: 图像文件夹，按文件名排序回放
+        :param fps: 回放帧率，小于等于0时不限速；不限速回放时 `StreamCalibrator.run` 默认等待检测而不丢帧
+        :param loop: 是否循环回放
+        """
+        self._img_dir = img_dir
+        self._fps = fps
+        self._loop = loop
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        files = sorted(os.listdir(self._img_dir))
+        while True:
+            for file in files:
+                start = time.perf_counter()
+                img = await loop.run_in_executor(None, cv2.imread, os.path.join(self._img_dir, file))
+                if img is None:
+                    continue
+                yield file, img
+                if self._fps > 0:
+                    await asyncio.sleep(max(0.0, 1.0 / self._fps - (time.perf_counter() - start)))
+            if not self._loop:
+                break
+
+
+class StreamCalibrator:
+    def __init__(self,
+        board: CalibBoardObj = None,
+        max_workers: int = None,
+        max_pending: int = None,
+        coverage_size: int = 512
+    ):
+        """
+        帧流标定器，在采集过程中持续将新帧标定并加入 `CalibResult`
+
+        :param board: 标定板对象，为空时从首个检测到的二维码中获取
+        :param max_workers: 检测线程数，为空时使用CPU核心数
+        :param max_pending: 允许同时检测的最大帧数，超出时新到达的帧将被丢弃，为空时与max_workers相同
+        :param coverage_size: 覆盖率mask长边的像素数
+        """
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._max_pending = max_pending or self._max_workers
+        self._coverage_size = coverage_size
+        self._executor = None
+        self._detector = QrDetector()
+
+        self._stitcher = None
+        self._calib_result = None
+        self._coverage_mask = None
+        self._coverage_scale = 1.0
+        if board is not None:
+            self._init_board(board)
+
+        self._pending = 0
+        self._received = 0
+        self._processed = 0
+        self._dropped = 0
+
+    def _init_board(self, board: CalibBoardObj):
+        self._stitcher = Stitcher(board)
+        self._calib_result = CalibResult(board_obj=board)
+        board_h, board_w = board.img_size
+        self._coverage_scale = self._coverage_size / max(board_h, board_w)
+        self._coverage_mask = np.zeros(
+            (max(1, round(board_h * self._coverage_scale)), max(1, round(board_w * self._coverage_scale))),
+            dtype=np.uint8
+        )
+
+    def _detect(self, img: cv2.typing.MatLike):
+        # QrDetector在每个检测线程中各自加载一份模型
+        return self._detector.detect(img)
+
+    def _on_detected(self, frame_id: str, img_size: tuple[int, int], qr_targets: list) -> int:
+        if self._stitcher is None:
+            if len(qr_targets) == 0:
+                return 0
+            self._init_board(qr_targets[0].get_board_obj())
+
+        matched_points = self._stitcher.match_qr_targets(qr_targets, frame_id)
+        for matched_point in matched_points:
+            self._calib_result.add_matched_point(matched_point)
+
+        if len(matched_points) > 0:
+            polygon = self._stitcher.stitch_full_calc_wrapped_partial_polygon(
+                img_size, matched_points, self._coverage_scale
+            )
+            if polygon is not None:
+                cv2.fillConvexPoly(self._coverage_mask, np.round(polygon).astype(np.int32), 255)
+        return len(matched_points)
+
+    async def _process(self, frame_id: str, img: cv2.typing.MatLike,
+        on_update: Callable[[str, int, float], None]
+    ):
+        loop = asyncio.get_running_loop()
+        try:
+            qr_targets = await loop.run_in_executor(self._executor, self._detect, img)
+            matched_nums = self._on_detected(frame_id, (img.shape[1], img.shape[0]), qr_targets)
+            self._processed += 1
+            if on_update:
+                on_update(frame_id, matched_nums, self.coverage)
+        except Exception as e:
+            logging.error("process frame {} failed, msg: {}".format(frame_id, str(e)))
+        finally:
+            self._pending -= 1
+
+    @staticmethod
+    async def _iter_source(source):
+        if isinstance(source, asyncio.Queue):
+            # 队列以None作为结束标志
+            while True:
+                frame = await source.get()
+                if frame is None:
+                    break
+                yield frame
+        elif isinstance(source, AsyncIterable):
+            async for frame in source:
+                yield frame
+        elif isinstance(source, Iterable):
+            # 同步迭代器可能阻塞(如摄像头读取)，放到默认线程池中取帧
+            loop = asyncio.get_running_loop()
+            iterator = iter(source)
+            end = object()
+            while True:
+                frame = await loop.run_in_executor(None, next, iterator, end)
+                if frame is end:
+                    break
+                yield frame
+        else:
+            raise TypeError("unsupported frame source: {}".format(type(source)))
+
+    async def run(self,
+        source,
+        target_coverage: float = 1.0,
+        drop_frames: bool = None,
+        on_update: Callable[[str, int, float], None] = None
+    ) -> CalibResult:
+        """
+        从帧源中持续读取帧并执行标定
+
+        :param source: 帧源，可为 `asyncio.Queue` (以None结束)、异步迭代器或同步迭代器，元素为 (frame_id, img)
+        :param target_coverage: 覆盖率达到该值后停止读取，值域[0, 1]
+        :param drop_frames: 检测繁忙时是否丢弃新帧，为False时阻塞读取直到有空闲检测线程；
+            为空时对 `FileReplaySource` 不丢帧(回放没有实时要求，且不限速回放几乎会丢弃全部帧)，对其他帧源丢帧
+        :param on_update: 每帧处理完成后的回调，参数为 (frame_id, 匹配点数, 当前覆盖率)
+        :return: CalibResult，当帧流中未找到二维码时为None
+        """
+        if drop_frames is None:
+            drop_frames = not isinstance(source, FileReplaySource)
+        tasks = set()
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        try:
+            async for frame_id, img in self._iter_source(source):
+                self._received += 1
+                if self._pending >= self._max_pending:
+                    if drop_frames:
+                        # 检测跟不上采集速度，丢弃当前帧
+                        self._dropped += 1
+                        logging.debug("frame {} dropped.".format(frame_id))
+                        continue
+                    # 等待空闲检测线程
+                    while self._pending >= self._max_pending:
+                        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+                self._pending += 1
+                task = asyncio.create_task(self._process(frame_id, img, on_update))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+                if self.coverage >= target_coverage:
+                    break
+
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        return self._calib_result
+
+    @property
+    def calib_result(self) -> CalibResult:
+        return self._calib_result
+
+    @property
+    def coverage(self) -> float:
+        """
+        标定板被已匹配帧覆盖的比例，值域[0, 1]
+        """
+        if self._coverage_mask is None:
+            return 0.0
+        return cv2.countNonZero(self._coverage_mask) / self._coverage_mask.size
+
+    @property
+    def coverage_mask(self) -> cv2.typing.MatLike:
+        """
+        低分辨率覆盖率mask，非0表示已覆盖
+        """
+        return self._coverage_mask
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "received": self._received,
+            "processed": self._processed,
+            "dropped": self._dropped,
+            "pending": self._pending
+        }
+
+
+def main():
+    logging_config()
+    calibrator = StreamCalibrator()
+    result = asyncio.run(calibrator.run(
+        FileReplaySource("./temp/frames", fps=10),
+        target_coverage=0.95,
+        on_update=lambda frame_id, nums, coverage: logging.info(
+            "frame: {}, matched: {}, coverage: {:.2%}".format(frame_id, nums, coverage)
+        )
+    ))
+    logging.info(calibrator.stats)
+    if result:
+        result.save("./temp/stream.json")
+
+if __name__ == "__main__":
+    main()
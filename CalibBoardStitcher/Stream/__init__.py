@@ -0,0 +1 @@
+from .StreamCalibrator import StreamCalibrator, FileReplaySource
\ No newline at end of file
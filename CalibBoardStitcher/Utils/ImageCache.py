@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+class ImageCache:
+    _REDUCED_FLAGS = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8
+    }
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, thumb_dir: str = "", max_disk_bytes: int = 1024 * 1024 * 1024):
+        """
+        解码后子图的内存缓存，键为 (文件路径, 修改时间, 文件大小, 缩小倍数)，按字节数限制容量
+        同一进程内重复读取同一子图(如标定的多轮遍历、服务中的多次拼接)时不再重复解码
+
+        :param max_bytes: 内存缓存容量上限，超出时按最近最少使用淘汰，为0时不缓存
+        :param thumb_dir: 缩小解码的子图(缩略图)的磁盘缓存文件夹，以无损PNG保存，为空时仅缓存于内存
+        :param max_disk_bytes: 磁盘缓存容量上限，超出时按最近使用时间淘汰(源文件修改后旧的缩略图不再命中，由淘汰清理)
+        :note: 返回的图像为只读数组，由所有读取方共享，需要修改时应先复制
+        """
+        self._max_bytes = max_bytes
+        self._thumb_dir = thumb_dir
+        self._max_disk_bytes = max_disk_bytes
+        self._bytes = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        if len(thumb_dir) > 0:
+            os.makedirs(thumb_dir, exist_ok=True)
+
+    @staticmethod
+    def default():
+        """
+        进程内共享的缓存，未指定缓存的 `Stitcher` 均使用该缓存
+
+        :return: ImageCache
+        """
+        with ImageCache._default_lock:
+            if ImageCache._default is None:
+                ImageCache._default = ImageCache()
+            return ImageCache._default
+
+    @staticmethod
+    def make_key(file_path: str, reduce: int = 1) -> str:
+        """
+        计算缓存键，文件内容变化(修改时间或大小变化)后键随之变化
+
+        :param file_path: 图像文件路径
+        :param reduce: 解码时的缩小倍数
+        :return: str，文件不存在时为None
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(os.path.abspath(file_path).encode("utf-8"))
+        digest.update(np.array([stat.st_mtime_ns, stat.st_size, reduce], dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def _decode(self, file_path: str, key: str, reduce: int) -> cv2.typing.MatLike:
+        thumb_path = os.path.join(self._thumb_dir, key + ".png") if len(self._thumb_dir) > 0 and reduce > 1 else ""
+        if len(thumb_path) > 0 and os.path.exists(thumb_path):
+            img = cv2.imread(thumb_path, cv2.IMREAD_UNCHANGED)
+            if img is not None:
+                # 以修改时间记录最近使用时间，atime在多数文件系统上不更新
+                try:
+                    os.utime(thumb_path)
+                except OSError:
+                    pass
+                return img
+            logging.warning("load thumbnail cache {} failed.".format(thumb_path))
+
+        try:
+            img = cv2.imread(file_path, self._REDUCED_FLAGS[reduce])
+        except cv2.error:
+            # 边长小于缩小倍数的图像无法缩小解码，解码原图后缩小，边长至少为1
+            img = cv2.imread(file_path, cv2.IMREAD_COLOR)
+            if img is not None:
+                h, w = img.shape[0:2]
+                img = cv2.resize(img, (max(1, w // reduce), max(1, h // reduce)), interpolation=cv2.INTER_AREA)
+        if img is not None and len(thumb_path) > 0:
+            # 先写入临时文件再重命名，避免并发读取到不完整的文件
+            tmp_path = "{}.{}.{}.tmp.png".format(thumb_path[:-4], os.getpid(), threading.get_ident())
+            try:
+                written = cv2.imwrite(tmp_path, img)
+            except cv2.error:
+                written = False
+            if written:
+                os.replace(tmp_path, thumb_path)
+                self._evict_disk()
+            else:
+                logging.warning("save thumbnail cache {} failed.".format(thumb_path))
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+        return img
+
+    def _evict_disk(self):
+        # 磁盘缓存超出容量时按修改时间淘汰至容量上限的90%，避免每次写入都触发淘汰；可能与其他进程同时淘汰
+        entries = []
+        total = 0
+        for name in os.listdir(self._thumb_dir):
+            if not name.endswith(".png") or name.endswith(".tmp.png"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self._thumb_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+        if total <= self._max_disk_bytes:
+            return
+
+        target = self._max_disk_bytes * 0.9
+        evicted = 0
+        for _, size, name in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(os.path.join(self._thumb_dir, name))
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        logging.debug("thumbnail cache evicted {} files.".format(evicted))
+
+    def read(self, file_path: str, reduce: int = 1, store: bool = True) -> cv2.typing.MatLike:
+        """
+        读取图像，未命中时解码并缓存
+
+        :param file_path: 图像文件路径
+        :param reduce: 缩小倍数，可选1、2、4、8，使用 `cv2.IMREAD_REDUCED_COLOR_*` 解码，结果与直接解码一致
+        :param store: 未命中时是否放入内存缓存，为False时仅查询缓存(如受内存预算约束的拼接)
+        :return: 只读的BGR图像，读取失败时为None
+        """
+        key = ImageCache.make_key(file_path, reduce)
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                self._hits += 1
+                return self._images[key]
+            self._misses += 1
+
+        img = self._decode(file_path, key, reduce)
+        if img is None:
+            return None
+        img.flags.writeable = False
+        if not store or img.nbytes > self._max_bytes:
+            return img
+
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = img
+                self._bytes += img.nbytes
+            while self._bytes > self._max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return img
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: 命中统计, {"hits", "misses", "bytes", "count"}
+        """
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "bytes": self._bytes, "count": len(self._images)}
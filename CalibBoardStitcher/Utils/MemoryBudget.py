@@ -0,0 +1,58 @@
+import threading
+
+class MemoryBudget:
+    def __init__(self, max_bytes: int = 0):
+        """
+        跨线程共享的内存预算，超出预算时阻塞申请方(背压)
+
+        :param max_bytes: 预算上限，单位字节，为0时不限制
+        :note: 单次申请超过剩余预算时，等待其他短期占用全部释放后放行；长期占用(如常驻内存的大图)不会释放，
+               不参与该判断，避免死锁
+        """
+        self._max_bytes = max_bytes
+        self._used = 0
+        self._long_lived = 0
+        self._peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int, long_lived: bool = False):
+        """
+        申请内存，超出预算时阻塞直到有足够的内存被释放
+
+        :param nbytes: 申请的字节数
+        :param long_lived: 是否为长期占用，长期占用在其他申请等待期间不会释放
+        """
+        with self._cond:
+            if self._max_bytes > 0:
+                self._cond.wait_for(
+                    lambda: self._used == self._long_lived or self._used + nbytes <= self._max_bytes
+                )
+            self._used += nbytes
+            if long_lived:
+                self._long_lived += nbytes
+            self._peak = max(self._peak, self._used)
+
+    def release(self, nbytes: int, long_lived: bool = False):
+        """
+        释放内存
+
+        :param nbytes: 释放的字节数，应与申请时一致
+        :param long_lived: 应与申请时一致
+        """
+        with self._cond:
+            self._used -= nbytes
+            if long_lived:
+                self._long_lived -= nbytes
+            self._cond.notify_all()
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    @property
+    def peak(self) -> int:
+        return self._peak
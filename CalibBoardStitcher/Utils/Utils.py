@@ -5,3 +5,19 @@ def logging_config():
         level=logging.INFO,
         format='[%(levelname)s] %(filename)s.%(lineno)d: %(message)s'
     )
+
+def read_img_size(file_path: str) -> tuple[int, int]:
+    """
+    只读取文件头获取图像尺寸，不解码图像
+
+    :param file_path: 图像文件路径
+    :return: 图像尺寸(w, h)，读取失败时为None
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(file_path) as img:
+            return img.size
+    except Exception as e:
+        logging.error("read image size failed, msg: " + str(e))
+        return None
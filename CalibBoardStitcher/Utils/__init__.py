@@ -1 +1,3 @@
-from .Utils import logging_config
\ No newline at end of file
+from .Utils import logging_config, read_img_size
+from .MemoryBudget import MemoryBudget
+from .ImageCache import ImageCache
\ No newline at end of file
@@ -1,24 +1,48 @@
+import importlib
 import os
+import sys
+import types
 from pathlib import Path
-from .CalibResult import MatchedPoint, CalibResult
-from .Detector import QrDetector
-from .Elements import Box, CalibBoardObj, QrObj, QrTarget
-from .Generator import BoardGenerator, QrGenerator
-from .Stitcher import Stitcher
-from .weights import *
 
-__all__ = (
-    'MatchedPoint',
-    'CalibResult',
-    'QrDetector',
-    'Box',
-    'CalibBoardObj',
-    'QrObj',
-    'QrTarget',
-    'BoardGenerator',
-    'QrGenerator',
-    'Stitcher'
-)
+# 子包在首次访问对应属性时才导入，避免 `import CalibBoardStitcher` 时加载全部依赖
+_LAZY_ATTRS = {
+    'MatchedPoint': '.CalibResult',
+    'CalibResult': '.CalibResult',
+    'QrDetector': '.Detector',
+    'Box': '.Elements',
+    'CalibBoardObj': '.Elements',
+    'QrObj': '.Elements',
+    'QrPayload': '.Elements',
+    'QrTarget': '.Elements',
+    'BoardGenerator': '.Generator',
+    'QrGenerator': '.Generator',
+    'Stitcher': '.Stitcher',
+    'StreamCalibrator': '.Stream',
+    'FileReplaySource': '.Stream',
+    'StitchService': '.Service',
+    'ServiceClient': '.Service'
+}
+
+__all__ = tuple(_LAZY_ATTRS.keys())
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRS:
+        value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY_ATTRS.keys()))
+
+class _LazyPackage(types.ModuleType):
+    def __setattr__(self, name: str, value):
+        # 导入子包时导入系统会将子包模块设置为本包属性，此时保持同名导出类(如CalibResult、Stitcher)不被覆盖
+        if name in _LAZY_ATTRS and isinstance(value, types.ModuleType):
+            value = getattr(value, name, value)
+        super().__setattr__(name, value)
+
+sys.modules[__name__].__class__ = _LazyPackage
 
 def get_hook_dirs():
     return [str(os.path.join(Path(__file__).parent, "hooks"))]
@@ -0,0 +1,106 @@
+import argparse
+import logging
+import os
+import sys
+
+from CalibBoardStitcher.Utils import logging_config
+
+def _batch(args) -> int:
+    from CalibBoardStitcher.Batch import BatchRunner, load_manifest
+
+    jobs = load_manifest(args.manifest)
+    progress_file = args.progress or args.manifest + ".progress"
+    if args.restart and os.path.exists(progress_file):
+        os.remove(progress_file)
+
+    status = BatchRunner(jobs, progress_file, args.workers).run()
+    failed = [job_id for job_id, value in status.items() if value == "failed"]
+    logging.info("{} jobs finished, {} failed.".format(len(status) - len(failed), len(failed)))
+    return 1 if len(failed) > 0 else 0
+
+def _serve(args) -> int:
+    import asyncio
+    from CalibBoardStitcher.Service import StitchService
+
+    asyncio.run(StitchService(args.host, args.port, args.workers, allowed_hosts=args.allow_host).serve())
+    return 0
+
+def _shard_work(shard_dir: str, worker_id: str, claim_timeout: float, band_bytes: int) -> int:
+    from CalibBoardStitcher.Stitcher import ShardedStitch
+
+    logging_config()
+    return ShardedStitch(shard_dir).work(worker_id, claim_timeout, band_bytes=band_bytes)
+
+def _shard(args) -> int:
+    from CalibBoardStitcher.Stitcher import ShardedStitch
+
+    sharded = ShardedStitch(args.shard_dir)
+    if args.action == "plan":
+        sharded.plan(
+            args.img_dir, args.json_file, args.scale, args.shard_size, not args.keep_redundant,
+            args.gain_compensation, args.remap_cache_dir, args.quality_gate
+        )
+    elif args.action == "work":
+        if args.workers > 1:
+            # 本地多进程，每个进程等同于一个独立节点
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                futures = [
+                    executor.submit(
+                        _shard_work, args.shard_dir,
+                        "{}.{}".format(args.worker_id, i) if len(args.worker_id) > 0 else "", args.claim_timeout,
+                        args.band_mb * 1024 * 1024
+                    )
+                    for i in range(args.workers)
+                ]
+                finished = sum(future.result() for future in futures)
+        else:
+            finished = sharded.work(args.worker_id, args.claim_timeout, band_bytes=args.band_mb * 1024 * 1024)
+        logging.info("{} shards finished, {} pending.".format(finished, len(sharded.pending())))
+    else:
+        sharded.assemble(args.export_img)
+    return 0
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="calib-board-stitcher", description="Calibration board stitching tool.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="run calibration and stitch jobs listed in a manifest")
+    batch.add_argument("manifest", help="json manifest, see docs for format")
+    batch.add_argument("-j", "--workers", type=int, default=None, help="worker processes, defaults to cpu count")
+    batch.add_argument("--progress", default="", help="progress file, defaults to <manifest>.progress")
+    batch.add_argument("--restart", action="store_true", help="ignore previous progress and rerun all jobs")
+    batch.set_defaults(func=_batch)
+
+    serve = subparsers.add_parser("serve", help="run a local service that queues calibration, stitch and render jobs")
+    serve.add_argument("--host", default="127.0.0.1", help="listen address, defaults to localhost only")
+    serve.add_argument("--port", type=int, default=8765, help="listen port")
+    serve.add_argument("-j", "--workers", type=int, default=None, help="worker threads, defaults to cpu count")
+    serve.add_argument("--allow-host", action="append", default=[], help="extra Host name accepted besides localhost, repeatable")
+    serve.set_defaults(func=_serve)
+
+    shard = subparsers.add_parser("shard", help="stitch one board split into shards, coordinated through a shared folder")
+    shard.add_argument("action", choices=["plan", "work", "assemble"], help="plan once, then run work on any number of nodes, then assemble")
+    shard.add_argument("shard_dir", help="shared folder for plan, claims and shard images")
+    shard.add_argument("--img-dir", default="", help="plan: tile image folder, must be reachable from all nodes")
+    shard.add_argument("--json-file", default="", help="plan: calibration result json")
+    shard.add_argument("--scale", type=float, default=1.0, help="plan: stitch scale")
+    shard.add_argument("--shard-size", type=int, default=8192, help="plan: shard edge length in output pixels")
+    shard.add_argument("--keep-redundant", action="store_true", help="plan: also stitch tiles fully covered by later tiles")
+    shard.add_argument("--gain-compensation", action="store_true", help="plan: estimate exposure compensation shared by all shards")
+    shard.add_argument("--remap-cache-dir", default="", help="plan: disk cache folder for undistortion remap grids")
+    shard.add_argument("--quality-gate", choices=["off", "skip", "demote"], default="demote", help="plan: handling of poorly calibrated tiles")
+    shard.add_argument("-j", "--workers", type=int, default=1, help="work: local worker processes")
+    shard.add_argument("--worker-id", default="", help="work: node id, defaults to <hostname>-<pid>")
+    shard.add_argument("--claim-timeout", type=float, default=600.0, help="work: seconds before a silent node's shard is taken over")
+    shard.add_argument("--band-mb", type=int, default=64, help="work: warp tiles larger than this in row bands, only rows inside the shard are warped")
+    shard.add_argument("--export-img", default="", help="assemble: also merge shards into one image")
+    shard.set_defaults(func=_shard)
+
+    args = parser.parse_args(argv)
+    logging_config()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
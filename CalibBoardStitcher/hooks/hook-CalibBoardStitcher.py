@@ -1,3 +1,5 @@
-from PyInstaller.utils.hooks import collect_data_files
+from PyInstaller.utils.hooks import collect_data_files, collect_submodules
 
 datas = collect_data_files("CalibBoardStitcher.weights")
+# 子包为延迟导入，无法被静态分析发现
+hiddenimports = collect_submodules("CalibBoardStitcher")
@@ -4,6 +4,7 @@ setup(
     name='CalibBoardStitcher',
     version='0.1',
     packages=find_packages(),
+    python_requires='>=3.10',
     package_dir={'CalibBoardStitcher': 'CalibBoardStitcher'},
     package_data={
         'CalibBoardStitcher': [
@@ -15,6 +16,9 @@ setup(
     entry_points={
         "pyinstaller40": [
             "hook-dirs = CalibBoardStitcher:get_hook_dirs"
+        ],
+        "console_scripts": [
+            "calib-board-stitcher = CalibBoardStitcher.__main__:main"
         ]
     },
     install_requires=[
@@ -0,0 +1,31 @@
+import cv2
+import numpy as np
+import pytest
+
+from CalibBoardStitcher import CalibBoardObj, BoardGenerator
+
+
+@pytest.fixture(scope="session")
+def small_board() -> tuple[CalibBoardObj, np.ndarray]:
+    # 3行4列的标定板及其图像，二维码位于 (0,0), (0,2), (1,1), (1,3), (2,0), (2,2)
+    board = CalibBoardObj(3, 4)
+    return board, BoardGenerator().gen_img(board)
+
+
+def warp_tile(board_img: np.ndarray, m: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+    """
+    由标定板图像生成子图
+
+    :param board_img: 标定板图像
+    :param m: 标定板坐标到子图坐标的2x3仿射矩阵
+    :param size: 子图尺寸, (w, h)
+    """
+    return cv2.warpAffine(board_img, np.asarray(m, dtype=np.float64), size, borderValue=(255, 255, 255))
+
+
+def project(board: CalibBoardObj, rid: int, cid: int, m: np.ndarray) -> np.ndarray:
+    """
+    :return: 二维码顶点在子图中的真实坐标，顺序同 `Box.vertex`
+    """
+    vertex = np.array(board.calc_qr_box(rid, cid).vertex, dtype=np.float64)
+    return vertex @ np.asarray(m)[:, 0:2].T + np.asarray(m)[:, 2]
@@ -0,0 +1,18 @@
+import json
+
+import pytest
+
+from CalibBoardStitcher.Batch import load_manifest
+
+
+@pytest.mark.parametrize("job, message", [
+    ({"img_dir": "tiles"}, "job #0"),
+    ({"id": "board0", "img_dir": "tiles"}, "board0"),
+    ("stitch", "job #0"),
+    ({"type": "stitch", "img_dir": 5, "json_file": "a.json"}, "img_dir")
+])
+def test_invalid_job_names_the_job(tmp_path, job, message):
+    manifest = tmp_path / "jobs.json"
+    manifest.write_text(json.dumps({"jobs": [job]}), encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        load_manifest(str(manifest))
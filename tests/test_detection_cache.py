@@ -0,0 +1,94 @@
+import threading
+import time
+
+from CalibBoardStitcher.Detector import DetectionCache, QrDetector
+from CalibBoardStitcher.Elements import Box
+
+
+def _payloads(i: int) -> list[tuple[Box, str]]:
+    return [(Box([i, 0], [i + 10, 0], [i + 10, 10], [i, 10]), "payload-{}".format(i))]
+
+
+def _write(path, content: bytes) -> str:
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_hit_and_miss(tmp_path):
+    cache = DetectionCache(str(tmp_path / "cache"))
+    file_path = _write(tmp_path / "a.png", b"a")
+    key = cache.make_key(file_path, "sig")
+    assert cache.get(key) is None
+    cache.put(key, _payloads(1))
+    box, payload = cache.get(key)[0]
+    assert payload == "payload-1"
+    assert [box.lt, box.rt, box.rb, box.lb] == [[1, 0], [11, 0], [11, 10], [1, 10]]
+
+    # 其他实例(如其他进程)可读取同一缓存文件夹
+    assert DetectionCache(str(tmp_path / "cache")).get(key) is not None
+
+
+def test_key_changes_with_content_and_signature(tmp_path):
+    file_path = _write(tmp_path / "a.png", b"a")
+    key = DetectionCache.make_key(file_path, "sig")
+    assert DetectionCache.make_key(file_path, "sig2") != key
+    _write(tmp_path / "a.png", b"b")
+    assert DetectionCache.make_key(file_path, "sig") != key
+
+
+def test_signature_covers_detection_parameters():
+    plain = QrDetector().signature
+    tiled = QrDetector(tiled=True).signature
+    assert len({
+        plain, tiled, QrDetector(backend="classic").signature,
+        QrDetector(tiled=True, qr_px=120).signature, QrDetector(tiled=True, tile_cells=6).signature
+    }) == 5
+    # 不分块时分块参数不影响检测结果
+    assert QrDetector(qr_px=120, tile_cells=6).signature == plain
+
+
+def test_evicts_least_recently_used_to_limit(tmp_path):
+    # 各条目内容长度相同，先写入一条获得其大小
+    cache = DetectionCache(str(tmp_path / "cache"), max_bytes=1 << 30)
+    cache.put("probe", _payloads(0))
+    with cache._connect() as conn:
+        value_size = conn.execute("SELECT size FROM entries").fetchone()[0]
+    cache.clear()
+
+    cache = DetectionCache(str(tmp_path / "cache"), max_bytes=5 * value_size)
+    for i in range(5):
+        cache.put("k{}".format(i), _payloads(i))
+        time.sleep(0.01)
+    # 访问k0使其成为最近使用，写入第6条时应淘汰k1
+    assert cache.get("k0") is not None
+    time.sleep(0.01)
+    cache.put("k5", _payloads(5))
+
+    assert cache.get("k0") is not None and cache.get("k5") is not None
+    assert cache.get("k1") is None
+    with cache._connect() as conn:
+        assert conn.execute("SELECT SUM(size) FROM entries").fetchone()[0] <= 5 * value_size
+
+
+def test_concurrent_writers(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    errors = []
+
+    def writer(worker: int):
+        try:
+            # 每个写入方使用独立实例，模拟多个进程共享同一缓存文件夹
+            cache = DetectionCache(cache_dir)
+            for i in range(50):
+                cache.put("w{}-{}".format(worker, i), _payloads(i))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    cache = DetectionCache(cache_dir)
+    assert all(cache.get("w{}-{}".format(worker, i)) is not None for worker in range(4) for i in range(50))
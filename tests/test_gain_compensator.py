@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+
+from CalibBoardStitcher import CalibBoardObj, CalibResult, MatchedPoint
+from CalibBoardStitcher.Stitcher import Stitcher, GainCompensator
+
+
+def _add_tile(calib_result: CalibResult, img_dir, img_id: str, img: np.ndarray, left: float, top: float):
+    # 子图与标定板等比例，左上角位于标定板的 (left, top)
+    h, w = img.shape[0:2]
+    cv2.imwrite(str(img_dir / img_id), img)
+    for x, y in ((0, 0), (w - 1, 0), (0, h - 1), (w - 1, h - 1)):
+        calib_result.add_matched_point(MatchedPoint(img_id, (left + x, top + y), (x, y)))
+    calib_result.set_img_size(img_id, (w, h))
+
+
+def test_tile_without_thumbnail_pixels_keeps_unit_gain(tmp_path):
+    board = CalibBoardObj(2, 2)
+    calib_result = CalibResult(board)
+    _add_tile(calib_result, tmp_path, "a.png", np.full((600, 600, 3), 100, dtype=np.uint8), 0, 0)
+    _add_tile(calib_result, tmp_path, "b.png", np.full((600, 600, 3), 140, dtype=np.uint8), 400, 400)
+    # 在缩略图中不足一个像素宽，腐蚀后没有有效像素
+    _add_tile(calib_result, tmp_path, "tiny.png", np.full((2, 2, 3), 200, dtype=np.uint8), 1000, 100)
+
+    luts = GainCompensator(Stitcher(board), thumb_size=256).estimate(calib_result, str(tmp_path))
+    assert np.array_equal(luts["tiny.png"].reshape(256, 3)[:, 0], np.arange(256))
+    # 其余子图仍向彼此的亮度靠拢
+    assert int(luts["a.png"][0, 100, 0]) > 100 and int(luts["b.png"][0, 140, 0]) < 140
+
+
+def test_lut_applied_to_warped_tile_only():
+    board = CalibBoardObj(2, 2)
+    stitcher = Stitcher(board)
+    partial = np.random.default_rng(0).integers(0, 256, (150, 200, 3), dtype=np.uint8)
+    points = [MatchedPoint("a", (x + 40, y + 30), (x, y)) for x, y in ((0, 0), (199, 0), (0, 149), (199, 149))]
+    lut = np.clip(np.arange(256)[:, None] * np.array([0.8, 1.0, 1.3]), 0, 255).astype(np.uint8).reshape(1, 256, 3)
+
+    def run(lut, max_patch_bytes=0):
+        base = np.zeros((300, 300, 3), dtype=np.uint8)
+        mask = np.zeros((300, 300), dtype=np.uint8)
+        return stitcher.stitch_full_cover(base, mask, partial, points, max_patch_bytes=max_patch_bytes, lut=lut)
+
+    plain, mask = run(None)
+    compensated, _ = run(lut)
+    covered = mask == 255
+    assert np.array_equal(compensated[covered], cv2.LUT(plain, lut)[covered])
+    assert not compensated[~covered].any()
+    # 分段仿射的结果与整体仿射一致
+    assert np.array_equal(run(lut, max_patch_bytes=200 * 5 * 16)[0], compensated)
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+import pytest
+
+from CalibBoardStitcher.Utils import ImageCache
+
+
+@pytest.mark.parametrize("ext", [".png", ".jpg"])
+@pytest.mark.parametrize("reduce", [2, 4, 8])
+def test_reduced_read_of_image_smaller_than_factor(tmp_path, ext, reduce):
+    file_path = str(tmp_path / ("tiny" + ext))
+    cv2.imwrite(file_path, np.full((2, 3, 3), 200, dtype=np.uint8))
+    img = ImageCache().read(file_path, reduce)
+    assert img is not None and img.shape[0] >= 1 and img.shape[1] >= 1
+
+
+def test_read_is_cached_and_read_only(tmp_path):
+    file_path = str(tmp_path / "img.png")
+    cv2.imwrite(file_path, np.zeros((16, 16, 3), dtype=np.uint8))
+    cache = ImageCache()
+    first = cache.read(file_path)
+    assert cache.read(file_path) is first
+    assert not first.flags.writeable
+    assert cache.stats["hits"] == 1
+
+
+def test_thumbnail_disk_cache_is_bounded(tmp_path):
+    thumb_dir = tmp_path / "thumbs"
+    rng = np.random.default_rng(0)
+    file_paths = []
+    for i in range(10):
+        file_path = str(tmp_path / "img{}.png".format(i))
+        cv2.imwrite(file_path, rng.integers(0, 256, (64, 64, 3), dtype=np.uint8))
+        file_paths.append(file_path)
+
+    cache = ImageCache(max_bytes=0, thumb_dir=str(thumb_dir))
+    cache.read(file_paths[0], 2)
+    entry_bytes = sum(f.stat().st_size for f in thumb_dir.iterdir())
+    cache = ImageCache(max_bytes=0, thumb_dir=str(thumb_dir), max_disk_bytes=3 * entry_bytes)
+    for file_path in file_paths:
+        cache.read(file_path, 2)
+    names = [f.name for f in thumb_dir.iterdir()]
+    assert not any(name.endswith(".tmp.png") for name in names)
+    assert 0 < sum(f.stat().st_size for f in thumb_dir.iterdir()) <= 3 * entry_bytes
+    # 最近写入的缩略图保留在磁盘中
+    assert ImageCache.make_key(file_paths[-1], 2) + ".png" in names
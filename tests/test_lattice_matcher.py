@@ -0,0 +1,40 @@
+import inspect
+
+import numpy as np
+
+from CalibBoardStitcher import CalibBoardObj
+from CalibBoardStitcher.CalibResult import CalibResult, MatchedPoint
+from CalibBoardStitcher.Stitcher import calibration
+from CalibBoardStitcher.Stitcher.LatticeMatcher import LatticeMatcher
+
+
+def _calib_result(img_offsets: dict) -> CalibResult:
+    calib_result = CalibResult(CalibBoardObj(3, 4))
+    for img_id, offset in img_offsets.items():
+        for cb_point in [(0, 0), (100, 0), (0, 100)]:
+            img_point = (cb_point[0] + offset, cb_point[1])
+            calib_result.add_matched_point(MatchedPoint(img_id, cb_point, img_point))
+    return calib_result
+
+
+def test_predict_interpolates_between_neighbors():
+    calib_result = _calib_result({"a": 0, "d": 30})
+    m = LatticeMatcher.predict_from_sequence(calib_result, ["a", "b", "c", "d"], "b")
+    np.testing.assert_allclose(m, [[1, 0, 10], [0, 1, 0]], atol=1e-6)
+
+
+def test_predict_fits_each_image_once(monkeypatch):
+    img_ids = ["a"] + ["n{}".format(i) for i in range(20)] + ["z"]
+    calib_result = _calib_result({"a": 0, "z": 210})
+    calls = []
+    fit = LatticeMatcher.fit_board_to_img
+    monkeypatch.setattr(LatticeMatcher, "fit_board_to_img", staticmethod(lambda points: calls.append(1) or fit(points)))
+
+    fits = {}
+    for img_id in img_ids[1:-1]:
+        LatticeMatcher.predict_from_sequence(calib_result, img_ids, img_id, fits)
+    assert len(calls) == len(img_ids)
+
+
+def test_lattice_fallback_is_opt_in():
+    assert inspect.signature(calibration).parameters["lattice_fallback"].default is False
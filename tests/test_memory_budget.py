@@ -0,0 +1,65 @@
+import threading
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher import CalibBoardObj, CalibResult, MatchedPoint
+from CalibBoardStitcher.Stitcher import Stitcher, stitch_calib_result
+from CalibBoardStitcher.Utils import MemoryBudget
+
+
+def _run_with_timeout(target, timeout: float = 30.0):
+    result = {}
+
+    def run():
+        result["value"] = target()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "blocked for more than {} s".format(timeout)
+    return result.get("value")
+
+
+def test_oversized_request_passes_when_only_long_lived_remains():
+    budget = MemoryBudget(1000)
+    budget.acquire(800, long_lived=True)
+    _run_with_timeout(lambda: budget.acquire(5000), timeout=5.0)
+    assert budget.used == 5800
+    budget.release(5000)
+    budget.release(800, long_lived=True)
+    assert budget.used == 0
+
+
+def test_oversized_request_waits_for_short_lived():
+    budget = MemoryBudget(1000)
+    budget.acquire(600)
+    acquired = threading.Event()
+
+    def acquire():
+        budget.acquire(5000)
+        acquired.set()
+
+    threading.Thread(target=acquire, daemon=True).start()
+    assert not acquired.wait(0.2)
+    budget.release(600)
+    assert acquired.wait(5.0)
+
+
+def test_stitch_with_tile_larger_than_remaining_budget(tmp_path):
+    # 一张覆盖整个标定板的子图，其工作内存超出大图之外的剩余预算
+    board = CalibBoardObj(2, 2)
+    board_h, board_w = board.img_size
+    img = np.random.default_rng(0).integers(0, 255, (board_h, board_w, 3), dtype=np.uint8)
+    cv2.imwrite(str(tmp_path / "tile.png"), img)
+
+    calib_result = CalibResult(board)
+    for x, y in ((0, 0), (board_w - 1, 0), (0, board_h - 1), (board_w - 1, board_h - 1)):
+        calib_result.add_matched_point(MatchedPoint("tile.png", (x, y), (x, y)))
+    calib_result.set_img_size("tile.png", (board_w, board_h))
+
+    canvas_bytes = board_h * board_w * 4
+    base_img = _run_with_timeout(lambda: stitch_calib_result(
+        Stitcher(board), calib_result, str(tmp_path), memory_budget=2 * canvas_bytes + 1000
+    ))
+    assert np.abs(base_img.astype(int) - img).mean() < 1.0
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+import pytest
+
+from CalibBoardStitcher import QrPayload
+from CalibBoardStitcher.Detector import QrDetector, QrBackend
+from CalibBoardStitcher.Elements import Box
+
+from conftest import warp_tile, project
+
+
+def _box(vertex: np.ndarray) -> Box:
+    lt, rt, lb, rb = vertex.tolist()
+    return Box(lt, rt, rb, lb)
+
+
+def test_refine_interior_code(small_board):
+    board, board_img = small_board
+    m = np.float64([[0.8, 0, -0.8 * 550], [0, 0.8, -0.8 * 550]])
+    tile = warp_tile(board_img, m, (480, 480))
+    truth = project(board, 1, 1, m)
+    # 不同后端的原始顶点不同，校正后应一致
+    content = QrPayload.encode(1, 1, board)
+    refined = [
+        np.array(QrDetector.refine_payloads(tile, [(_box(truth + noise), content)])[0][0].vertex)
+        for noise in ([[0.7, -0.6], [-0.5, 0.8], [0.6, 0.5], [-0.7, -0.4]], [[-0.8, 0.4], [0.6, -0.7], [-0.4, -0.6], [0.9, 0.8]])
+    ]
+    assert np.abs(refined[0] - refined[1]).max() < 0.01
+    # 角点位于像素边缘，与像素中心坐标相差不足一个像素
+    assert np.abs(refined[0] - truth).max() < 0.6
+
+
+@pytest.mark.parametrize("gap", [0.5, 1.5, 3.0])
+def test_refine_keeps_raw_box_near_border(small_board, gap):
+    # 右上顶点距子图右边缘不足一个搜索窗口，边缘填充会使亚像素角点偏向边缘
+    board, board_img = small_board
+    m = np.float64([[0.8, 0, -0.8 * 550], [0, 0.8, -0.8 * 550]])
+    truth = project(board, 1, 1, m)
+    tile = warp_tile(board_img, m, (int(truth[1, 0] + gap), 480))
+    noisy = truth + [[0.3, 0.2], [0.2, -0.3], [-0.2, 0.3], [0.3, 0.3]]
+    (box, _), = QrDetector.refine_payloads(tile, [(_box(noisy), QrPayload.encode(1, 1, board))])
+    assert np.array_equal(np.array(box.vertex), noisy)
+
+
+@pytest.mark.parametrize("cut", [6, 9])
+def test_auto_recall_matches_wechat_on_cut_codes(small_board, cut):
+    # 子图包含完整的(1,1)，右边缘截去(1,3)右侧cut像素(标定板像素)，CNN检测器仍可解码
+    board, board_img = small_board
+    right = board.calc_qr_box(1, 3).rt[0] - cut
+    m = np.float64([[0.8, 0, -0.8 * 550], [0, 0.8, -0.8 * 550]])
+    tile = warp_tile(board_img, m, (round((right - 550) * 0.8), 440))
+    wechat = {content for _, content in QrDetector(backend=QrBackend.WECHAT).detect_payloads(tile)}
+    auto = {content for _, content in QrDetector(backend=QrBackend.AUTO).detect_payloads(tile)}
+    assert len(wechat) == 2
+    assert auto == wechat
+
+
+@pytest.mark.parametrize("foreign", ["12345", "{\"a\": 1}", "[1, 2]"])
+def test_auto_ignores_foreign_codes(small_board, foreign):
+    board, board_img = small_board
+    m = np.float64([[0.8, 0, -0.8 * 550], [0, 0.8, -0.8 * 550]])
+    tile = warp_tile(board_img, m, (480, 700))
+    code = cv2.QRCodeEncoder.create().encode(foreign)
+    code = cv2.resize(code, None, fx=8, fy=8, interpolation=cv2.INTER_NEAREST)
+    code = cv2.copyMakeBorder(code, 16, 16, 16, 16, cv2.BORDER_CONSTANT, value=255)
+    tile[700 - code.shape[0]:, 0:code.shape[1]] = cv2.cvtColor(code, cv2.COLOR_GRAY2BGR)
+    contents = {content for _, content in QrBackend.create(QrBackend.AUTO).detect(tile)}
+    assert contents == {foreign, QrPayload.encode(1, 1, board)}
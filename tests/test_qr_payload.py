@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from CalibBoardStitcher.Elements import CalibBoardObj, QrPayload
+
+
+@pytest.mark.parametrize("payload", [
+    "12345",
+    "[1, 2, 3]",
+    "\"rid\"",
+    "{\"a\": 1}",
+    "{\"rid\": 0, \"cid\": 0, \"rc\": 2}",
+    "{\"rid\": \"0\", \"cid\": 0, \"rc\": 2, \"cc\": 2}",
+    "{\"rid\": 0, \"cid\": 0, \"rc\": 2, \"cc\": 2, \"px_size\": null}",
+    "{\"rid\": 5, \"cid\": 0, \"rc\": 2, \"cc\": 2}",
+    "https://example.com",
+    ""
+])
+def test_decode_foreign_payload_raises_value_error(payload):
+    with pytest.raises(ValueError):
+        QrPayload.decode(payload)
+
+
+@pytest.mark.parametrize("payload_format", [QrPayload.JSON, QrPayload.COMPACT])
+def test_decode_round_trip(payload_format):
+    board = CalibBoardObj(4, 6, payload_format=payload_format)
+    data = QrPayload.decode(QrPayload.encode(3, 5, board))
+    assert (data["rid"], data["cid"], data["rc"], data["cc"]) == (3, 5, 4, 6)
+    assert data["format"] == payload_format
+
+
+def test_decode_legacy_json_defaults():
+    data = QrPayload.decode(json.dumps({"rid": 1, "cid": 0, "rc": 2, "cc": 2}))
+    assert data["px_size"] == 10 and data["qr_border"] == 3
@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+import pytest
+
+from CalibBoardStitcher import CalibBoardObj, CalibResult, MatchedPoint
+from CalibBoardStitcher.CalibResult import QualityReport
+from CalibBoardStitcher.Stitcher import QualityGate
+
+
+def _add_tile(calib_result: CalibResult, img_id: str, scale: float = 0.5, rotation: float = 0.0,
+    corrupt: int = None, count: int = 9
+):
+    # 3x3个匹配点，子图坐标由标定板坐标按给定缩放与旋转(度)变换后加小幅噪声得到
+    rng = np.random.default_rng(len(calib_result.get_matched_img_id()))
+    c, s = math.cos(math.radians(rotation)) * scale, math.sin(math.radians(rotation)) * scale
+    cb_points = [(x, y) for y in (100, 400, 700) for x in (100, 400, 700)][:count]
+    for i, (x, y) in enumerate(cb_points):
+        img_point = np.array([c * x - s * y + 50, s * x + c * y + 50]) + rng.normal(0, 0.2, 2)
+        if i == corrupt:
+            img_point += 40
+        calib_result.add_matched_point(MatchedPoint(img_id, (x, y), img_point.tolist()))
+
+
+@pytest.fixture
+def calib_result() -> CalibResult:
+    calib_result = CalibResult(CalibBoardObj(2, 2))
+    for i in range(5):
+        _add_tile(calib_result, "clean{}".format(i))
+    return calib_result
+
+
+def test_clean_calibration_has_no_flags(calib_result):
+    report = QualityReport(calib_result)
+    assert np.all(report.rms < 1.0)
+    assert np.allclose(report.scale, 0.5, atol=0.01)
+    assert QualityGate().check(report) == {}
+
+
+def test_scaled_or_corrupted_tile_is_flagged(calib_result):
+    _add_tile(calib_result, "scaled", scale=0.6)
+    _add_tile(calib_result, "rotated", rotation=10)
+    _add_tile(calib_result, "corrupted", corrupt=4)
+    failed = QualityGate().check(QualityReport(calib_result))
+    assert set(failed) == {"scaled", "rotated", "corrupted"}
+    assert failed["scaled"] == ["scale_dev"]
+    assert failed["rotated"] == ["rotation_dev"]
+    assert "rms" in failed["corrupted"]
+
+
+def test_unfittable_tile_fails_every_check(calib_result):
+    _add_tile(calib_result, "two_points", count=2)
+    report = QualityReport(calib_result)
+    assert report.to_dict()["two_points"]["scale"] is None
+    failed = QualityGate().check(report)
+    assert failed == {"two_points": ["rms", "inlier_ratio", "scale_dev", "rotation_dev"]}
+
+
+def test_modes_change_order_or_set(calib_result):
+    _add_tile(calib_result, "bad", scale=0.7)
+    img_ids = ["clean0", "clean1", "bad", "clean2"]
+    # DEMOTE: 不合格子图移至覆盖优先级最低，其余保持原顺序
+    assert QualityGate(QualityGate.DEMOTE).apply(calib_result, img_ids) == ["bad", "clean0", "clean1", "clean2"]
+    assert QualityGate(QualityGate.SKIP).apply(calib_result, img_ids) == ["clean0", "clean1", "clean2"]
+    assert QualityGate.create(QualityGate.OFF) is None
+    with pytest.raises(ValueError):
+        QualityGate("drop")
@@ -0,0 +1,19 @@
+import os
+
+import numpy as np
+
+from CalibBoardStitcher.Lens import LensModel, RemapCache
+
+
+def test_disk_cache_is_bounded(tmp_path):
+    lens_model = LensModel([[1000, 0, 200], [0, 1000, 150], [0, 0, 1]], [0.1, 0, 0, 0, 0], (400, 300))
+    entry_bytes = 400 * 300 * 6
+    cache = RemapCache(str(tmp_path), max_bytes=3 * entry_bytes)
+    for i in range(10):
+        cache.get_maps(lens_model, np.float64([[1, 0, i], [0, 1, 0]]), (400, 300))
+    total = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    assert 0 < total <= 3 * entry_bytes
+
+    # 最近写入的网格保留在磁盘中，新的缓存实例可直接读取
+    maps = RemapCache(str(tmp_path)).get_maps(lens_model, np.float64([[1, 0, 9], [0, 1, 0]]), (400, 300))
+    assert maps[0].shape == (300, 400, 2)
@@ -0,0 +1,47 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher import CalibResult, MatchedPoint
+from CalibBoardStitcher.Stitcher import ShardedStitch, stitch
+from CalibBoardStitcher.__main__ import _shard_work
+
+
+def test_two_workers_match_plain_stitch(tmp_path, small_board):
+    board, board_img = small_board
+    board_h, board_w = board.img_size
+    img_dir = tmp_path / "imgs"
+    img_dir.mkdir()
+
+    # 2x3个相互重叠的800x800子图，直接截取标定板图像，匹配点为子图四角
+    calib_result = CalibResult(board)
+    for top in (0, board_h - 800):
+        for left in (0, (board_w - 800) // 2, board_w - 800):
+            img_id = "{}_{}.png".format(left, top)
+            cv2.imwrite(str(img_dir / img_id), board_img[top:top + 800, left:left + 800])
+            for x, y in ((0, 0), (799, 0), (0, 799), (799, 799)):
+                calib_result.add_matched_point(MatchedPoint(img_id, (left + x, top + y), (x, y)))
+            calib_result.set_img_size(img_id, (800, 800))
+    json_file = str(tmp_path / "calib.json")
+    calib_result.save(json_file)
+
+    sharded = ShardedStitch(str(tmp_path / "shards"))
+    plan = sharded.plan(str(img_dir), json_file, scale=0.5, shard_size=300)
+    assert len(plan["shards"]) == 12
+
+    # 两个独立进程同时认领分片，分段上限远小于子图，使跨分片的子图按行分段仿射
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(_shard_work, str(tmp_path / "shards"), "w{}".format(i), 600.0, 64 * 1024) for i in range(2)]
+        assert sum(future.result() for future in futures) == 12
+    assert sharded.pending() == []
+
+    sharded_img = str(tmp_path / "sharded.png")
+    index = sharded.assemble(sharded_img)
+    assert index["size"] == plan["size"] and len(index["tiles"]) == 12
+
+    plain_img = str(tmp_path / "plain.png")
+    stitch(str(img_dir), json_file, plain_img, scale=0.5)
+    expected = cv2.imread(plain_img)
+    assert np.array_equal(cv2.imread(sharded_img), expected)
+    assert expected.any()
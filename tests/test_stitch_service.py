@@ -0,0 +1,63 @@
+import asyncio
+import http.client
+import threading
+
+import pytest
+
+from CalibBoardStitcher.Service import StitchService, ServiceClient
+
+
+@pytest.fixture(scope="module")
+def service():
+    service = StitchService(port=0, max_workers=1)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    async def run():
+        await service.start()
+        started.set()
+        await service._stopped.wait()
+        await service.stop()
+
+    thread = threading.Thread(target=loop.run_until_complete, args=(run(),), daemon=True)
+    thread.start()
+    assert started.wait(30)
+    yield service
+    ServiceClient(port=service.port, timeout=30).shutdown()
+    thread.join(30)
+
+
+def _request(service, method: str, path: str, body: bytes = None, headers: dict = None) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", service.port, timeout=30)
+    conn.request(method, path, body=body, headers=headers or {})
+    status = conn.getresponse().status
+    conn.close()
+    return status
+
+
+def test_client_requests_allowed(service):
+    assert ServiceClient(port=service.port, timeout=30).health()["status"] == "ok"
+
+
+@pytest.mark.parametrize("headers", [
+    {"Host": "evil.example:8765"},
+    {"Host": "127.0.0.1.evil.example"},
+    {"Origin": "https://evil.example"},
+    {"Origin": "null"}
+])
+def test_foreign_host_or_origin_rejected(service, headers):
+    assert _request(service, "GET", "/health", headers=headers) == 403
+
+
+@pytest.mark.parametrize("content_type", [None, "text/plain", "application/x-www-form-urlencoded"])
+def test_post_without_json_content_type_rejected(service, content_type):
+    headers = {} if content_type is None else {"Content-Type": content_type}
+    body = b'{"type": "render", "img_dir": "/nonexistent", "json_file": "/nonexistent.json"}'
+    assert _request(service, "POST", "/jobs", body, headers) == 415
+    assert _request(service, "POST", "/shutdown", b"", headers) == 415
+    assert ServiceClient(port=service.port, timeout=30).jobs() == []
+
+
+def test_same_origin_page_allowed(service):
+    headers = {"Origin": "http://localhost:{}".format(service.port), "Content-Type": "application/json"}
+    assert _request(service, "POST", "/jobs", b'{"type": "bogus", "img_dir": "x"}', headers) == 400
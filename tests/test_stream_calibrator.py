@@ -0,0 +1,27 @@
+import asyncio
+
+import cv2
+import numpy as np
+
+from CalibBoardStitcher.Stream import StreamCalibrator, FileReplaySource
+from conftest import warp_tile
+
+
+def test_replay_processes_every_frame(tmp_path, small_board):
+    board, board_img = small_board
+    # 2x3个相互重叠的子图，每个子图包含2x2个格子，覆盖整个标定板
+    cell = board_img.shape[0] // board.row_count
+    count = 0
+    for row in range(board.row_count - 1):
+        for col in range(board.col_count - 1):
+            m = np.float64([[0.5, 0, -0.5 * col * cell], [0, 0.5, -0.5 * row * cell]])
+            cv2.imwrite(str(tmp_path / "{:02d}.png".format(count)), warp_tile(board_img, m, (cell, cell)))
+            count += 1
+
+    calibrator = StreamCalibrator(max_workers=2)
+    calib_result = asyncio.run(calibrator.run(FileReplaySource(str(tmp_path))))
+    assert calibrator.stats["received"] == count
+    assert calibrator.stats["processed"] == count
+    assert calibrator.stats["dropped"] == 0
+    assert len(calib_result.get_matched_img_id()) == count
+    assert calibrator.coverage > 0.95
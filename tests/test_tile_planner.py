@@ -0,0 +1,58 @@
+import pytest
+
+from CalibBoardStitcher import CalibBoardObj, CalibResult, MatchedPoint
+from CalibBoardStitcher.Stitcher import Stitcher, TilePlanner
+
+
+def _calib_result(tiles: dict) -> CalibResult:
+    # 子图与标定板等比例，tiles为 {img_id: (left, top, right, bottom)}，坐标为1100x1100的标定板图像坐标
+    calib_result = CalibResult(CalibBoardObj(2, 2))
+    for img_id, (left, top, right, bottom) in tiles.items():
+        w, h = right - left, bottom - top
+        for x, y in ((0, 0), (w, 0), (0, h), (w, h)):
+            calib_result.add_matched_point(MatchedPoint(img_id, (left + x, top + y), (x, y)))
+        calib_result.set_img_size(img_id, (w, h))
+    return calib_result
+
+
+def _planner(strategy: str) -> TilePlanner:
+    return TilePlanner(Stitcher(CalibBoardObj(2, 2)), plan_size=256, strategy=strategy)
+
+
+def test_priority_skips_tiles_hidden_by_later_tiles():
+    calib_result = _calib_result({
+        "a": (0, 0, 600, 1100),
+        "b": (700, 100, 900, 300),   # 完全位于c内，被c覆盖
+        "c": (500, 0, 1100, 800),    # 覆盖优先级最高，部分覆盖a
+    })
+    plan = _planner(TilePlanner.PRIORITY).plan(calib_result)
+    assert plan.img_ids == ["a", "c"]
+    assert plan.skipped_img_ids == ["b"]
+
+    # 右下角 (600..1100, 800..1100) 未被任何子图覆盖
+    boxes = plan.uncovered_boxes
+    assert len(boxes) == 1
+    assert boxes[0].left == pytest.approx(600, abs=10) and boxes[0].top == pytest.approx(800, abs=10)
+    assert boxes[0].right == pytest.approx(1100, abs=10) and boxes[0].bottom == pytest.approx(1100, abs=10)
+    assert plan.coverage == pytest.approx(1 - 500 * 300 / 1100 ** 2, abs=0.02)
+
+
+def test_greedy_skips_tiles_covered_by_the_union_of_others():
+    calib_result = _calib_result({
+        "left": (0, 0, 600, 1100),
+        "middle": (400, 0, 800, 1100),   # 被左右两图的并集覆盖，但不被其中任何一张单独覆盖
+        "right": (500, 0, 1100, 1100),
+    })
+    priority = _planner(TilePlanner.PRIORITY).plan(calib_result)
+    assert priority.img_ids == ["left", "middle", "right"]
+
+    greedy = _planner(TilePlanner.GREEDY).plan(calib_result)
+    # 结果保持原覆盖优先级顺序
+    assert greedy.img_ids == ["left", "right"]
+    assert greedy.skipped_img_ids == ["middle"]
+    assert greedy.uncovered_boxes == [] and greedy.coverage == 1.0
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        _planner("random")
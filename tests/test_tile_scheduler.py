@@ -0,0 +1,54 @@
+import numpy as np
+
+from CalibBoardStitcher import CalibBoardObj, CalibResult, MatchedPoint
+from CalibBoardStitcher.Stitcher import Stitcher, TileScheduler
+
+
+def test_schedule_keeps_overwrite_priority_of_overlapping_tiles():
+    board = CalibBoardObj(2, 2)
+    stitcher = Stitcher(board)
+    calib_result = CalibResult(board)
+    rng = np.random.default_rng(0)
+
+    # 4x4个300x300的子图，步长250，相邻子图相互重叠；插入顺序打乱，与Hilbert曲线顺序无关
+    tiles = {}
+    positions = [(x, y) for y in range(0, 1000, 250) for x in range(0, 1000, 250)]
+    for index in rng.permutation(len(positions)):
+        x, y = positions[index]
+        img_id = "{}_{}.png".format(x, y)
+        for px, py in ((0, 0), (299, 0), (0, 299), (299, 299)):
+            calib_result.add_matched_point(MatchedPoint(img_id, (x + px, y + py), (px, py)))
+        calib_result.set_img_size(img_id, (300, 300))
+        tiles[img_id] = ((x, y), rng.integers(0, 256, (300, 300, 3), dtype=np.uint8))
+    img_ids = list(tiles.keys())
+
+    order = TileScheduler(stitcher).schedule(calib_result, img_ids)
+    assert sorted(order) == sorted(img_ids)
+    assert order != img_ids
+
+    # 区域重叠的子图，覆盖优先级低的(插入顺序靠前的)仍先拼接
+    position = {img_id: i for i, img_id in enumerate(order)}
+    for i, a in enumerate(img_ids):
+        for b in img_ids[i + 1:]:
+            (ax, ay), _ = tiles[a]
+            (bx, by), _ = tiles[b]
+            if abs(ax - bx) < 300 and abs(ay - by) < 300:
+                assert position[a] < position[b], (a, b)
+
+    # 拼接结果与按插入顺序拼接完全一致
+    def stitch(ids):
+        base = np.zeros((1100, 1100, 3), dtype=np.uint8)
+        mask = np.zeros((1100, 1100), dtype=np.uint8)
+        for img_id in ids:
+            base, mask = stitcher.stitch_full_cover(base, mask, tiles[img_id][1], calib_result.get_matched_points(img_id))
+        return base
+
+    assert np.array_equal(stitch(order), stitch(img_ids))
+
+
+def test_hilbert_index_visits_neighbors():
+    # 2阶曲线依次经过的单元相邻
+    cells = sorted((TileScheduler.hilbert_index(x, y, 2), (x, y)) for x in range(4) for y in range(4))
+    assert [index for index, _ in cells] == list(range(16))
+    for (_, (x0, y0)), (_, (x1, y1)) in zip(cells, cells[1:]):
+        assert abs(x0 - x1) + abs(y0 - y1) == 1